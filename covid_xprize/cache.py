@@ -0,0 +1,98 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Files covid_xprize keeps between runs, outside of the source tree: where they are, how they are keyed,
+# and how DataFrames are saved to and loaded from them.
+# Entries are keyed by digests of what they are computed from, so a stale entry is never found, and are written
+# under a temporary name then renamed, so that a crash or a concurrent run never leaves a partial entry.
+#
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+# Column holding the index of the saved DataFrames, which Feather files can't store
+INDEX_COLUMN = '__index__'
+
+
+def user_cache_dir(name: str, env_var: str = None) -> str:
+    """
+    Returns the directory of the files of a kind covid_xprize keeps between runs: the value of env_var if it is set,
+    e.g. to a location shared by several machines, name in the user cache directory otherwise
+    ($XDG_CACHE_HOME/covid_xprize or ~/.cache/covid_xprize).
+    :param name: the kind of files, e.g. 'snapshots'
+    :param env_var: the environment variable that overrides the directory
+    :return: the path of the directory, which may not exist yet
+    """
+    if env_var is not None and os.environ.get(env_var):
+        return os.environ[env_var]
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'covid_xprize', name)
+
+
+def file_checksum(path: str) -> str:
+    """
+    Returns the sha256 hex digest of the contents of a file.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def digest(*items, length: int = 32) -> str:
+    """
+    Returns a hex digest of items, which are JSON serializable values: dicts, lists, strings, numbers...
+    Dicts are digested independently of the order of their keys, and numpy scalars as the Python numbers
+    they are equal to.
+    :param items: the values to digest, e.g. the version of a cache and the settings and data its entries depend on
+    :param length: the number of hex digits to return
+    :return: a hex string
+    """
+    items = json.dumps(items, sort_keys=True, default=lambda value: value.item())
+    return hashlib.sha256(items.encode()).hexdigest()[:length]
+
+
+def load_frame(path: str):
+    """
+    Returns the DataFrame saved by save_frame to path, or None if there is none.
+    :param path: the path of the entry, without extension
+    :return: a Pandas DataFrame or None
+    """
+    try:
+        if os.path.exists(path + '.feather'):
+            df = pd.read_feather(path + '.feather')
+            if INDEX_COLUMN in df.columns:
+                df = df.set_index(INDEX_COLUMN).rename_axis(None)
+            return df
+        if os.path.exists(path + '.pkl'):
+            return pd.read_pickle(path + '.pkl')
+    except FileNotFoundError:
+        # Removed by a concurrent run since the check
+        pass
+    return None
+
+
+def save_frame(df: pd.DataFrame, path: str) -> str:
+    """
+    Saves df to path, as a Feather file if pyarrow is installed, as a pickle otherwise.
+    :param df: the DataFrame to save. Its index is saved too, unless it is a default RangeIndex
+    :param path: the path of the entry, without extension. Its directory is created if needed
+    :return: the path of the saved file
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1:
+            df.reset_index(drop=True).to_feather(tmp_path)
+        else:
+            df.rename_axis(INDEX_COLUMN).reset_index().to_feather(tmp_path)
+        saved_path = path + '.feather'
+    except ImportError:
+        df.to_pickle(tmp_path)
+        saved_path = path + '.pkl'
+    os.replace(tmp_path, saved_path)
+    return saved_path
@@ -0,0 +1,89 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import numpy as np
+import pandas as pd
+
+
+class GeoSeriesStore(object):
+    """
+    Time series of every geo of a DataFrame, sorted once by (GeoID, Date) and kept in contiguous blocks.
+    Each geo owns the rows between two consecutive offsets, so the data of one geo is returned as a
+    view on these blocks instead of being filtered out of the whole DataFrame with df[df.GeoID == g].
+    Geos are kept in order of first appearance in the DataFrame, days are sorted by date within each geo.
+    """
+
+    def __init__(self, df: pd.DataFrame, geo_col: str = 'GeoID', date_col: str = 'Date'):
+        """
+        :param df: a Pandas DataFrame with one row per geo and date
+        :param geo_col: the column identifying the geo
+        :param date_col: the column containing the date
+        """
+        codes, geo_ids = pd.factorize(df[geo_col], sort=False)
+        # Stable sort: rows with the same geo and date keep their original order
+        self.positions = np.lexsort((df[date_col].values, codes))
+        self.df = df.iloc[self.positions]
+        self.geo_ids = np.asarray(geo_ids)
+        self.offsets = np.zeros(len(geo_ids) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(geo_ids)))
+        self.date_col = date_col
+        self._geo_indexes = {geo: i for i, geo in enumerate(self.geo_ids)}
+        self._blocks = {}
+
+    def __len__(self):
+        return len(self.geo_ids)
+
+    def __iter__(self):
+        return iter(self.geo_ids)
+
+    def __contains__(self, geo):
+        return geo in self._geo_indexes
+
+    def slice(self, geo) -> slice:
+        """
+        Returns the slice of the sorted rows belonging to geo.
+        """
+        i = self._geo_indexes[geo]
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def frame(self, geo) -> pd.DataFrame:
+        """
+        Returns the rows of geo, sorted by date, as a DataFrame.
+        """
+        return self.df.iloc[self.slice(geo)]
+
+    def block(self, columns) -> np.ndarray:
+        """
+        Returns the contiguous array holding columns for all the geos, in sorted order.
+        A single column name gives a 1D array, a list of columns a 2D array.
+        The array is built on first access and reused afterwards.
+        """
+        key = columns if isinstance(columns, str) else tuple(columns)
+        if key not in self._blocks:
+            self._blocks[key] = np.ascontiguousarray(self.df[columns].to_numpy())
+        return self._blocks[key]
+
+    def values(self, geo, columns) -> np.ndarray:
+        """
+        Returns a view on the values of columns for geo, sorted by date.
+        """
+        return self.block(columns)[self.slice(geo)]
+
+    def dates(self, geo) -> np.ndarray:
+        """
+        Returns the sorted dates of geo.
+        """
+        return self.values(geo, self.date_col)
+
+    def index(self, geo) -> np.ndarray:
+        """
+        Returns the labels of the rows of geo in the original DataFrame.
+        """
+        return self.df.index.values[self.slice(geo)]
+
+    def unsort(self, values: np.ndarray) -> np.ndarray:
+        """
+        Puts values computed on the sorted rows back in the row order of the original DataFrame.
+        """
+        original = np.empty_like(values)
+        original[self.positions] = values
+        return original
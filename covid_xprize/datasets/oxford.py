@@ -0,0 +1,160 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Compact loader for the Oxford data and the intervention plan files sharing its format.
+# Only the columns used by the predictors and the validation are parsed, with explicit dtypes:
+# names are categorical, NPIs are int8 codes with a missing values mask (pandas Int8) and cases are float32.
+#
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMNS = ['CountryName',
+              'CountryCode',
+              'RegionName',
+              'RegionCode',
+              'Date']
+
+NPI_COLUMNS = ['C1_School closing',
+               'C2_Workplace closing',
+               'C3_Cancel public events',
+               'C4_Restrictions on gatherings',
+               'C5_Close public transport',
+               'C6_Stay at home requirements',
+               'C7_Restrictions on internal movement',
+               'C8_International travel controls',
+               'H1_Public information campaigns',
+               'H2_Testing policy',
+               'H3_Contact tracing',
+               'H6_Facial Coverings']
+
+CASES_COLUMNS = ['ConfirmedCases',
+                 'ConfirmedDeaths']
+
+COLUMN_DTYPES = {**{name: 'category' for name in ['CountryName', 'CountryCode', 'RegionName', 'RegionCode']},
+                 **{npi: 'Int8' for npi in NPI_COLUMNS},
+                 **{cases: 'float32' for cases in CASES_COLUMNS}}
+
+DATE_FORMAT = '%Y%m%d'
+
+# Number of rows parsed at once by the filtered readers
+CHUNK_SIZE = 100000
+
+
+def _to_datetime(dates) -> pd.Series:
+    # The Oxford data uses YYYYMMDD dates, intervention plans and predictions use YYYY-MM-DD ones
+    if pd.api.types.is_integer_dtype(dates):
+        return pd.to_datetime(dates, format=DATE_FORMAT)
+    return pd.to_datetime(dates)
+
+
+def iter_csv_chunks(path, countries=None, start_date=None, end_date=None, chunk_size=CHUNK_SIZE, **read_csv_kwargs):
+    """
+    Reads a csv file with CountryName and Date columns, such as the Oxford data, an intervention plan or a predictions
+    file, chunk_size rows at a time, and yields the rows of each chunk in countries and between start_date and
+    end_date, included. Only the rows kept are held in memory, not the whole file.
+    :param path: the csv file to read
+    :param countries: the CountryName values to keep, None to keep all the countries
+    :param start_date: the first date to keep, as a string or a Timestamp, None to keep the dates before end_date
+    :param end_date: the last date to keep, as a string or a Timestamp, None to keep the dates after start_date
+    :param chunk_size: the number of rows parsed at once. None to read the file at once
+    :param read_csv_kwargs: passed to pd.read_csv
+    :return: a generator of Pandas DataFrames, indexed by their row numbers in the file, whose Date is datetime64
+    """
+    chunks = pd.read_csv(path, chunksize=chunk_size, **read_csv_kwargs)
+    for chunk in ([chunks] if chunk_size is None else chunks):
+        if countries is not None:
+            chunk = chunk[chunk['CountryName'].isin(countries)]
+        if 'Date' in chunk.columns:
+            chunk = chunk.assign(Date=_to_datetime(chunk['Date']))
+            if start_date is not None:
+                chunk = chunk[chunk['Date'] >= pd.to_datetime(start_date)]
+            if end_date is not None:
+                chunk = chunk[chunk['Date'] <= pd.to_datetime(end_date)]
+        yield chunk
+
+
+def read_csv_filtered(path, countries=None, start_date=None, end_date=None, chunk_size=CHUNK_SIZE,
+                      **read_csv_kwargs) -> pd.DataFrame:
+    """
+    Reads the rows of a csv file in countries and between start_date and end_date, included, chunk by chunk.
+    See iter_csv_chunks for the parameters.
+    :return: a Pandas DataFrame, indexed by the row numbers in the file
+    """
+    chunks = list(iter_csv_chunks(path, countries, start_date, end_date, chunk_size, **read_csv_kwargs))
+    if not chunks:
+        # No row at all
+        return next(iter_csv_chunks(path, chunk_size=None, nrows=0, **read_csv_kwargs))
+    return pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+
+
+def load_oxford_data(path, columns=None, error_bad_lines=False,
+                     countries=None, start_date=None, end_date=None) -> pd.DataFrame:
+    """
+    Loads the Oxford data, or an intervention plan file, keeping only the known columns.
+    If countries, start_date or end_date are given, the file is read chunk by chunk and only the rows in countries
+    and between start_date and end_date, included, are kept.
+    :param path: the csv file to load
+    :param columns: additional columns to keep, read with the default pandas dtypes
+    :param error_bad_lines: passed to pd.read_csv
+    :param countries: the CountryName values to keep, None to keep all the countries
+    :param start_date: the first date to keep, None to keep the dates before end_date
+    :param end_date: the last date to keep, None to keep the dates after start_date
+    :return: a Pandas DataFrame with the ID_COLUMNS, NPI_COLUMNS and CASES_COLUMNS present in the file, and columns
+    """
+    keep = set(ID_COLUMNS + NPI_COLUMNS + CASES_COLUMNS + list(columns or []))
+    filtered = countries is not None or start_date is not None or end_date is not None
+    df = read_csv_filtered(path, countries, start_date, end_date,
+                           chunk_size=CHUNK_SIZE if filtered else None,
+                           usecols=lambda column: column in keep,
+                           dtype=COLUMN_DTYPES,
+                           encoding="ISO-8859-1",
+                           error_bad_lines=error_bad_lines)
+    # Sorted categories, so that names group and sort as strings do. Chunks with different categories are
+    # concatenated as objects
+    for column in COLUMN_DTYPES:
+        if COLUMN_DTYPES[column] == 'category' and column in df.columns:
+            categories = sorted(df[column].dropna().unique())
+            df[column] = pd.Categorical(df[column], categories=categories)
+    return df
+
+
+def geo_id(df, separator='__', no_region='nan') -> pd.Categorical:
+    """
+    Returns the categorical GeoID of each row of df, CountryName + separator + RegionName.
+    The id is built once per country / region, not once per row, and works with both object and categorical names.
+    :param df: a DataFrame with CountryName and RegionName columns
+    :param separator: the separator between CountryName and RegionName
+    :param no_region: the RegionName of the rows without one. None to use CountryName alone as GeoID
+    :return: a pandas Categorical
+    """
+    if len(df) == 0:
+        return pd.Categorical([])
+    geos = pd.MultiIndex.from_arrays([df['CountryName'], df['RegionName']])
+    codes, unique_geos = geos.factorize()
+    geo_ids = []
+    for country, region in unique_geos:
+        if pd.isnull(region):
+            geo_ids.append(country if no_region is None else f"{country}{separator}{no_region}")
+        else:
+            geo_ids.append(f"{country}{separator}{region}")
+    # Sorted categories, so that GeoIDs sort as strings do
+    return pd.Categorical(np.array(geo_ids, dtype=object)[codes], categories=sorted(geo_ids))
+
+
+def fill_missing_npis(df, by='GeoID', npi_columns=NPI_COLUMNS) -> pd.DataFrame:
+    """
+    Fills missing NPIs by assuming they are the same as previous day, or 0 if none is available.
+    Int8 NPIs, which have no missing value anymore, are returned as plain numpy int8 columns.
+    :param df: a DataFrame with npi_columns
+    :param by: the column(s) identifying a geo
+    :param npi_columns: the NPIs to fill
+    :return: a DataFrame with the filled npi_columns, aligned on df
+    """
+    if len(df) == 0:
+        return df[npi_columns]
+    by = [by] if isinstance(by, str) else by
+    # Group on the codes of the geos, so that geos with missing key values are filled too
+    geo_codes, _ = pd.MultiIndex.from_arrays([df[column] for column in by]).factorize()
+    npis_df = df[npi_columns].groupby(geo_codes).ffill().fillna(0)
+    return npis_df.astype({npi: np.int8 for npi in npi_columns if isinstance(df[npi].dtype, pd.Int8Dtype)})
@@ -0,0 +1,100 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Population of each GeoID, from the population files of the countries, US states, UK nations and Brazil states.
+# The csv files are parsed once: the GeoID -> Population index built from them is saved in the user cache directory,
+# keyed by the checksums of the csv files, and kept in memory until they change. Doesn't depend on Keras or
+# Tensorflow, so that scoring can use it without importing the predictors.
+#
+
+import os
+
+import pandas as pd
+
+from covid_xprize.cache import user_cache_dir, file_checksum, digest, load_frame, save_frame
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+POPULATION_DATA_PATH = os.path.join(os.path.dirname(ROOT_DIR), 'examples', 'predictors', 'lstm', 'data')
+COUNTRIES_FILE = os.path.join(POPULATION_DATA_PATH, "Additional_Context_Data_Global.csv")
+US_STATES_FILE = os.path.join(POPULATION_DATA_PATH, "US_states_populations.csv")
+UK_FILE = os.path.join(POPULATION_DATA_PATH, "uk_populations.csv")
+BRAZIL_FILE = os.path.join(POPULATION_DATA_PATH, "brazil_populations.csv")
+POPULATION_FILES = (COUNTRIES_FILE, US_STATES_FILE, UK_FILE, BRAZIL_FILE)
+POPULATION_CACHE_DIR = user_cache_dir('population', 'COVID_XPRIZE_POPULATION_CACHE_DIR')
+# Version of load_population_df, part of the keys of the saved indexes
+INDEX_VERSION = 1
+US_PREFIX = "United States / "
+
+# Population indexes loaded in this process, keyed by the files they were built from with their size and
+# modification time
+_population_indexes = {}
+
+
+def load_population_df(files=POPULATION_FILES) -> pd.DataFrame:
+    """
+    Reads the population files.
+    Note: the countries file contains only countries population, not regions.
+    :param files: the countries, US states, UK and Brazil population files
+    :return: a Pandas DataFrame with GeoID and Population columns
+    """
+    countries_file, us_states_file, uk_file, brazil_file = files
+    countries_df = pd.read_csv(countries_file, usecols=['CountryName', 'Population'])
+    countries_df['GeoID'] = countries_df['CountryName']
+
+    us_states_df = pd.read_csv(us_states_file, usecols=['NAME', 'POPESTIMATE2019'])
+    us_states_df.rename(columns={'POPESTIMATE2019': 'Population'}, inplace=True)
+    # Prefix with country name to match the GeoIDs of the Oxford data
+    us_states_df['GeoID'] = US_PREFIX + us_states_df['NAME']
+
+    uk_df = pd.read_csv(uk_file, usecols=['GeoID', 'Population'])
+    brazil_df = pd.read_csv(brazil_file, usecols=['GeoID', 'Population'])
+
+    population_df = pd.concat([countries_df, us_states_df, uk_df, brazil_df], ignore_index=True)
+    return population_df[['GeoID', 'Population']]
+
+
+def _index_path(files, cache_dir) -> str:
+    key = digest(INDEX_VERSION, [file_checksum(path) for path in files])
+    return os.path.join(cache_dir, 'population-' + key)
+
+
+def population_index(files=POPULATION_FILES, cache_dir: str = POPULATION_CACHE_DIR) -> pd.Series:
+    """
+    Returns the population of each GeoID. Built from the population files the first time, then read from its saved
+    copy in cache_dir, and kept in memory until the files change.
+    :param files: the countries, US states, UK and Brazil population files
+    :param cache_dir: the directory of the saved indexes. None to always build the index from the files
+    :return: a Pandas Series of the Population, indexed by GeoID
+    """
+    stats = tuple((path, os.path.getsize(path), os.path.getmtime(path)) for path in files)
+    if stats in _population_indexes:
+        return _population_indexes[stats]
+
+    index_path = _index_path(files, cache_dir) if cache_dir is not None else None
+    population_df = load_frame(index_path) if index_path is not None else None
+    if population_df is None:
+        # GeoIDs are unique in the population files: keeps the first one if a file repeats a GeoID
+        population_df = load_population_df(files).drop_duplicates('GeoID').reset_index(drop=True)
+        if index_path is not None:
+            save_frame(population_df, index_path)
+    population = population_df.set_index('GeoID')['Population']
+
+    _population_indexes[stats] = population
+    return population
+
+
+def add_population_column(df: pd.DataFrame, files=POPULATION_FILES, cache_dir: str = POPULATION_CACHE_DIR):
+    """
+    Returns df with the Population of its GeoIDs, NaN for the GeoIDs without population data.
+    :param df: a Pandas DataFrame with a GeoID column
+    :param files: the countries, US states, UK and Brazil population files
+    :param cache_dir: the directory of the saved indexes
+    :return: df with a new index and a Population column, or Population_y if df already has a Population column,
+    as merging df with the population on GeoID would
+    """
+    column = 'Population_y' if 'Population' in df.columns else 'Population'
+    population = population_index(files, cache_dir)
+    df = df.reset_index(drop=True)
+    # Maps the GeoIDs as objects, so that categorical GeoIDs don't give a categorical Population
+    df[column] = df['GeoID'].astype(object).map(population)
+    return df
@@ -0,0 +1,156 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Local, dated and checksummed snapshots of the Oxford data.
+# The network is only used by download_snapshot: everything else reads the snapshots available locally,
+# so that predictions are reproducible and don't depend on GitHub being reachable.
+#
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import urllib.request
+
+import pandas as pd
+
+from covid_xprize.cache import user_cache_dir, file_checksum
+
+# See https://github.com/OxCGRT/covid-policy-tracker
+DATA_URL = "https://raw.githubusercontent.com/OxCGRT/covid-policy-tracker/master/data/OxCGRT_latest.csv"
+
+SNAPSHOTS_DIR = user_cache_dir('snapshots', 'COVID_XPRIZE_SNAPSHOTS_DIR')
+MANIFEST_FILE = 'manifest.json'
+SNAPSHOT_FILE_FORMAT = 'OxCGRT_{}.csv'
+DATE_FORMAT = '%Y-%m-%d'
+
+# Snapshot files whose checksum has already been verified, with their size and modification time
+_verified_files = {}
+
+
+def _date_str(date) -> str:
+    if date is None:
+        date = datetime.date.today()
+    return pd.to_datetime(date).strftime(DATE_FORMAT)
+
+
+def _read_manifest(snapshots_dir: str) -> dict:
+    manifest_path = os.path.join(snapshots_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest: dict, snapshots_dir: str) -> None:
+    manifest_path = os.path.join(snapshots_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def list_snapshots(snapshots_dir: str = SNAPSHOTS_DIR) -> list:
+    """
+    Returns the dates of the snapshots available locally, as YYYY-MM-DD strings, oldest first.
+    """
+    return sorted(_read_manifest(snapshots_dir))
+
+
+def add_snapshot(path: str, date=None, snapshots_dir: str = SNAPSHOTS_DIR, source: str = None) -> str:
+    """
+    Copies a local Oxford data file to the snapshots, for instance to provision a machine without network access.
+    :param path: the csv file to add
+    :param date: the date of the snapshot. Today by default
+    :param snapshots_dir: the directory containing the snapshots
+    :param source: where the file comes from, recorded in the manifest. path by default
+    :return: the path of the snapshot
+    """
+    date_str = _date_str(date)
+    os.makedirs(snapshots_dir, exist_ok=True)
+    snapshot_file = SNAPSHOT_FILE_FORMAT.format(date_str)
+    snapshot_path = os.path.join(snapshots_dir, snapshot_file)
+    if os.path.abspath(path) != os.path.abspath(snapshot_path):
+        shutil.copyfile(path, snapshot_path)
+    manifest = _read_manifest(snapshots_dir)
+    manifest[date_str] = {'file': snapshot_file,
+                          'sha256': file_checksum(snapshot_path),
+                          'source': source or os.path.abspath(path)}
+    _write_manifest(manifest, snapshots_dir)
+    return snapshot_path
+
+
+def download_snapshot(date=None, url: str = DATA_URL, snapshots_dir: str = SNAPSHOTS_DIR) -> str:
+    """
+    Downloads the latest Oxford data and stores it as a new snapshot. This is the only function using the network.
+    :param date: the date of the snapshot. Today by default
+    :param url: the url of the data
+    :param snapshots_dir: the directory containing the snapshots
+    :return: the path of the snapshot
+    """
+    os.makedirs(snapshots_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.csv', dir=snapshots_dir)
+    os.close(fd)
+    try:
+        urllib.request.urlretrieve(url, tmp_path)
+        return add_snapshot(tmp_path, date=date, snapshots_dir=snapshots_dir, source=url)
+    finally:
+        os.remove(tmp_path)
+
+
+def snapshot_path(date=None, snapshots_dir: str = SNAPSHOTS_DIR) -> str:
+    """
+    Returns the path of the most recent snapshot taken on or before date, after checking its checksum.
+    :param date: a date, as a string or a datetime. None for the most recent snapshot
+    :param snapshots_dir: the directory containing the snapshots
+    :return: the path of the snapshot csv file
+    """
+    manifest = _read_manifest(snapshots_dir)
+    dates = sorted(manifest)
+    if date is not None:
+        date_str = _date_str(date)
+        dates = [d for d in dates if d <= date_str]
+    if not dates:
+        raise FileNotFoundError(f"No snapshot of the Oxford data{'' if date is None else ' on or before ' + str(date)}"
+                                f" in {snapshots_dir}. Use download_snapshot() or add_snapshot() to create one")
+    entry = manifest[dates[-1]]
+    path = os.path.join(snapshots_dir, entry['file'])
+    stat = os.stat(path)
+    if _verified_files.get(path) != (stat.st_size, stat.st_mtime_ns, entry['sha256']):
+        if file_checksum(path) != entry['sha256']:
+            raise ValueError(f"Snapshot {path} does not match its checksum")
+        _verified_files[path] = (stat.st_size, stat.st_mtime_ns, entry['sha256'])
+    return path
+
+
+def load_snapshot(date=None, snapshots_dir: str = SNAPSHOTS_DIR, **read_csv_kwargs) -> pd.DataFrame:
+    """
+    Loads the most recent snapshot of the Oxford data taken on or before date.
+    :param date: a date, as a string or a datetime. None for the most recent snapshot
+    :param snapshots_dir: the directory containing the snapshots
+    :param read_csv_kwargs: options overriding the default pd.read_csv ones
+    :return: a Pandas DataFrame
+    """
+    kwargs = dict(parse_dates=['Date'],
+                  encoding="ISO-8859-1",
+                  dtype={"RegionName": str,
+                         "RegionCode": str},
+                  error_bad_lines=False)
+    kwargs.update(read_csv_kwargs)
+    return pd.read_csv(snapshot_path(date, snapshots_dir), **kwargs)
+
+
+def copy_snapshot(dest_path: str, date=None, snapshots_dir: str = SNAPSHOTS_DIR) -> str:
+    """
+    Copies the most recent snapshot taken on or before date to dest_path, for code reading the data from a file.
+    :param dest_path: the path to copy the snapshot to
+    :param date: a date, as a string or a datetime. None for the most recent snapshot
+    :param snapshots_dir: the directory containing the snapshots
+    :return: dest_path
+    """
+    dest_dir = os.path.dirname(dest_path)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+    shutil.copyfile(snapshot_path(date, snapshots_dir), dest_path)
+    return dest_path
@@ -0,0 +1,42 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid_xprize.datasets.geo_series_store import GeoSeriesStore
+
+
+class TestGeoSeriesStore(unittest.TestCase):
+
+    def setUp(self):
+        # Geos interleaved and dates not sorted within each geo
+        self.df = pd.DataFrame({"GeoID": ["Italy", "France", "Italy", "France", "Italy"],
+                                "Date": pd.to_datetime(["2020-01-02", "2020-01-01", "2020-01-01",
+                                                        "2020-01-02", "2020-01-03"]),
+                                "NewCases": [2., 10., 1., 20., 3.],
+                                "C1_School closing": [1., 0., 1., 0., 2.]},
+                               index=[10, 11, 12, 13, 14])
+        self.store = GeoSeriesStore(self.df)
+
+    def test_geos_in_order_of_appearance(self):
+        self.assertEqual(["Italy", "France"], list(self.store))
+        self.assertTrue("France" in self.store)
+        self.assertFalse("Spain" in self.store)
+
+    def test_geo_values_sorted_by_date(self):
+        np.testing.assert_array_equal([1., 2., 3.], self.store.values("Italy", "NewCases"))
+        np.testing.assert_array_equal([[10., 0.], [20., 0.]],
+                                      self.store.values("France", ["NewCases", "C1_School closing"]))
+        np.testing.assert_array_equal([12, 10, 14], self.store.index("Italy"))
+        self.assertEqual(list(pd.to_datetime(["2020-01-01", "2020-01-02"])),
+                         list(self.store.frame("France").Date))
+
+    def test_values_are_views(self):
+        block = self.store.block(["NewCases", "C1_School closing"])
+        self.assertTrue(np.shares_memory(block, self.store.values("Italy", ["NewCases", "C1_School closing"])))
+
+    def test_unsort(self):
+        sorted_cases = self.store.block("NewCases")
+        np.testing.assert_array_equal(self.df.NewCases.values, self.store.unsort(sorted_cases))
@@ -0,0 +1,66 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import io
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid_xprize.datasets.oxford import NPI_COLUMNS, load_oxford_data, read_csv_filtered, geo_id, fill_missing_npis
+
+NPIS_HEADER = ",".join(NPI_COLUMNS)
+
+
+def make_csv(date_format, extra_rows=()):
+    lines = [f"CountryName,CountryCode,RegionName,RegionCode,Jurisdiction,Date,{NPIS_HEADER},ConfirmedCases"]
+    rows = [("Italy", "", 1, "", ""), ("Italy", "", 2, "2", "10"),
+            ("Italy", "Lazio", 1, "1", "3"), ("Italy", "Lazio", 2, "", "4")] + list(extra_rows)
+    for country, region, day, npi, cases in rows:
+        date = pd.Timestamp(2020, 1, day).strftime(date_format)
+        npis = ",".join([npi] * len(NPI_COLUMNS))
+        lines.append(f"{country},{country[:3].upper()},{region},,NAT_TOTAL,{date},{npis},{cases}")
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+class TestOxford(unittest.TestCase):
+
+    def test_load_oxford_data(self):
+        for date_format in ["%Y%m%d", "%Y-%m-%d"]:
+            df = load_oxford_data(make_csv(date_format))
+            # Unused columns are not loaded
+            self.assertNotIn("Jurisdiction", df.columns)
+            self.assertEqual("category", df.CountryName.dtype)
+            self.assertEqual(pd.Int8Dtype(), df[NPI_COLUMNS[0]].dtype)
+            self.assertEqual(np.float32, df.ConfirmedCases.dtype)
+            self.assertEqual(list(pd.to_datetime(["2020-01-01", "2020-01-02"] * 2)), list(df.Date))
+            self.assertTrue(df[NPI_COLUMNS[0]].isnull()[0])
+
+    def test_filtered_loading(self):
+        extra_rows = [("Spain", "", day, "1", "5") for day in range(1, 4)] + [("Italy", "", 3, "1", "12")]
+        df = load_oxford_data(make_csv("%Y%m%d", extra_rows), countries=["Spain"], end_date="2020-01-02")
+        self.assertEqual(["Spain", "Spain"], list(df.CountryName))
+        self.assertEqual(["Spain"], list(df.CountryName.cat.categories))
+        self.assertEqual(list(pd.to_datetime(["2020-01-01", "2020-01-02"])), list(df.Date))
+        # Same rows, with the same row numbers, whatever the size of the chunks
+        for chunk_size in [1, 3, None]:
+            chunked_df = read_csv_filtered(make_csv("%Y-%m-%d", extra_rows), countries=["Italy"],
+                                           start_date="2020-01-02", chunk_size=chunk_size)
+            self.assertEqual([1, 3, 7], list(chunked_df.index))
+        # No row kept
+        self.assertEqual(0, len(read_csv_filtered(make_csv("%Y%m%d"), countries=["Spain"], chunk_size=2)))
+
+    def test_geo_id(self):
+        df = load_oxford_data(make_csv("%Y%m%d"))
+        self.assertEqual(["Italy__nan", "Italy__nan", "Italy__Lazio", "Italy__Lazio"], list(geo_id(df)))
+        self.assertEqual(["Italy", "Italy", "Italy / Lazio", "Italy / Lazio"],
+                         list(geo_id(df, separator=" / ", no_region=None)))
+        # Same ids for object names
+        self.assertEqual(list(geo_id(df)), list(geo_id(df.astype({"CountryName": str}))))
+
+    def test_fill_missing_npis(self):
+        df = load_oxford_data(make_csv("%Y%m%d"))
+        df["GeoID"] = geo_id(df)
+        npis_df = fill_missing_npis(df)
+        self.assertEqual(np.int8, npis_df[NPI_COLUMNS[0]].dtype)
+        # Filled with 0 if there is no previous day, with the previous day of the same geo otherwise
+        np.testing.assert_array_equal([0, 2, 1, 1], npis_df[NPI_COLUMNS[0]])
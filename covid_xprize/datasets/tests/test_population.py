@@ -0,0 +1,58 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid_xprize.datasets import population
+from covid_xprize.datasets.population import load_population_df, population_index, add_population_column
+
+
+class TestPopulation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.files = tuple(os.path.join(self.tmp_dir, name) for name in ['countries.csv', 'us.csv', 'uk.csv',
+                                                                        'brazil.csv'])
+        pd.DataFrame({'CountryName': ['Italy', 'Brazil'], 'CountryCode': ['ITA', 'BRA'],
+                      'Population': [60000000, 212000000]}).to_csv(self.files[0], index=False)
+        pd.DataFrame({'NAME': ['Texas'], 'POPESTIMATE2018': [28000000],
+                      'POPESTIMATE2019': [29000000]}).to_csv(self.files[1], index=False)
+        pd.DataFrame({'GeoID': ['United Kingdom / Wales'], 'Population': [3100000]}).to_csv(self.files[2], index=False)
+        pd.DataFrame({'GeoID': ['Brazil / Acre'], 'Population': [880000]}).to_csv(self.files[3], index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        population._population_indexes.clear()
+
+    def test_load_population_df(self):
+        population_df = load_population_df(self.files)
+        self.assertEqual(['Italy', 'Brazil', 'United States / Texas', 'United Kingdom / Wales', 'Brazil / Acre'],
+                         list(population_df.GeoID))
+        self.assertEqual(29000000, population_df.Population[2])
+
+    def test_population_index(self):
+        index = population_index(self.files, self.cache_dir)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        # Read from the saved index when the files are unchanged
+        population._population_indexes.clear()
+        pd.testing.assert_series_equal(index, population_index(self.files, self.cache_dir))
+        # Rebuilt when a file changes
+        pd.DataFrame({'GeoID': ['Brazil / Acre'], 'Population': [890000]}).to_csv(self.files[3], index=False)
+        self.assertEqual(890000, population_index(self.files, self.cache_dir)['Brazil / Acre'])
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+
+    def test_add_population_column(self):
+        df = pd.DataFrame({'GeoID': ['Brazil / Acre', 'Italy', 'Spain', 'Italy'], 'Cases': [1, 2, 3, 4]},
+                          index=[3, 2, 1, 0])
+        population_df = load_population_df(self.files)
+        expected = df.merge(population_df, on=['GeoID'], how='left', suffixes=('', '_y'))
+        pd.testing.assert_frame_equal(expected, add_population_column(df, self.files, self.cache_dir))
+        df['GeoID'] = df['GeoID'].astype('category')
+        self.assertTrue(np.isnan(add_population_column(df, self.files, self.cache_dir).Population[2]))
+        self.assertEqual(float, add_population_column(df, self.files, self.cache_dir).Population.dtype)
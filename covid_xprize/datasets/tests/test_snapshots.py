@@ -0,0 +1,54 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from covid_xprize.datasets.snapshots import add_snapshot, copy_snapshot, list_snapshots, load_snapshot, snapshot_path
+
+CSV_HEADER = "CountryName,CountryCode,RegionName,RegionCode,Date,ConfirmedCases\n"
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.snapshots_dir = os.path.join(self.tmp_dir, 'snapshots')
+        for date, cases in [("2020-11-01", 10), ("2020-11-15", 20)]:
+            data_file = os.path.join(self.tmp_dir, 'OxCGRT_latest.csv')
+            with open(data_file, 'w') as f:
+                f.write(CSV_HEADER + f"Italy,ITA,,,20201101,{cases}\n")
+            add_snapshot(data_file, date=date, snapshots_dir=self.snapshots_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_list_snapshots(self):
+        self.assertEqual(["2020-11-01", "2020-11-15"], list_snapshots(self.snapshots_dir))
+
+    def test_load_snapshot(self):
+        # Most recent snapshot by default
+        self.assertEqual(20, load_snapshot(snapshots_dir=self.snapshots_dir).ConfirmedCases[0])
+        # Most recent snapshot on or before the requested date
+        self.assertEqual(10, load_snapshot("2020-11-14", snapshots_dir=self.snapshots_dir).ConfirmedCases[0])
+        self.assertEqual(20, load_snapshot("2020-11-15", snapshots_dir=self.snapshots_dir).ConfirmedCases[0])
+
+    def test_no_snapshot(self):
+        with self.assertRaises(FileNotFoundError):
+            load_snapshot("2020-10-31", snapshots_dir=self.snapshots_dir)
+        with self.assertRaises(FileNotFoundError):
+            load_snapshot(snapshots_dir=os.path.join(self.tmp_dir, 'empty'))
+
+    def test_checksum_mismatch(self):
+        path = snapshot_path("2020-11-01", snapshots_dir=self.snapshots_dir)
+        with open(path, 'a') as f:
+            f.write("France,FRA,,,20201101,30\n")
+        with self.assertRaises(ValueError):
+            snapshot_path("2020-11-01", snapshots_dir=self.snapshots_dir)
+
+    def test_copy_snapshot(self):
+        dest_path = os.path.join(self.tmp_dir, 'data', 'OxCGRT_latest.csv')
+        copy_snapshot(dest_path, "2020-11-01", snapshots_dir=self.snapshots_dir)
+        with open(dest_path) as f:
+            self.assertEqual(CSV_HEADER + "Italy,ITA,,,20201101,10\n", f.read())
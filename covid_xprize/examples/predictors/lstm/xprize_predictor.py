@@ -1,7 +1,6 @@
 # Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
 
 import os
-import urllib.request
 
 # Suppress noisy Tensorflow debug logging
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
@@ -18,8 +17,10 @@ from keras.layers import LSTM
 from keras.layers import Lambda
 from keras.models import Model
 
-# See https://github.com/OxCGRT/covid-policy-tracker
-DATA_URL = "https://raw.githubusercontent.com/OxCGRT/covid-policy-tracker/master/data/OxCGRT_latest.csv"
+from covid_xprize.datasets.geo_series_store import GeoSeriesStore
+from covid_xprize.datasets.oxford import load_oxford_data, geo_id, fill_missing_npis
+from covid_xprize.datasets.population import population_index
+from covid_xprize.datasets.snapshots import copy_snapshot
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(ROOT_DIR, 'data')
@@ -87,11 +88,12 @@ class XPrizePredictor(object):
                                                       nb_lookback_days=NB_LOOKBACK_DAYS)
             self.predictor.load_weights(path_to_model_weights)
 
-            # Make sure data is available to make predictions
+            # Make sure data is available to make predictions, from the local snapshots
             if not os.path.exists(DATA_FILE_PATH):
-                urllib.request.urlretrieve(DATA_URL, DATA_FILE_PATH)
+                copy_snapshot(DATA_FILE_PATH)
 
         self.df = self._prepare_dataframe(data_url)
+        self.geo_store = GeoSeriesStore(self.df)
         geos = self.df.GeoID.unique()
         self.country_samples = self._create_country_samples(self.df, geos)
 
@@ -99,38 +101,70 @@ class XPrizePredictor(object):
                 start_date_str: str,
                 end_date_str: str,
                 path_to_ips_file: str) -> pd.DataFrame:
+        # Load the npis into a DataFrame, handling regions
+        npis_df = self._load_original_data(path_to_ips_file)
+        return self.predict_from_df(start_date_str, end_date_str, npis_df)
+
+    def predict_from_df(self,
+                        start_date_str: str,
+                        end_date_str: str,
+                        npis_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Same as predict, for intervention plans already loaded in memory.
+        :param start_date_str: day from which to start making predictions, as a string, format YYYY-MM-DDD
+        :param end_date_str: day on which to stop making predictions, as a string, format YYYY-MM-DDD
+        :param npis_df: a DataFrame of intervention plans with a GeoID column, as returned by _load_original_data
+        :return: a Pandas DataFrame with the predicted daily new cases
+        """
         start_date = pd.to_datetime(start_date_str, format='%Y-%m-%d')
         end_date = pd.to_datetime(end_date_str, format='%Y-%m-%d')
         nb_days = (end_date - start_date).days + 1
 
-        # Load the npis into a DataFrame, handling regions
-        npis_df = self._load_original_data(path_to_ips_file)
-
         # Prepare the output
         forecast = {"CountryName": [],
                     "RegionName": [],
                     "Date": [],
                     "PredictedDailyNewCases": []}
 
+        # Gather the inputs of the requested geos we have historical data for
+        npis_store = GeoSeriesStore(npis_df)
+        geo_start_dates = {}
+        rolled_out_geos = []
+        npis_sequences = []
+        for g in npis_store:
+            if g not in self.geo_store:
+                geo_start_dates[g] = start_date
+                continue
+            last_known_date = self.geo_store.frame(g).Date.max()
+            # Start predicting from start_date, unless there's a gap since last known date
+            geo_start_date = min(last_known_date + np.timedelta64(1, 'D'), start_date)
+            geo_start_dates[g] = geo_start_date
+            npis_gdf = npis_store.frame(g)
+            geo_npis_df = npis_gdf[(npis_gdf.Date >= geo_start_date) & (npis_gdf.Date <= end_date)]
+            rolled_out_geos.append(g)
+            npis_sequences.append(geo_npis_df[NPI_COLUMNS].to_numpy(dtype=np.float32, na_value=np.nan))
+
+        # Roll out the predictions of all these geos together, with the passed npis
+        geo_preds = self._batch_roll_out_predictions(
+            self.predictor,
+            np.array([self.country_samples[g]['X_test_context'][-1] for g in rolled_out_geos]),
+            np.array([self.country_samples[g]['X_test_action'][-1] for g in rolled_out_geos]),
+            npis_sequences)
+        geo_preds = dict(zip(rolled_out_geos, geo_preds))
+
         # For each requested geo
-        geos = npis_df.GeoID.unique()
-        for g in geos:
-            cdf = self.df[self.df.GeoID == g]
-            if len(cdf) == 0:
+        for g in npis_store:
+            npis_gdf = npis_store.frame(g)
+            if g not in geo_preds:
                 # we don't have historical data for this geo: return zeroes
                 pred_new_cases = [0] * nb_days
-                geo_start_date = start_date
             else:
-                last_known_date = cdf.Date.max()
-                # Start predicting from start_date, unless there's a gap since last known date
-                geo_start_date = min(last_known_date + np.timedelta64(1, 'D'), start_date)
-                npis_gdf = npis_df[(npis_df.Date >= geo_start_date) & (npis_df.Date <= end_date)]
-
-                pred_new_cases = self._get_new_cases_preds(cdf, g, npis_gdf)
+                pred_new_cases = self._get_new_cases_preds(self.geo_store.frame(g), geo_preds[g])
 
             # Append forecast data to results to return
-            country = npis_df[npis_df.GeoID == g].iloc[0].CountryName
-            region = npis_df[npis_df.GeoID == g].iloc[0].RegionName
+            country = npis_gdf.iloc[0].CountryName
+            region = npis_gdf.iloc[0].RegionName
+            geo_start_date = geo_start_dates[g]
             for i, pred in enumerate(pred_new_cases):
                 forecast["CountryName"].append(country)
                 forecast["RegionName"].append(region)
@@ -142,18 +176,8 @@ class XPrizePredictor(object):
         # Return only the requested predictions
         return forecast_df[(forecast_df.Date >= start_date) & (forecast_df.Date <= end_date)]
 
-    def _get_new_cases_preds(self, c_df, g, npis_df):
+    def _get_new_cases_preds(self, c_df, preds):
         cdf = c_df[c_df.ConfirmedCases.notnull()]
-        initial_context_input = self.country_samples[g]['X_test_context'][-1]
-        initial_action_input = self.country_samples[g]['X_test_action'][-1]
-        # Predictions with passed npis
-        cnpis_df = npis_df[npis_df.GeoID == g]
-        npis_sequence = np.array(cnpis_df[NPI_COLUMNS])
-        # Get the predictions with the passed NPIs
-        preds = self._roll_out_predictions(self.predictor,
-                                           initial_context_input,
-                                           initial_action_input,
-                                           npis_sequence)
         # Gather info to convert to total cases
         prev_confirmed_cases = np.array(cdf.ConfirmedCases)
         prev_new_cases = np.array(cdf.NewCases)
@@ -225,18 +249,14 @@ class XPrizePredictor(object):
 
     @staticmethod
     def _load_original_data(data_url):
-        latest_df = pd.read_csv(data_url,
-                                parse_dates=['Date'],
-                                encoding="ISO-8859-1",
-                                dtype={"RegionName": str,
-                                       "RegionCode": str},
-                                error_bad_lines=False)
-        # GeoID is CountryName / RegionName
-        # np.where usage: if A then B else C
-        latest_df["GeoID"] = np.where(latest_df["RegionName"].isnull(),
-                                      latest_df["CountryName"],
-                                      latest_df["CountryName"] + ' / ' + latest_df["RegionName"])
-        return latest_df
+        latest_df = load_oxford_data(data_url)
+        return XPrizePredictor._add_geo_id(latest_df)
+
+    @staticmethod
+    def _add_geo_id(df):
+        # GeoID is CountryName / RegionName, or CountryName if there is no RegionName
+        df["GeoID"] = geo_id(df, separator=' / ', no_region=None)
+        return df
 
     @staticmethod
     def _fill_missing_values(df):
@@ -252,39 +272,14 @@ class XPrizePredictor(object):
             lambda group: group.interpolate(limit_area='inside')))
         # Drop country / regions for which no number of deaths is available
         df.dropna(subset=['ConfirmedDeaths'], inplace=True)
-        for npi_column in NPI_COLUMNS:
-            df.update(df.groupby('GeoID')[npi_column].ffill().fillna(0))
+        df[NPI_COLUMNS] = fill_missing_npis(df, 'GeoID', NPI_COLUMNS)
 
     @staticmethod
     def _load_additional_context_df():
-        # File containing the population for each country
-        # Note: this file contains only countries population, not regions
-        additional_context_df = pd.read_csv(ADDITIONAL_CONTEXT_FILE,
-                                            usecols=['CountryName', 'Population'])
-        additional_context_df['GeoID'] = additional_context_df['CountryName']
-
-        # US states population
-        additional_us_states_df = pd.read_csv(ADDITIONAL_US_STATES_CONTEXT,
-                                              usecols=['NAME', 'POPESTIMATE2019'])
-        # Rename the columns to match measures_df ones
-        additional_us_states_df.rename(columns={'POPESTIMATE2019': 'Population'}, inplace=True)
-        # Prefix with country name to match measures_df
-        additional_us_states_df['GeoID'] = US_PREFIX + additional_us_states_df['NAME']
-
-        # Append the new data to additional_df
-        additional_context_df = additional_context_df.append(additional_us_states_df)
-
-        # UK population
-        additional_uk_df = pd.read_csv(ADDITIONAL_UK_CONTEXT)
-        # Append the new data to additional_df
-        additional_context_df = additional_context_df.append(additional_uk_df)
-
-        # Brazil population
-        additional_brazil_df = pd.read_csv(ADDITIONAL_BRAZIL_CONTEXT)
-        # Append the new data to additional_df
-        additional_context_df = additional_context_df.append(additional_brazil_df)
-
-        return additional_context_df
+        # Population of the countries, US states, UK nations and Brazil states, by GeoID
+        population = population_index((ADDITIONAL_CONTEXT_FILE, ADDITIONAL_US_STATES_CONTEXT,
+                                       ADDITIONAL_UK_CONTEXT, ADDITIONAL_BRAZIL_CONTEXT))
+        return population.reset_index()
 
     @staticmethod
     def _create_country_samples(df: pd.DataFrame, geos: list) -> dict:
@@ -298,8 +293,9 @@ class XPrizePredictor(object):
         action_columns = NPI_COLUMNS
         outcome_column = 'PredictionRatio'
         country_samples = {}
+        store = GeoSeriesStore(df)
         for g in geos:
-            cdf = df[df.GeoID == g]
+            cdf = store.frame(g)
             cdf = cdf[cdf.ConfirmedCases.notnull()]
             context_data = np.array(cdf[context_column])
             action_data = np.array(cdf[action_columns])
@@ -332,20 +328,44 @@ class XPrizePredictor(object):
     # Function for performing roll outs into the future
     @staticmethod
     def _roll_out_predictions(predictor, initial_context_input, initial_action_input, future_action_sequence):
-        nb_roll_out_days = future_action_sequence.shape[0]
-        pred_output = np.zeros(nb_roll_out_days)
-        context_input = np.expand_dims(np.copy(initial_context_input), axis=0)
-        action_input = np.expand_dims(np.copy(initial_action_input), axis=0)
-        for d in range(nb_roll_out_days):
+        return XPrizePredictor._batch_roll_out_predictions(predictor,
+                                                           np.expand_dims(initial_context_input, axis=0),
+                                                           np.expand_dims(initial_action_input, axis=0),
+                                                           [future_action_sequence])[0]
+
+    @staticmethod
+    def _batch_roll_out_predictions(predictor, initial_context_inputs, initial_action_inputs, future_action_sequences):
+        """
+        Rolls out the predictions of several geos together: each day, the model is called once on the batch
+        of all the geos instead of once per geo. The model is called directly, as Model.predict has a large
+        overhead per call.
+        :param predictor: the Keras model
+        :param initial_context_inputs: array of shape (nb_geos, nb_lookback_days, 1)
+        :param initial_action_inputs: array of shape (nb_geos, nb_lookback_days, nb_actions)
+        :param future_action_sequences: list of nb_geos arrays of shape (nb_roll_out_days, nb_actions). Each geo
+        can have its own number of roll out days
+        :return: a list of nb_geos arrays of predictions, one per roll out day of the geo
+        """
+        nb_roll_out_days = [len(action_sequence) for action_sequence in future_action_sequences]
+        max_roll_out_days = max(nb_roll_out_days, default=0)
+        context_input = np.array(initial_context_inputs, dtype=np.float32)
+        action_input = np.array(initial_action_inputs, dtype=np.float32)
+        # Shorter action sequences are padded with zeroes: the predictions only depend on the past days,
+        # so the padding only affects the predictions that are dropped
+        future_actions = np.zeros((len(future_action_sequences), max_roll_out_days, action_input.shape[-1]),
+                                  dtype=np.float32)
+        for i, action_sequence in enumerate(future_action_sequences):
+            future_actions[i, :len(action_sequence)] = action_sequence
+        pred_output = np.zeros((len(future_action_sequences), max_roll_out_days))
+        for d in range(max_roll_out_days):
             action_input[:, :-1] = action_input[:, 1:]
             # Use the passed actions
-            action_sequence = future_action_sequence[d]
-            action_input[:, -1] = action_sequence
-            pred = predictor.predict([context_input, action_input])
-            pred_output[d] = pred
+            action_input[:, -1] = future_actions[:, d]
+            pred = np.asarray(predictor([context_input, action_input], training=False))
+            pred_output[:, d] = pred[:, 0]
             context_input[:, :-1] = context_input[:, 1:]
             context_input[:, -1] = pred
-        return pred_output
+        return [pred_output[i, :nb_days] for i, nb_days in enumerate(nb_roll_out_days)]
 
     # Functions for converting predictions back to number of cases
     @staticmethod
@@ -465,7 +485,7 @@ class XPrizePredictor(object):
         for m in range(len(models)):
             total_loss = 0
             for g in geos:
-                true_cases = np.sum(np.array(self.df[self.df.GeoID == g].NewCases)[-NB_TEST_DAYS:])
+                true_cases = np.sum(self.geo_store.values(g, 'NewCases')[-NB_TEST_DAYS:])
                 pred_cases = np.sum(country_casess[m][g][-NB_TEST_DAYS:])
                 total_loss += np.abs(true_cases - pred_cases)
             test_case_maes.append(total_loss)
@@ -487,7 +507,7 @@ class XPrizePredictor(object):
         country names that have at least min_look_back_days data points.
         """
         # By default use most affected geos with enough history
-        gdf = df.groupby('GeoID')['ConfirmedDeaths'].agg(['max', 'count']).sort_values(by='max', ascending=False)
+        gdf = df.groupby('GeoID', observed=True)['ConfirmedDeaths'].agg(['max', 'count']).sort_values(by='max', ascending=False)
         filtered_gdf = gdf[gdf["count"] > min_historical_days]
         geos = list(filtered_gdf.head(nb_geos).index)
         return geos
@@ -557,29 +577,22 @@ class XPrizePredictor(object):
 
     # Functions for computing test metrics
     def _lstm_roll_out_predictions(self, model, initial_context_input, initial_action_input, future_action_sequence):
-        nb_test_days = future_action_sequence.shape[0]
-        pred_output = np.zeros(nb_test_days)
-        context_input = np.expand_dims(np.copy(initial_context_input), axis=0)
-        action_input = np.expand_dims(np.copy(initial_action_input), axis=0)
-        for d in range(nb_test_days):
-            action_input[:, :-1] = action_input[:, 1:]
-            action_input[:, -1] = future_action_sequence[d]
-            pred = model.predict([context_input, action_input])
-            pred_output[d] = pred
-            context_input[:, :-1] = context_input[:, 1:]
-            context_input[:, -1] = pred
-        return pred_output
+        return self._roll_out_predictions(model,
+                                          initial_context_input,
+                                          initial_action_input,
+                                          future_action_sequence)
 
     def _lstm_get_test_rollouts(self, model, df, top_geos, country_samples):
         country_indep = {}
         country_preds = {}
         country_cases = {}
+        store = GeoSeriesStore(df)
+        future_action_sequences = []
         for g in top_geos:
             X_test_context = country_samples[g]['X_test_context']
             X_test_action = country_samples[g]['X_test_action']
             country_indep[g] = model.predict([X_test_context, X_test_action])
 
-            initial_context_input = country_samples[g]['X_test_context'][0]
             initial_action_input = country_samples[g]['X_test_action'][0]
             y_test = country_samples[g]['y_test']
 
@@ -590,18 +603,23 @@ class XPrizePredictor(object):
             future_action_sequence[:nb_test_days] = country_samples[g]['X_test_action'][:, -1, :]
             current_action = country_samples[g]['X_test_action'][:, -1, :][-1]
             future_action_sequence[14:] = current_action
-            preds = self._lstm_roll_out_predictions(model,
-                                                    initial_context_input,
-                                                    initial_action_input,
-                                                    future_action_sequence)
+            future_action_sequences.append(future_action_sequence)
+
+        # Roll out all the top geos together
+        all_preds = self._batch_roll_out_predictions(
+            model,
+            np.array([country_samples[g]['X_test_context'][0] for g in top_geos]),
+            np.array([country_samples[g]['X_test_action'][0] for g in top_geos]),
+            future_action_sequences)
+
+        for g, preds in zip(top_geos, all_preds):
             country_preds[g] = preds
 
-            prev_confirmed_cases = np.array(
-                df[df.GeoID == g].ConfirmedCases)[:-nb_test_days]
-            prev_new_cases = np.array(
-                df[df.GeoID == g].NewCases)[:-nb_test_days]
+            nb_test_days = country_samples[g]['y_test'].shape[0]
+            prev_confirmed_cases = store.values(g, 'ConfirmedCases')[:-nb_test_days]
+            prev_new_cases = store.values(g, 'NewCases')[:-nb_test_days]
             initial_total_cases = prev_confirmed_cases[-1]
-            pop_size = np.array(df[df.GeoID == g].Population)[0]
+            pop_size = store.values(g, 'Population')[0]
 
             pred_new_cases = self._convert_ratios_to_total_cases(
                 preds, WINDOW_SIZE, prev_new_cases, initial_total_cases, pop_size)
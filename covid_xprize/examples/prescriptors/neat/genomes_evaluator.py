@@ -0,0 +1,166 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Evaluation of the fitness of neat-based prescriptors, in the main process or in a pool of worker processes
+#
+
+import multiprocessing
+
+import neat
+import numpy as np
+import pandas as pd
+
+from covid_xprize.examples.prescriptors.neat.utils import IP_COLS, IP_MAX_VALUES, add_geo_id
+from covid_xprize.validation.cost_generator import generate_costs
+
+# Gather values for scaling network output
+IP_MAX_VALUES_ARR = np.array([IP_MAX_VALUES[ip] for ip in IP_COLS])
+
+# What the genomes are evaluated on, set by _init_evaluation in each process evaluating them.
+# Forked workers inherit the arrays of the main process instead of receiving copies.
+_evaluation = {}
+
+
+def _init_evaluation(load_predictor, eval_geos, past_cases, past_ips, eval_start_date, eval_end_date):
+    """
+    Loads the predictor of the current process, and keeps what the genomes are evaluated on.
+    It runs in each worker after it is forked, so that Keras is never initialized in the main process before forking.
+    """
+    _evaluation['predictor'] = load_predictor()
+    _evaluation['eval_geos'] = eval_geos
+    _evaluation['past_cases'] = past_cases
+    _evaluation['past_ips'] = past_ips
+    _evaluation['dates'] = pd.date_range(eval_start_date, eval_end_date)
+
+
+# Function that evaluates the fitness of a prescriptor model
+def eval_genome(genome, config, geo_costs):
+
+    predictor = _evaluation['predictor']
+    eval_geos = _evaluation['eval_geos']
+    dates = _evaluation['dates']
+
+    # Create net from genome
+    net = neat.nn.FeedForwardNetwork.create(genome, config)
+
+    # Set up array to keep track of prescription, for each geo and day
+    prescribed = np.zeros((len(eval_geos), len(dates), len(IP_COLS)))
+
+    # Set initial data
+    eval_past_cases = np.copy(_evaluation['past_cases'])
+    eval_past_ips = np.copy(_evaluation['past_ips'])
+
+    # Compute prescribed stringency incrementally
+    stringency = 0.
+
+    # Make prescriptions one day at a time, feeding resulting
+    # predictions from the predictor back into the prescriptor.
+    for d, date in enumerate(dates):
+        date_str = date.strftime("%Y-%m-%d")
+
+        # Prescribe for each geo
+        for i, geo in enumerate(eval_geos):
+
+            # Prepare input data. Here we use log to place cases
+            # on a reasonable scale; many other approaches are possible.
+            X_cases = np.log(eval_past_cases[i] + 1)
+            X_ips = eval_past_ips[i]
+            X_costs = geo_costs[i]
+            X = np.concatenate([X_cases.flatten(),
+                                X_ips.flatten(),
+                                X_costs])
+
+            # Get prescription
+            prescribed_ips = net.activate(X)
+
+            # Map prescription to integer outputs
+            prescribed_ips = (prescribed_ips * IP_MAX_VALUES_ARR).round()
+
+            # Add it to prescription array
+            prescribed[i, d] = prescribed_ips
+
+            # Update stringency. This calculation could include division by
+            # the number of IPs and/or number of geos, but that would have
+            # no effect on the ordering of candidate solutions.
+            stringency += np.sum(geo_costs[i] * prescribed_ips)
+
+        # Make prediction given prescription for all countries
+        preds = predictor.predict(date_str, eval_geos, prescribed[:, :d + 1])
+
+        # Update past data with new day of prescriptions and predictions,
+        # keeping the same number of days
+        eval_past_ips = np.concatenate([eval_past_ips[:, 1:], prescribed[:, d:d + 1]], axis=1)
+        eval_past_cases = np.concatenate([eval_past_cases[:, 1:], preds[:, -1:]], axis=1)
+
+    # Compute fitness. There are many possibilities for computing fitness and ranking
+    # candidates. Here we choose to minimize the product of ip stringency and predicted
+    # cases. This product captures the area of the 2D objective space that dominates
+    # the candidate. We minimize it by including a negation. To place the fitness on
+    # a reasonable scale, we take means over all geos and days. Note that this fitness
+    # function can lead directly to the degenerate solution of all ips 0, i.e.,
+    # stringency zero. To achieve more interesting behavior, a different fitness
+    # function may be required.
+    new_cases = np.nanmean(preds)
+    return -(new_cases * stringency), new_cases, stringency
+
+
+class GenomesEvaluator(object):
+    """
+    Evaluates the genomes of each generation, in the main process or in a pool of worker processes.
+    Each worker loads its own predictor once, after it is forked, and reuses it for all its evaluations.
+    Fitnesses only depend on the genomes and on the costs sampled by the main process, so they do not
+    depend on the number of workers.
+    """
+
+    def __init__(self, nb_workers, load_predictor, eval_geos, past_cases, past_ips, eval_start_date, eval_end_date):
+        """
+        :param nb_workers: the number of worker processes. 1 to evaluate the genomes in the main process
+        :param load_predictor: a function without arguments returning the predictor, e.g. a PredictorService
+        :param eval_geos: the list of GeoIDs the prescriptors are evaluated on
+        :param past_cases: an array of shape (nb_geos, nb_lookback_days) with the last new cases of eval_geos
+        :param past_ips: an array of shape (nb_geos, nb_lookback_days, nb_ips) with their last IP_COLS
+        :param eval_start_date: first day prescribed, as a Timestamp
+        :param eval_end_date: last day prescribed, as a Timestamp
+        """
+        self.eval_geos = eval_geos
+        init_args = (load_predictor, eval_geos, past_cases, past_ips, eval_start_date, eval_end_date)
+        self.pool = None
+        if nb_workers > 1:
+            self.pool = multiprocessing.get_context('fork').Pool(nb_workers, initializer=_init_evaluation,
+                                                                 initargs=init_args)
+        else:
+            _init_evaluation(*init_args)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def sample_costs(self):
+        """
+        Samples a different set of costs per geo, so that over time solutions become robust to different costs.
+        :return: an array of shape (nb_geos, nb_ips) with the cost of each IP_COLS of each of eval_geos
+        """
+        cost_df = generate_costs(distribution='uniform')
+        cost_df = add_geo_id(cost_df)
+        return cost_df.groupby('GeoID').first().loc[self.eval_geos, IP_COLS].values
+
+    def evaluate(self, genomes, config):
+
+        # Every generation sample a different set of costs per geo.
+        # They are small, so they are sent to the workers with each genome.
+        geo_costs = self.sample_costs()
+
+        # Evaluate each individual
+        tasks = [(genome, config, geo_costs) for _, genome in genomes]
+        if self.pool is None:
+            results = [eval_genome(*task) for task in tasks]
+        else:
+            results = self.pool.starmap(eval_genome, tasks)
+
+        for (genome_id, genome), (fitness, new_cases, stringency) in zip(genomes, results):
+            genome.fitness = fitness
+            print('Evaluated Genome', genome_id)
+            print('New cases:', new_cases)
+            print('Stringency:', stringency)
+            print('Fitness:', genome.fitness)
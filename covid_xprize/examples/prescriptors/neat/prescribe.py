@@ -15,7 +15,8 @@ import neat
 # Many approaches can be taken to generate/collect more diverse sets.
 # Note: this set can contain up to 10 prescriptors for evaluation.
 from covid_xprize.examples.prescriptors.neat.utils import prepare_historical_df, CASES_COL, IP_COLS, IP_MAX_VALUES, \
-    add_geo_id, get_predictions, PRED_CASES_COL
+    add_geo_id, PredictorService
+from covid_xprize.datasets.geo_series_store import GeoSeriesStore
 
 PRESCRIPTORS_FILE = 'neat-checkpoint-0'
 
@@ -44,12 +45,12 @@ def prescribe(start_date_str: str,
     # data for all days and geos up until the start_date.
 
     # Create historical data arrays for all geos
+    geo_store = GeoSeriesStore(df)
     past_cases = {}
     past_ips = {}
-    for geo in df['GeoID'].unique():
-        geo_df = df[df['GeoID'] == geo]
-        past_cases[geo] = np.maximum(0, np.array(geo_df[CASES_COL]))
-        past_ips[geo] = np.array(geo_df[IP_COLS])
+    for geo in geo_store:
+        past_cases[geo] = np.maximum(0, geo_store.values(geo, CASES_COL))
+        past_ips[geo] = geo_store.values(geo, IP_COLS)
 
     # Gather values for scaling network output
     ip_max_values_arr = np.array([IP_MAX_VALUES[ip] for ip in IP_COLS])
@@ -66,11 +67,15 @@ def prescribe(start_date_str: str,
     cost_df['RegionName'] = cost_df['RegionName'].fillna("")
     cost_df = add_geo_id(cost_df)
     geo_costs = {}
-    for geo in cost_df['GeoID'].unique():
-        costs = cost_df[cost_df['GeoID'] == geo]
+    for geo, costs in cost_df.groupby('GeoID', sort=False):
         cost_arr = np.array(costs[IP_COLS])[0]
         geo_costs[geo] = cost_arr
 
+    # Load the predictor and the historical IPs once for all prescriptors
+    predictor = PredictorService(start_date_str, end_date_str)
+    geos = list(df['GeoID'].unique())
+    nb_days = (end_date - start_date).days + 1
+
     # Generate prescriptions
     prescription_dfs = []
     for prescription_idx, prescriptor in enumerate(prescriptors):
@@ -83,6 +88,7 @@ def prescribe(start_date_str: str,
         df_dict = {'CountryName': [], 'RegionName': [], 'Date': []}
         for ip_col in sorted(IP_MAX_VALUES.keys()):
             df_dict[ip_col] = []
+        prescribed = np.zeros((len(geos), nb_days, len(IP_COLS)))
 
         # Set initial data
         eval_past_cases = deepcopy(past_cases)
@@ -90,11 +96,11 @@ def prescribe(start_date_str: str,
 
         # Generate prescriptions one day at a time, feeding resulting
         # predictions from the predictor back into the prescriptor.
-        for date in pd.date_range(start_date, end_date):
+        for d, date in enumerate(pd.date_range(start_date, end_date)):
             date_str = date.strftime("%Y-%m-%d")
 
             # Get prescription for all regions
-            for geo in df['GeoID'].unique():
+            for i, geo in enumerate(geos):
 
                 # Prepare input data. Here we use log to place cases
                 # on a reasonable scale; many other approaches are possible.
@@ -120,34 +126,27 @@ def prescribe(start_date_str: str,
                 df_dict['Date'].append(date_str)
                 for ip_col, prescribed_ip in zip(IP_COLS, prescribed_ips):
                     df_dict[ip_col].append(prescribed_ip)
-
-            # Create dataframe from prescriptions
-            pres_df = pd.DataFrame(df_dict)
+                prescribed[i, d] = prescribed_ips
 
             # Make prediction given prescription for all countries
-            pred_df = get_predictions(start_date_str, date_str, pres_df)
+            preds = predictor.predict(date_str, geos, prescribed[:, :d + 1])
 
             # Update past data with new day of prescriptions and predictions
-            pres_df['GeoID'] = pres_df['CountryName'] + '__' + pres_df['RegionName'].astype(str)
-            pred_df['RegionName'] = pred_df['RegionName'].fillna("")
-            pred_df['GeoID'] = pred_df['CountryName'] + '__' + pred_df['RegionName'].astype(str)
-            new_pres_df = pres_df[pres_df['Date'] == date_str]
-            new_pred_df = pred_df[pred_df['Date'] == date_str]
-            for geo in df['GeoID'].unique():
-                geo_pres = new_pres_df[new_pres_df['GeoID'] == geo]
-                geo_pred = new_pred_df[new_pred_df['GeoID'] == geo]
+            for i, geo in enumerate(geos):
 
                 # Append array of prescriptions
-                pres_arr = np.array([geo_pres[ip_col].values[0] for ip_col in IP_COLS]).reshape(1,-1)
-                eval_past_ips[geo] = np.concatenate([eval_past_ips[geo], pres_arr])
+                eval_past_ips[geo] = np.concatenate([eval_past_ips[geo], prescribed[i, d].reshape(1, -1)])
 
                 # It is possible that the predictor does not return values for some regions.
                 # To make sure we generate full prescriptions, this script continues anyway.
                 # Geos that are ignored in this way by the predictor, will not be used in
                 # quantitative evaluation. A list of such geos can be found in unused_geos.txt.
-                if len(geo_pred) != 0:
-                    eval_past_cases[geo] = np.append(eval_past_cases[geo],
-                                                     geo_pred[PRED_CASES_COL].values[0])
+                if not np.isnan(preds[i, -1]):
+                    eval_past_cases[geo] = np.append(eval_past_cases[geo], preds[i, -1])
+
+        # Create dataframe from prescriptions
+        pres_df = pd.DataFrame(df_dict)
+        pres_df['GeoID'] = pres_df['CountryName'] + '__' + pres_df['RegionName'].astype(str)
 
         # Add prescription df to list of all prescriptions for this submission
         pres_df['PrescriptionIndex'] = prescription_idx
@@ -0,0 +1,59 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import os
+import random
+import unittest
+from unittest import mock
+
+import neat
+import numpy as np
+import pandas as pd
+
+from covid_xprize.examples.prescriptors.neat.genomes_evaluator import GenomesEvaluator
+from covid_xprize.examples.prescriptors.neat.utils import IP_COLS
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(ROOT_DIR, '..', 'config-prescriptor')
+
+EVAL_GEOS = ['Italy__', 'Spain__', 'Brazil__Acre']
+NB_LOOKBACK_DAYS = 14
+EVAL_START_DATE = pd.Timestamp('2020-08-01')
+EVAL_END_DATE = pd.Timestamp('2020-08-03')
+
+
+class StubPredictor(object):
+    """
+    Predicts new cases that grow with the prescribed IPs, the way a trained predictor could
+    """
+
+    def predict(self, end_date_str, geos, prescribed_ips):
+        return 100. * (1. + prescribed_ips.sum(axis=2).cumsum(axis=1))
+
+
+class TestGenomesEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.past_cases = rng.rand(len(EVAL_GEOS), NB_LOOKBACK_DAYS) * 1000
+        self.past_ips = rng.randint(0, 3, (len(EVAL_GEOS), NB_LOOKBACK_DAYS, len(IP_COLS))).astype(float)
+        self.geo_costs = rng.uniform(size=(len(EVAL_GEOS), len(IP_COLS)))
+        self.config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                  neat.DefaultSpeciesSet, neat.DefaultStagnation, CONFIG_FILE)
+
+    def evaluate(self, nb_workers):
+        random.seed(42)
+        genomes = list(neat.Population(self.config).population.items())
+        evaluator = GenomesEvaluator(nb_workers, StubPredictor, EVAL_GEOS, self.past_cases, self.past_ips,
+                                     EVAL_START_DATE, EVAL_END_DATE)
+        try:
+            with mock.patch.object(evaluator, 'sample_costs', return_value=self.geo_costs):
+                evaluator.evaluate(genomes, self.config)
+        finally:
+            evaluator.close()
+        return [genome.fitness for _, genome in genomes]
+
+    def test_same_fitnesses_as_main_process(self):
+        fitnesses = self.evaluate(1)
+        self.assertEqual(10, len(fitnesses))
+        self.assertTrue(np.all(np.isfinite(fitnesses)))
+        np.testing.assert_array_equal(fitnesses, self.evaluate(2))
@@ -1,20 +1,19 @@
 # Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
 
 import os
-import subprocess
-import urllib.request
+import numpy as np
 import pandas as pd
 
+from covid_xprize.datasets.snapshots import copy_snapshot
 from covid_xprize.validation.scenario_generator import get_raw_data, generate_scenario
 
-DATA_URL = "https://raw.githubusercontent.com/OxCGRT/covid-policy-tracker/master/data/OxCGRT_latest.csv"
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(ROOT_DIR, 'data')
 HIST_DATA_FILE_PATH = os.path.join(DATA_PATH, 'OxCGRT_latest.csv')
 
-PREDICT_MODULE = 'covid_xprize/examples/predictors/lstm/predict.py'
-TMP_PRED_FILE_NAME = 'tmp_predictions_for_prescriptions/preds.csv'
-TMP_PRESCRIPTION_FILE = 'tmp_prescription.csv'
+PREDICTOR_ROOT_DIR = os.path.join(ROOT_DIR, '..', '..', 'predictors', 'lstm')
+MODEL_WEIGHTS_FILE = os.path.join(PREDICTOR_ROOT_DIR, 'models', 'trained_model_weights.h5')
+PREDICTOR_DATA_FILE = os.path.join(PREDICTOR_ROOT_DIR, 'data', 'OxCGRT_latest.csv')
 
 
 CASES_COL = ['NewCases']
@@ -51,17 +50,15 @@ IP_MAX_VALUES = {
 
 
 def add_geo_id(df):
-    df['GeoID'] = df['CountryName'] + '__' + df['RegionName'].astype(str)
+    df['GeoID'] = df['CountryName'].astype(str) + '__' + df['RegionName'].astype(str)
     return df
 
 # Function that performs basic loading and preprocessing of historical df
 def prepare_historical_df():
 
-    # Download data if it we haven't done that yet.
+    # Copy data from the local snapshots if we haven't done that yet.
     if not os.path.exists(HIST_DATA_FILE_PATH):
-        if not os.path.exists(DATA_PATH):
-            os.makedirs(DATA_PATH)
-        urllib.request.urlretrieve(DATA_URL, HIST_DATA_FILE_PATH)
+        copy_snapshot(HIST_DATA_FILE_PATH)
 
     # Load raw historical data
     df = pd.read_csv(HIST_DATA_FILE_PATH,
@@ -87,47 +84,62 @@ def prepare_historical_df():
     return df
 
 
-# Function that wraps predictor in order to query
-# predictor when prescribing.
-def get_predictions(start_date_str, end_date_str, pres_df, countries=None):
-
-    # Concatenate prescriptions with historical data
-    raw_df = get_raw_data(HIST_DATA_FILE_PATH)
-    hist_df = generate_scenario(start_date_str, end_date_str, raw_df,
-                                countries=countries, scenario='Historical')
-    start_date = pd.to_datetime(start_date_str, format='%Y-%m-%d')
-    hist_df = hist_df[hist_df.Date < start_date]
-    ips_df = pd.concat([hist_df, pres_df])
-
-    # Write ips_df to file
-    ips_df.to_csv(TMP_PRESCRIPTION_FILE)
-
-    # Use full path of the local file passed as ip_file
-    ip_file_full_path = os.path.abspath(TMP_PRESCRIPTION_FILE)
-
-    # Go to covid-xprize root dir to access predict script
-    wd = os.getcwd()
-    os.chdir("../../../..")
-
-    # Run script to generate predictions
-    output_str = subprocess.check_output(
-        [
-            'python', PREDICT_MODULE,
-            '--start_date', start_date_str,
-            '--end_date', end_date_str,
-            '--interventions_plan', ip_file_full_path,
-            '--output_file', TMP_PRED_FILE_NAME
-        ],
-        stderr=subprocess.STDOUT
-    )
-
-    # Print output from running script
-    print(output_str.decode("utf-8"))
-
-    # Load predictions to return
-    df = pd.read_csv(TMP_PRED_FILE_NAME)
-
-    # Return to prescriptor dir
-    os.chdir(wd)
-
-    return df
+class PredictorService(object):
+    """
+    Wraps the predictor in order to query it when prescribing.
+    The model and the historical intervention plans are loaded once, and prescriptions are passed
+    as arrays, instead of writing them to a CSV file and running predict.py for every query.
+    """
+
+    def __init__(self, start_date_str, end_date_str,
+                 model_weights_file=MODEL_WEIGHTS_FILE,
+                 predictor_data_file=PREDICTOR_DATA_FILE,
+                 hist_data_file=HIST_DATA_FILE_PATH):
+        """
+        :param start_date_str: day from which prescriptions start, as a string, format YYYY-MM-DD
+        :param end_date_str: last day that can be prescribed, as a string, format YYYY-MM-DD
+        :param model_weights_file: the weights of the trained LSTM predictor
+        :param predictor_data_file: the data the predictor uses as history
+        :param hist_data_file: the data the historical intervention plans are taken from. It is not re-downloaded
+        """
+        # Keras is only loaded when the predictor is actually needed
+        from covid_xprize.examples.predictors.lstm.xprize_predictor import XPrizePredictor
+        self.predictor = XPrizePredictor(model_weights_file, predictor_data_file)
+
+        self.start_date = pd.to_datetime(start_date_str, format='%Y-%m-%d')
+        raw_df = get_raw_data(hist_data_file, latest=False)
+        hist_df = generate_scenario(start_date_str, end_date_str, raw_df, scenario='Historical')
+        hist_df = add_geo_id(hist_df[hist_df.Date < self.start_date][['CountryName', 'RegionName', 'Date'] + IP_COLS])
+        self.hist_ips_df = hist_df
+
+    def predict(self, end_date_str, geos, prescribed_ips):
+        """
+        Predicts the daily new cases of geos, from the start date to end_date_str included,
+        given their prescribed intervention plans.
+        :param end_date_str: last day to predict, as a string, format YYYY-MM-DD
+        :param geos: a list of GeoIDs, as returned by add_geo_id
+        :param prescribed_ips: an array of shape (nb_geos, nb_days, nb_ips) with the prescribed IP_COLS
+        of each geo, for each day from the start date to end_date_str included
+        :return: an array of shape (nb_geos, nb_days) with the predicted daily new cases.
+        NaN for the geos the predictor has no prediction for
+        """
+        dates = pd.date_range(self.start_date, pd.to_datetime(end_date_str, format='%Y-%m-%d'))
+        prescribed_ips = np.asarray(prescribed_ips, dtype=float).reshape(len(geos) * len(dates), len(IP_COLS))
+
+        # Concatenate prescriptions with historical data
+        pres_df = pd.DataFrame(prescribed_ips, columns=IP_COLS)
+        pres_df['GeoID'] = np.repeat(geos, len(dates))
+        pres_df['Date'] = np.tile(dates, len(geos))
+        hist_df = self.hist_ips_df[self.hist_ips_df.GeoID.isin(geos)]
+        ips_df = pd.concat([hist_df[['GeoID', 'Date'] + IP_COLS], pres_df])
+        ips_df[['CountryName', 'RegionName']] = ips_df.GeoID.str.split('__', n=1, expand=True)
+        # Regions are identified the way the predictor loads them
+        ips_df['RegionName'] = ips_df['RegionName'].replace(['', 'nan'], np.nan)
+        pred_df = self.predictor.predict_from_df(self.start_date.strftime('%Y-%m-%d'), end_date_str,
+                                                 self.predictor._add_geo_id(ips_df))
+
+        # One row per geo, one column per day
+        pred_df['RegionName'] = pred_df['RegionName'].fillna("")
+        pred_df = add_geo_id(pred_df)
+        preds = pred_df.pivot_table(index='GeoID', columns='Date', values=PRED_CASES_COL[0])
+        return preds.reindex(index=geos, columns=dates).values
@@ -0,0 +1,123 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Registry of the models that can be named in configuration files, and of the ranges of their parameter grids.
+# Models are named by a string such as "Lasso(alpha=0.5)" or "MultiOutputRegressor(xgb.XGBRegressor())", which is
+# parsed, not evaluated: only registered names and literal arguments are accepted. The module of a model is only
+# imported when it is built, so that e.g. xgboost is not imported by the runs that don't use it.
+#
+
+import ast
+import importlib
+
+import numpy as np
+
+# Name -> (module, attribute) of the registered models
+MODELS = {
+    'LinearRegression': ('sklearn.linear_model', 'LinearRegression'),
+    'Lasso': ('sklearn.linear_model', 'Lasso'),
+    'LassoCV': ('sklearn.linear_model', 'LassoCV'),
+    'Ridge': ('sklearn.linear_model', 'Ridge'),
+    'MultiTaskLasso': ('sklearn.linear_model', 'MultiTaskLasso'),
+    'MultiTaskLassoCV': ('sklearn.linear_model', 'MultiTaskLassoCV'),
+    'RandomForestRegressor': ('sklearn.ensemble', 'RandomForestRegressor'),
+    'ExtraTreesRegressor': ('sklearn.ensemble', 'ExtraTreesRegressor'),
+    'GradientBoostingRegressor': ('sklearn.ensemble', 'GradientBoostingRegressor'),
+    'SVR': ('sklearn.svm', 'SVR'),
+    'MultiOutputRegressor': ('sklearn.multioutput', 'MultiOutputRegressor'),
+    'XGBRegressor': ('xgboost', 'XGBRegressor'),
+}
+
+
+def _int_range(start, stop, step=1):
+    return range(start, stop, step)
+
+
+# Typed ranges of the parameter grids: {"linspace": [0.3, 1, 3]} is np.linspace(0.3, 1, 3), and
+# {"linspace": {"start": 0.3, "stop": 1, "num": 3}} too
+RANGES = {
+    'linspace': np.linspace,
+    'logspace': np.logspace,
+    'arange': np.arange,
+    'range': _int_range,
+}
+
+
+def register_model(name: str, module: str, attribute: str = None) -> None:
+    """
+    Registers a model, which is imported from module when it is first built.
+    :param name: the name of the model in the model strings
+    :param module: the module of the model class or factory
+    :param attribute: the name of the model in module, name by default
+    """
+    MODELS[name] = (module, attribute or name)
+
+
+def get_model_factory(name: str):
+    """
+    Imports and returns the class or factory of a registered model.
+    :param name: the name of the model, optionally prefixed with a module alias as in "xgb.XGBRegressor"
+    :return: a callable returning the model
+    """
+    name = name.rsplit('.', 1)[-1]
+    if name not in MODELS:
+        raise ValueError("Unknown model: {}. Registered models: {}".format(name, sorted(MODELS)))
+    module, attribute = MODELS[name]
+    return getattr(importlib.import_module(module), attribute)
+
+
+def _call_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return _call_name(node.value) + '.' + node.attr
+    raise ValueError("Unsupported model name: {}".format(ast.dump(node)))
+
+
+def _build(node):
+    if isinstance(node, ast.Call):
+        factory = get_model_factory(_call_name(node.func))
+        args = [_build(arg) for arg in node.args]
+        kwargs = {keyword.arg: _build(keyword.value) for keyword in node.keywords}
+        return factory(*args, **kwargs)
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        # A model class without arguments, e.g. "Lasso"
+        return get_model_factory(_call_name(node))()
+    return ast.literal_eval(node)
+
+
+def build_model(spec):
+    """
+    Builds a model from its string, e.g. "MultiOutputRegressor(xgb.XGBRegressor(max_depth=3))".
+    The arguments can be other models or Python literals. Objects that are not strings are returned as is.
+    :param spec: the model string
+    :return: the model
+    """
+    if not isinstance(spec, str):
+        return spec
+    return _build(ast.parse(spec.strip(), mode='eval').body)
+
+
+def parse_param_values(values) -> list:
+    """
+    Returns the list of values of a parameter grid from the configuration.
+    :param values: a list of values, or a typed range such as {"linspace": [0.3, 1, 3]} or {"range": [1, 10, 2]}
+    :return: a list
+    """
+    if isinstance(values, dict):
+        if len(values) != 1 or next(iter(values)) not in RANGES:
+            raise ValueError("Unsupported range: {}. Ranges are one of {}".format(values, sorted(RANGES)))
+        (kind, args), = values.items()
+        return list(RANGES[kind](*args)) if isinstance(args, list) else list(RANGES[kind](**args))
+    if isinstance(values, list):
+        return values
+    raise ValueError("Unsupported parameter values: {}. Expected a list or a range".format(values))
+
+
+def parse_param_grid(param_grid: dict) -> dict:
+    """
+    Returns the parameter grid of GridSearchCV corresponding to a parameter grid from the configuration.
+    :param param_grid: a dict of parameter name -> list of values or typed range
+    :return: a dict of parameter name -> list of values
+    """
+    return {param: parse_param_values(values) for param, values in param_grid.items()}
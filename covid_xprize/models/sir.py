@@ -0,0 +1,258 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Vectorized SIR model: integration and least squares fitting of many initial conditions at once.
+# The model is integrated with a fixed step RK4 scheme instead of solve_ivp, so that all the windows to fit
+# form a single array problem, and the Jacobian of the new cases with respect to beta and gamma is
+# integrated along with the model (forward sensitivities) instead of being estimated by finite differences.
+#
+
+import numpy as np
+
+# Number of RK4 steps per day
+SUBSTEPS = 4
+# Bounds of the fitted parameters, as in the curve_fit calls they replace
+BETA_BOUNDS = (0., np.inf)
+GAMMA_BOUNDS = (0., 1.)
+MAX_ITERATIONS = 100
+# Relative cost decrease and step size below which a fit has converged
+FTOL = 1e-8
+XTOL = 1e-8
+
+
+def sir_new_cases(S0, I0, N, beta, gamma, nb_days, substeps=SUBSTEPS, jacobian=False):
+    """
+    Integrates the SIR model dS = -beta * S * I / N, dI = beta * S * I / N - gamma * I for nb_days days.
+    All the parameters but nb_days and substeps are arrays of the same shape (n,), one entry per initial condition.
+    :param S0: the initial susceptible individuals
+    :param I0: the initial infected individuals
+    :param N: the population
+    :param beta: the infection rate
+    :param gamma: the recovery rate
+    :param nb_days: the number of days to integrate
+    :param substeps: the number of RK4 steps per day
+    :param jacobian: True to also return the derivatives of the new cases with respect to beta and gamma
+    :return: the (n, nb_days) new cases of each day, i.e. the decrease of S, and if jacobian is True,
+    their (n, nb_days, 2) derivatives with respect to beta and gamma
+    """
+    S0, I0, N, beta, gamma = np.broadcast_arrays(*[np.asarray(x, dtype=np.float64) for x in (S0, I0, N, beta, gamma)])
+    h = 1. / substeps
+    # State: S, I and, with jacobian, their derivatives with respect to beta and gamma
+    state = [S0, I0] + [np.zeros_like(S0)] * 4 if jacobian else [S0, I0]
+    S = np.empty(S0.shape + (nb_days + 1,))
+    S[..., 0] = S0
+    dS = np.zeros(S.shape + (2,)) if jacobian else None
+
+    def derivatives(x):
+        contacts = x[0] * x[1] / N
+        infections = beta * contacts
+        derivs = [-infections, infections - gamma * x[1]]
+        if jacobian:
+            s, i, s_b, s_g, i_b, i_g = x
+            bi, bs = beta * i / N, beta * s / N
+            ds_b = -bi * s_b - bs * i_b - contacts
+            ds_g = -bi * s_g - bs * i_g
+            derivs += [ds_b, ds_g, -ds_b - gamma * i_b, -ds_g - gamma * i_g - i]
+        return derivs
+
+    for day in range(nb_days):
+        for _ in range(substeps):
+            k1 = derivatives(state)
+            k2 = derivatives([x + h / 2 * k for x, k in zip(state, k1)])
+            k3 = derivatives([x + h / 2 * k for x, k in zip(state, k2)])
+            k4 = derivatives([x + h * k for x, k in zip(state, k3)])
+            state = [x + h / 6 * (a + 2 * c + 2 * d + e) for x, a, c, d, e in zip(state, k1, k2, k3, k4)]
+        S[..., day + 1] = state[0]
+        if jacobian:
+            dS[..., day + 1, 0] = state[2]
+            dS[..., day + 1, 1] = state[3]
+    new_cases = -np.diff(S, axis=-1)
+    if not jacobian:
+        return new_cases
+    return new_cases, -np.diff(dS, axis=-2)
+
+
+def fit_sir(S0, I0, N, new_cases, beta_i, gamma_i, substeps=SUBSTEPS, max_iterations=MAX_ITERATIONS):
+    """
+    Fits beta and gamma to the observed new cases of each initial condition, by least squares.
+    Uses a Levenberg-Marquardt iteration batched over all the initial conditions, with the parameters kept within
+    BETA_BOUNDS and GAMMA_BOUNDS. Each fit stops on its own once converged.
+    :param S0: the (n,) initial susceptible individuals
+    :param I0: the (n,) initial infected individuals
+    :param N: the (n,) population
+    :param new_cases: the (n, nb_days) observed new cases, from the day after the initial condition
+    :param beta_i: the initial value of beta, a scalar or an (n,) array
+    :param gamma_i: the initial value of gamma, a scalar or an (n,) array
+    :param substeps: the number of RK4 steps per day
+    :param max_iterations: the maximum number of iterations
+    :return: the (n, 2) fitted beta and gamma
+    """
+    new_cases = np.asarray(new_cases, dtype=np.float64)
+    n, nb_days = new_cases.shape
+    S0, I0, N = [np.broadcast_to(np.asarray(x, dtype=np.float64), (n,)) for x in (S0, I0, N)]
+    lower = np.array([BETA_BOUNDS[0], GAMMA_BOUNDS[0]])
+    upper = np.array([BETA_BOUNDS[1], GAMMA_BOUNDS[1]])
+    params = np.empty((n, 2))
+    params[:, 0], params[:, 1] = beta_i, gamma_i
+    params = np.clip(params, lower, upper)
+
+    def residuals(rows, p):
+        # Steps to very large values of beta can overflow: their cost is not finite and they are rejected
+        with np.errstate(over='ignore', invalid='ignore'):
+            pred, jac = sir_new_cases(S0[rows], I0[rows], N[rows], p[:, 0], p[:, 1], nb_days, substeps, jacobian=True)
+        return pred - new_cases[rows], jac
+
+    res, jac = residuals(np.arange(n), params)
+    cost = np.sum(res ** 2, axis=1)
+    damping = np.full(n, 1e-3)
+    active = np.flatnonzero(np.isfinite(cost))
+    for _ in range(max_iterations):
+        if len(active) == 0:
+            break
+        J, r = jac[active], res[active]
+        JtJ = np.einsum('ndi,ndj->nij', J, J)
+        Jtr = np.einsum('ndi,nd->ni', J, r)
+        # Solve (JtJ + damping * diag(JtJ)) step = -Jtr, with the 2x2 inverse
+        diag = np.maximum(np.diagonal(JtJ, axis1=1, axis2=2), 1e-12 * (1 + np.abs(JtJ).max(axis=(1, 2)))[:, None])
+        a = JtJ[:, 0, 0] + damping[active] * diag[:, 0]
+        d = JtJ[:, 1, 1] + damping[active] * diag[:, 1]
+        c = JtJ[:, 0, 1]
+        # Parameters on a bound the gradient pushes against stay there: solve for the other one only
+        blocked = (((params[active] <= lower) & (Jtr > 0)) | ((params[active] >= upper) & (Jtr < 0)))
+        Jtr = np.where(blocked, 0., Jtr)
+        c = np.where(blocked.any(axis=1), 0., c)
+        det = a * d - c * c
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = -np.stack([d * Jtr[:, 0] - c * Jtr[:, 1], a * Jtr[:, 1] - c * Jtr[:, 0]], axis=1) / det[:, None]
+        new_params = np.clip(params[active] + step, lower, upper)
+        new_res, new_jac = residuals(active, new_params)
+        new_cost = np.sum(new_res ** 2, axis=1)
+        improved = new_cost < cost[active]
+
+        # Accept the improving steps and trust the linearization more, reject the others and trust it less
+        accepted = active[improved]
+        step_size = np.abs(new_params - params[active]).max(axis=1)
+        cost_decrease = cost[active] - np.where(improved, new_cost, cost[active])
+        params[accepted] = new_params[improved]
+        res[accepted], jac[accepted] = new_res[improved], new_jac[improved]
+        cost[accepted] = new_cost[improved]
+        damping[active] = np.where(improved, damping[active] / 3, damping[active] * 10)
+
+        converged = ((improved & ((cost_decrease <= FTOL * cost[active]) |
+                                  (step_size <= XTOL * (XTOL + np.abs(params[active]).max(axis=1))))) |
+                     (damping[active] > 1e10) | ~np.isfinite(det))
+        active = active[~converged]
+    params[~np.isfinite(cost)] = np.nan
+    return params
+
+
+def fit_sir_windows(cases, population, offsets, semi_fit, infection_days, beta_i, gamma_i, substeps=SUBSTEPS,
+                    start_days=None, previous_fit=None):
+    """
+    Fits beta and gamma on a window of 2 * semi_fit + 1 days centered on each day of several geos.
+    The initial condition of the window of day d is taken on its first day, d - semi_fit:
+    I0 is the sum of the infection_days + 1 days of new cases up to it, Ic0 the sum of all the new cases up to it,
+    and S0 = N - Ic0. Windows without at least 1 infected individual are not fitted.
+    Once a window is fitted, the new cases it predicts for the day after it replace the observed ones in the
+    initial conditions of the later windows. The windows of all the geos are fitted together, 2 * semi_fit days
+    at a time: the windows of these days don't depend on each other's predictions.
+    For incremental fits, start_days and previous_fit give the days to refit and the results of the days before.
+    The refitted windows then start from the parameters of the latest day fitted before them, instead of
+    beta_i and gamma_i.
+    :param cases: the new cases of all the geos, one after the other, sorted by date
+    :param population: the population of each row of cases
+    :param offsets: the positions in cases where each geo starts, followed by len(cases)
+    :param semi_fit: the number of days before and after each day to fit the parameters on
+    :param infection_days: the number of days before the first day of a window to sum the currently infected on
+    :param beta_i: the initial value of beta
+    :param gamma_i: the initial value of gamma
+    :param substeps: the number of RK4 steps per day
+    :param start_days: the first day to fit of each geo. None to fit all the days
+    :param previous_fit: the tuple returned by a previous call, aligned on cases, for the days before start_days.
+    The cases of these days and of the semi_fit + 1 days after must not have changed since
+    :return: a tuple of arrays aligned on cases: beta and gamma, NaN for the days without a fit, predicted cases,
+    the new cases of the day semi_fit days after each fitted day, and fit cases, the new cases used in the
+    initial conditions, observed or predicted
+    """
+    target_cases = np.asarray(cases, dtype=np.float64)
+    case_data = target_cases.copy()
+    population = np.asarray(population, dtype=np.float64)
+    offsets = np.asarray(offsets)
+    starts, lengths = offsets[:-1], np.diff(offsets)
+    beta = np.full(len(case_data), np.nan)
+    gamma = np.full(len(case_data), np.nan)
+    predicted_cases = target_cases.copy()
+    fit_days = 2 * semi_fit + 1
+    window = np.arange(1, fit_days)
+
+    # Initial parameters of the windows of each geo
+    geo_beta = np.full(len(starts), float(beta_i))
+    geo_gamma = np.full(len(starts), float(gamma_i))
+    if start_days is None:
+        first_days = np.full(len(starts), semi_fit + 1)
+    else:
+        start_days = np.minimum(np.asarray(start_days), lengths)
+        first_days = np.maximum(start_days, semi_fit + 1)
+        # Keep the results of the days before start_days, and the cases their windows predicted
+        days = np.arange(len(case_data)) - np.repeat(starts, lengths)
+        kept = days < np.repeat(start_days, lengths)
+        # Only the windows from day semi_fit + 1 on predict cases: geos without any kept window, such as the geos
+        # without a previous fit, keep their observed cases
+        kept_cases = days < np.repeat(np.where(start_days > semi_fit + 1, start_days + semi_fit + 1, 0), lengths)
+        previous_beta, previous_gamma, previous_predicted_cases, previous_fit_cases = previous_fit
+        beta[kept], gamma[kept] = previous_beta[kept], previous_gamma[kept]
+        predicted_cases[kept] = previous_predicted_cases[kept]
+        case_data[kept_cases] = previous_fit_cases[kept_cases]
+        # Warm start from the latest fitted day of each geo
+        geo_beta, geo_gamma = _latest_fitted(beta, gamma, starts, lengths, geo_beta, geo_gamma)
+
+    block_size = 2 * semi_fit
+    for block_start in range(0, max(lengths - semi_fit - first_days, default=0), block_size):
+        days = first_days[:, None] + block_start + np.arange(block_size)[None, :]
+        # Days d with semi_fit < d < nb_days - semi_fit in each geo
+        geo_index, day_index = np.nonzero(days < (lengths - semi_fit)[:, None])
+        if len(geo_index) == 0:
+            continue
+        d = days[geo_index, day_index]
+        rows = starts[geo_index] + d
+        cumul_cases = np.concatenate([[0.], np.cumsum(case_data)])
+        # Sums of new cases up to the first day of the window, included
+        window_starts = rows - semi_fit
+        I0 = np.where(d - semi_fit - infection_days >= 0,
+                      cumul_cases[window_starts + 1] - cumul_cases[np.maximum(window_starts - infection_days, 0)], 0.)
+        Ic0 = cumul_cases[window_starts + 1] - cumul_cases[starts[geo_index]]
+        if (I0 < 0).any():
+            row = rows[np.argmax(I0 < 0)]
+            raise ValueError('Infected was {} for population {}'.format(I0[I0 < 0][0], population[row]))
+        fitted = I0 >= 1
+        rows, I0, Ic0, d, geo_index = rows[fitted], I0[fitted], Ic0[fitted], d[fitted], geo_index[fitted]
+        if len(rows) == 0:
+            continue
+        N = population[rows]
+        S0 = N - Ic0
+        pars = fit_sir(S0, I0, N, target_cases[window_starts[fitted][:, None] + window],
+                       geo_beta[geo_index], geo_gamma[geo_index], substeps)
+        beta[rows], gamma[rows] = pars[:, 0], pars[:, 1]
+
+        # Predict the day after each window, except for the last window of each geo
+        predicts = d < lengths[geo_index] - semi_fit - 1
+        next_cases = sir_new_cases(S0[predicts], I0[predicts], N[predicts],
+                                   pars[predicts, 0], pars[predicts, 1], fit_days, substeps)
+        case_data[rows[predicts] + semi_fit + 1] = next_cases[:, -1]
+        predicted_cases[rows[predicts]] = case_data[rows[predicts] + semi_fit]
+        if start_days is not None:
+            geo_beta, geo_gamma = _latest_fitted(beta, gamma, starts, lengths, geo_beta, geo_gamma)
+    return beta, gamma, predicted_cases, case_data
+
+
+def _latest_fitted(beta, gamma, starts, lengths, default_beta, default_gamma):
+    """
+    Returns the beta and gamma of the latest fitted day of each geo, or the defaults for geos without any.
+    """
+    fitted_rows = np.flatnonzero(~np.isnan(beta))
+    geo_of_rows = np.searchsorted(starts + lengths, fitted_rows, side='right')
+    latest_beta, latest_gamma = default_beta.copy(), default_gamma.copy()
+    # Rows are sorted: the last assignment to each geo is its latest fitted day
+    latest_beta[geo_of_rows] = beta[fitted_rows]
+    latest_gamma[geo_of_rows] = gamma[fitted_rows]
+    return latest_beta, latest_gamma
@@ -0,0 +1,70 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+#
+# Content addressed cache of fitted SIR parameters.
+# Fitting the SIR parameters only depends on the cases and population of each geo and date, and on the fitter
+# settings: entries are keyed by a digest of both, so that hyper-parameter searches over the ML models of the
+# parameters, cross-validation folds and runs with the same data reuse a single fit.
+#
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from covid_xprize.cache import user_cache_dir, digest, load_frame, save_frame
+
+SIR_CACHE_DIR = user_cache_dir('sir', 'COVID_XPRIZE_SIR_CACHE_DIR')
+# Version of the fit of the SIR parameters, part of the keys so that parameters fitted by an older fit aren't reused
+CACHE_VERSION = 1
+
+
+def data_digest(df: pd.DataFrame, columns) -> str:
+    """
+    Returns the sha256 hex digest of the contents of some columns of df, independent of its index.
+    :param df: a DataFrame
+    :param columns: the columns to digest, in order
+    :return: a hex string
+    """
+    sha = hashlib.sha256(json.dumps(list(columns)).encode())
+    for column in columns:
+        # Digests the values, not the categories codes: categorical and object columns with the same values match
+        values = df[column].astype(object) if isinstance(df[column].dtype, pd.CategoricalDtype) else df[column]
+        sha.update(pd.util.hash_pandas_object(values, index=False).values.tobytes())
+    return sha.hexdigest()
+
+
+def cache_key(data_digest: str, settings: dict) -> str:
+    """
+    Returns the key of the parameters fitted on data with this digest and these fitter settings.
+    :param data_digest: the data_digest of the fitted data
+    :param settings: the settings of the fitter, e.g. SIR_fitter.settings()
+    :return: a hex string
+    """
+    return digest({'version': CACHE_VERSION, 'data': data_digest, **settings})
+
+
+def _cache_file(key, cache_dir):
+    return os.path.join(cache_dir, 'sir_pars-' + key)
+
+
+def load_parameters(key: str, cache_dir: str = SIR_CACHE_DIR):
+    """
+    Returns the parameters saved with key by save_parameters, or None if there are none.
+    :param key: the cache_key of the parameters
+    :param cache_dir: the directory of the cache
+    :return: a Pandas DataFrame or None
+    """
+    return load_frame(_cache_file(key, cache_dir))
+
+
+def save_parameters(df_pars: pd.DataFrame, key: str, cache_dir: str = SIR_CACHE_DIR) -> str:
+    """
+    Saves fitted parameters with key, so that concurrent fits never read partial entries.
+    :param df_pars: the fitted parameters
+    :param key: the cache_key of the parameters
+    :param cache_dir: the directory of the cache
+    :return: the path of the saved file
+    """
+    return save_frame(df_pars, _cache_file(key, cache_dir))
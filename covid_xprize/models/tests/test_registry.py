@@ -0,0 +1,42 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import unittest
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Lasso
+from sklearn.multioutput import MultiOutputRegressor
+
+from covid_xprize.models.registry import register_model, build_model, parse_param_values, parse_param_grid
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_build_model(self):
+        model = build_model("MultiOutputRegressor(RandomForestRegressor(n_estimators=10, max_depth=None))")
+        self.assertIsInstance(model, MultiOutputRegressor)
+        self.assertIsInstance(model.estimator, RandomForestRegressor)
+        self.assertEqual(10, model.estimator.n_estimators)
+        self.assertEqual(Lasso(alpha=0.5).get_params(), build_model('Lasso(alpha=0.5)').get_params())
+        self.assertIsInstance(build_model('Lasso'), Lasso)
+        # Objects are returned as is
+        model = Lasso()
+        self.assertIs(model, build_model(model))
+
+    def test_model_strings_are_not_evaluated(self):
+        for spec in ["__import__('os').getcwd()", "Lasso(alpha=abs(-1))", "UnknownModel()"]:
+            with self.assertRaises(ValueError):
+                build_model(spec)
+
+    def test_register_model(self):
+        register_model('MyLasso', 'sklearn.linear_model', 'Lasso')
+        self.assertIsInstance(build_model('MyLasso(alpha=2.)'), Lasso)
+
+    def test_parse_param_grid(self):
+        np.testing.assert_allclose(np.linspace(0.3, 1, 3), parse_param_values({'linspace': [0.3, 1, 3]}))
+        self.assertEqual([1, 3, 5], parse_param_values({'range': {'start': 1, 'stop': 6, 'step': 2}}))
+        self.assertEqual({'max_iter': [10000], 'tol': [1e-4, 1e-3]},
+                         parse_param_grid({'max_iter': [10000], 'tol': [1e-4, 1e-3]}))
+        for values in ['np.linspace(0.3, 1, 3)', {'normal': [0, 1]}]:
+            with self.assertRaises(ValueError):
+                parse_param_values(values)
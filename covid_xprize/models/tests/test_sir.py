@@ -0,0 +1,84 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import unittest
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+from covid_xprize.models.sir import sir_new_cases, fit_sir, fit_sir_windows
+
+NB_DAYS = 14
+
+
+def sir_ode(t, x, N, beta, gamma):
+    S, I = x
+    return -beta * S * I / N, beta * S * I / N - gamma * I
+
+
+class TestSIR(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.N = rng.uniform(1e5, 1e8, 20)
+        self.I0 = rng.uniform(1, 1e4, 20)
+        self.S0 = self.N - self.I0 - rng.uniform(0, 1e5, 20)
+        self.beta = rng.uniform(0, 2, 20)
+        self.gamma = rng.uniform(0, 1, 20)
+
+    def test_sir_new_cases(self):
+        new_cases = sir_new_cases(self.S0, self.I0, self.N, self.beta, self.gamma, NB_DAYS)
+        for i in range(len(self.N)):
+            sol = solve_ivp(sir_ode, [0, NB_DAYS], (self.S0[i], self.I0[i]), t_eval=np.arange(NB_DAYS + 1),
+                            args=(self.N[i], self.beta[i], self.gamma[i]), rtol=1e-10, atol=1e-6)
+            np.testing.assert_allclose(-np.diff(sol.y[0]), new_cases[i], rtol=1e-2, atol=1e-2)
+
+    def test_jacobian(self):
+        _, jac = sir_new_cases(self.S0, self.I0, self.N, self.beta, self.gamma, NB_DAYS, jacobian=True)
+        eps = 1e-6
+        for k, (d_beta, d_gamma) in enumerate([(eps, 0), (0, eps)]):
+            finite_diff = (sir_new_cases(self.S0, self.I0, self.N, self.beta + d_beta, self.gamma + d_gamma, NB_DAYS) -
+                           sir_new_cases(self.S0, self.I0, self.N, self.beta - d_beta, self.gamma - d_gamma, NB_DAYS))
+            np.testing.assert_allclose(finite_diff / (2 * eps), jac[..., k], rtol=1e-2, atol=1e-2)
+
+    def test_fit_sir(self):
+        gamma = np.minimum(self.gamma, 0.5)
+        new_cases = sir_new_cases(self.S0, self.I0, self.N, self.beta, gamma, NB_DAYS)
+        params = fit_sir(self.S0, self.I0, self.N, new_cases, 0.6, 1 / 7)
+        np.testing.assert_allclose(np.stack([self.beta, gamma], axis=1), params, atol=1e-3)
+
+    def test_fit_sir_windows(self):
+        rng = np.random.RandomState(7)
+        geo_cases = [np.round(50 * np.exp(0.03 * np.arange(n)) * rng.uniform(0.8, 1.2, n)) for n in [40, 25]]
+        # The first geo has no case for 20 days
+        geo_cases[0][:20] = 0
+        cases = np.concatenate(geo_cases)
+        population = np.full(len(cases), 1e6)
+        beta, gamma, predicted_cases, _ = fit_sir_windows(cases, population, [0, 40, 65], semi_fit=3,
+                                                          infection_days=7, beta_i=0.6, gamma_i=1 / 7)
+        # Each geo is fitted on its own: same results as fitting the geos one by one
+        second_geo = fit_sir_windows(geo_cases[1], population[40:], [0, 25], 3, 7, 0.6, 1 / 7)
+        np.testing.assert_array_equal(second_geo[0], beta[40:])
+        np.testing.assert_array_equal(second_geo[2], predicted_cases[40:])
+        # Windows need at least 1 infected individual, and semi_fit days before and after them
+        fitted_days = np.flatnonzero(~np.isnan(beta[:40]))
+        self.assertEqual(list(range(23, 37)), list(fitted_days))
+        self.assertTrue(np.isnan(gamma[:40][np.isnan(beta[:40])]).all())
+        # Days that are not fitted keep their observed cases
+        np.testing.assert_array_equal(cases[:23], predicted_cases[:23])
+
+    def test_incremental_fit_sir_windows(self):
+        rng = np.random.RandomState(11)
+        cases = np.round(50 * np.exp(0.03 * np.arange(60)) * rng.uniform(0.8, 1.2, 60))
+        population = np.full(60, 1e6)
+        full_fit = fit_sir_windows(cases, population, [0, 60], 3, 7, 0.6, 1 / 7)
+        # 5 new days of data
+        previous_fit = fit_sir_windows(cases[:55], population[:55], [0, 55], 3, 7, 0.6, 1 / 7)
+        previous_fit = tuple(np.r_[values, np.full(5, np.nan)] for values in previous_fit)
+        # The last window fitted before, which didn't predict the day after it, is refitted too
+        start_day = 55 - 3 - 1
+        incremental_fit = fit_sir_windows(cases, population, [0, 60], 3, 7, 0.6, 1 / 7,
+                                          start_days=[start_day], previous_fit=previous_fit)
+        for previous_values, values in zip(previous_fit, incremental_fit):
+            np.testing.assert_array_equal(previous_values[:start_day], values[:start_day])
+        for full_values, values in zip(full_fit, incremental_fit):
+            np.testing.assert_allclose(full_values, values, rtol=1e-3)
@@ -0,0 +1,56 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid_xprize.models.sir_cache import data_digest, cache_key, load_parameters, save_parameters
+
+SETTINGS = {'moving_average': True, 'infection_days': 7, 'semi_fit': 3, 'beta_i': 0.6, 'gamma_i': 1 / 7}
+
+
+def make_pars_df():
+    df = pd.DataFrame({'GeoID': pd.Categorical(['A', 'A', 'B']),
+                       'Date': pd.date_range('2020-03-01', periods=3),
+                       'Population': [1e6, 1e6, 2e6],
+                       'MA': [1., 2., np.nan],
+                       'beta': [0.5, np.nan, 0.7],
+                       'gamma': [0.1, np.nan, 0.2]},
+                      index=[10, 11, 5])
+    return df
+
+
+class TestSIRCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_data_digest(self):
+        df = make_pars_df()
+        columns = ['GeoID', 'Date', 'Population', 'MA']
+        digest = data_digest(df, columns)
+        # Independent of the index, of the other columns and of the dtype of the names
+        same_df = df.reset_index(drop=True).drop(columns=['beta'])
+        same_df['GeoID'] = same_df['GeoID'].astype(str)
+        self.assertEqual(digest, data_digest(same_df, columns))
+        df.loc[11, 'MA'] = 3.
+        self.assertNotEqual(digest, data_digest(df, columns))
+
+    def test_cache_key(self):
+        key = cache_key('digest', SETTINGS)
+        self.assertEqual(key, cache_key('digest', {**SETTINGS, 'semi_fit': np.int64(3)}))
+        self.assertNotEqual(key, cache_key('digest', {**SETTINGS, 'semi_fit': 4}))
+        self.assertNotEqual(key, cache_key('other digest', SETTINGS))
+
+    def test_save_and_load(self):
+        df_pars = make_pars_df()
+        key = cache_key(data_digest(df_pars, ['GeoID', 'Date', 'Population', 'MA']), SETTINGS)
+        self.assertIsNone(load_parameters(key, self.cache_dir))
+        save_parameters(df_pars, key, self.cache_dir)
+        pd.testing.assert_frame_equal(df_pars, load_parameters(key, self.cache_dir))
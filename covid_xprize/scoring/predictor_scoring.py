@@ -1,6 +1,14 @@
 # Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
 
-from covid_xprize.examples.predictors.lstm.xprize_predictor import XPrizePredictor
+import numpy as np
+import pandas as pd
+
+from covid_xprize.datasets import population
+
+# Columns identifying the cumulative errors of a predictor
+ID_COLUMNS = ["GeoID", "PredictorName"]
+# Order of the rows of the ranking_df
+RANKING_SORT_COLUMNS = ["CountryName", "RegionName", "Date", "Cumul-7DMA-MAE-per-100K"]
 
 
 def add_predictor_performance_columns(ranking_df):
@@ -47,24 +55,100 @@ def add_predictor_performance_columns(ranking_df):
         # is considered better than the other. Rounding here avoids floating point
         # equality errors when comparing the CumulDiff7DMA of predictors that have
         # predicted the exact same number of daily cases.
-        ranking_df['PredictorRank'] = ranking_df.round().groupby(
-            ["GeoID", "Date"])['CumulDiff7DMA'].rank(method='average')
+        ranking_df['PredictorRank'] = _rank_predictors(ranking_df)
 
         # Sort by 7 days moving average mae per 100K
-        ranking_df.sort_values(by=["CountryName",
-                                   "RegionName",
-                                   "Date",
-                                   "Cumul-7DMA-MAE-per-100K"],
-                               inplace=True)
+        ranking_df.sort_values(by=RANKING_SORT_COLUMNS, inplace=True)
 
         return ranking_df
 
 
-def add_population_column(df):
+def _rank_predictors(ranking_df):
+    # Rank of each predictor for each geo and day, on the CumulDiff7DMA rounded to the nearest case
+    return ranking_df['CumulDiff7DMA'].round().groupby(
+        [ranking_df["GeoID"], ranking_df["Date"]]).rank(method='average')
+
+
+class PredictorRanking:
     """
-    Add population column to df in order to compute performance per 100K of population.
+    Incremental version of add_predictor_performance_columns, for predictions scored day after day.
+    The cumulative 7DMA error of each (GeoID, PredictorName) is kept, so that adding new days only computes the
+    errors of the new rows, and only ranks the predictors of the (GeoID, Date) pairs of the new rows.
+    The new rows of a (GeoID, PredictorName) must be for later dates than its rows already added.
     """
 
-    pop_df = XPrizePredictor._load_additional_context_df()
-    return df.merge(pop_df[['GeoID', 'Population']], on=['GeoID'], how='left', suffixes=('', '_y'))
+    def __init__(self):
+        # The DataFrames of rows added, and the indexes of the ones holding rows of each Date
+        self._chunks = []
+        self._date_chunks = {}
+        self._sorted_ranking_df = None
+        # Last Date and CumulDiff7DMA of each (GeoID, PredictorName)
+        self._last_df = pd.DataFrame({'Date': pd.Series(dtype='datetime64[ns]'),
+                                      'CumulDiff7DMA': pd.Series(dtype=float)},
+                                     index=pd.MultiIndex.from_arrays([[], []], names=ID_COLUMNS))
+
+    @property
+    def ranking_df(self):
+        """
+        The rows added so far with their performance columns, sorted as by add_predictor_performance_columns.
+        Concatenated and sorted once after each add, on first access.
+        """
+        if self._sorted_ranking_df is None and self._chunks:
+            self._sorted_ranking_df = pd.concat(self._chunks).sort_values(by=RANKING_SORT_COLUMNS)
+        return self._sorted_ranking_df
+
+    def add(self, new_df):
+        """
+        Adds new rows, with the columns required by add_predictor_performance_columns, and computes their performance
+        columns. The ranks of the predictors already added for the same (GeoID, Date) are updated.
+        :param new_df: a DataFrame of new days of predictions
+        :return: the new rows, with their performance columns
+        """
+        self._sorted_ranking_df = None
+        new_df = new_df.sort_values(by=ID_COLUMNS + ['Date'], kind='mergesort')
+        new_df['DiffDaily'] = (new_df["ActualDailyNewCases"] - new_df["PredictedDailyNewCases"]).abs()
+        new_df['Diff7DMA'] = (new_df["ActualDailyNewCases7DMA"] - new_df["PredictedDailyNewCases7DMA"]).abs()
+
+        # Continue the cumulative sums from the last day added for each (GeoID, PredictorName)
+        keys = pd.MultiIndex.from_frame(new_df[ID_COLUMNS])
+        last_df = self._last_df.reindex(keys)
+        if (new_df['Date'].values <= last_df['Date'].values).any():
+            raise ValueError("New rows must be for later dates than the rows already added for the same "
+                             "GeoID and PredictorName")
+        new_df['CumulDiff7DMA'] = (new_df.groupby(ID_COLUMNS, sort=False)['Diff7DMA'].cumsum() +
+                                   last_df['CumulDiff7DMA'].fillna(0).values)
+        new_df['Cumul-7DMA-MAE-per-100K'] = new_df['CumulDiff7DMA'] / (new_df['Population'] / 100000.)
+        last_rows = new_df.groupby(ID_COLUMNS, sort=False)[['Date', 'CumulDiff7DMA']].last()
+        self._last_df = pd.concat([self._last_df[~self._last_df.index.isin(last_rows.index)], last_rows])
+
+        # Rank the predictors of the (GeoID, Date) pairs of the new rows, with the ones already added for them.
+        # Only the chunks holding rows of the new dates are looked at: usually none, or the last one.
+        new_dates = new_df['Date'].unique()
+        chunk_indexes = sorted({i for date in new_dates for i in self._date_chunks.get(date, [])})
+        geo_dates = pd.MultiIndex.from_frame(new_df[['GeoID', 'Date']])
+        affected = []
+        for i in chunk_indexes:
+            chunk = self._chunks[i]
+            rows = chunk['Date'].isin(new_dates).values
+            rows[rows] = pd.MultiIndex.from_frame(chunk.loc[rows, ['GeoID', 'Date']]).isin(geo_dates)
+            affected.append((chunk, rows))
+        new_df['PredictorRank'] = np.nan
+        ranks = _rank_predictors(pd.concat([chunk[rows] for chunk, rows in affected] + [new_df])).values
+        start = 0
+        for chunk, rows in affected:
+            end = start + rows.sum()
+            chunk.loc[rows, 'PredictorRank'] = ranks[start:end]
+            start = end
+        new_df['PredictorRank'] = ranks[start:]
+
+        for date in new_dates:
+            self._date_chunks.setdefault(date, []).append(len(self._chunks))
+        self._chunks.append(new_df)
+        return new_df
 
+
+def add_population_column(df):
+    """
+    Add population column to df in order to compute performance per 100K of population.
+    """
+    return population.add_population_column(df)
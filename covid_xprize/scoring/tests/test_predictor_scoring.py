@@ -0,0 +1,64 @@
+# Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid_xprize.scoring.predictor_scoring import add_predictor_performance_columns, PredictorRanking
+
+DATES = pd.date_range('2020-08-01', periods=20)
+
+
+def make_ranking_df(predictor_names, dates, seed=42):
+    rng = np.random.RandomState(seed)
+    dfs = []
+    for geo, (country, region, population) in enumerate([('Italy', np.nan, 60e6), ('Italy', 'Lazio', 5.8e6),
+                                                         ('Spain', np.nan, 47e6)]):
+        for name in predictor_names:
+            actual = rng.randint(0, 1000, len(dates)).astype(float)
+            # Predictors with the same predictions tie
+            predicted = actual + (rng.randint(-100, 100, len(dates)) if name != 'Tied' else 50)
+            dfs.append(pd.DataFrame({'PredictorName': name,
+                                     'GeoID': f"{country}__{region}",
+                                     'CountryName': country,
+                                     'RegionName': region,
+                                     'Population': population,
+                                     'Date': dates,
+                                     'ActualDailyNewCases': actual,
+                                     'PredictedDailyNewCases': predicted,
+                                     'ActualDailyNewCases7DMA': actual,
+                                     'PredictedDailyNewCases7DMA': predicted}))
+    return pd.concat(dfs, ignore_index=True)
+
+
+class TestPredictorScoring(unittest.TestCase):
+
+    def test_incremental_ranking(self):
+        ranking_df = make_ranking_df(['A', 'B', 'Tied'], DATES)
+        expected = add_predictor_performance_columns(ranking_df.copy())
+        ranking = PredictorRanking()
+        for days in [DATES[:5], DATES[5:6], DATES[6:]]:
+            ranking.add(ranking_df[ranking_df.Date.isin(days)])
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True),
+                                      ranking.ranking_df[expected.columns].reset_index(drop=True))
+
+    def test_new_predictor(self):
+        ranking_df = make_ranking_df(['A', 'B'], DATES)
+        new_df = make_ranking_df(['C'], DATES[10:], seed=7)
+        expected = add_predictor_performance_columns(pd.concat([ranking_df, new_df]))
+        ranking = PredictorRanking()
+        for days in [DATES[:12], DATES[12:15], DATES[15:]]:
+            ranking.add(ranking_df[ranking_df.Date.isin(days)])
+        # The ranks of A and B are updated for the days C is added, in all the chunks they were added in
+        new_rows = ranking.add(new_df)
+        self.assertEqual(len(new_df), len(new_rows))
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True),
+                                      ranking.ranking_df[expected.columns].reset_index(drop=True))
+
+    def test_past_days(self):
+        ranking_df = make_ranking_df(['A'], DATES)
+        ranking = PredictorRanking()
+        ranking.add(ranking_df)
+        with self.assertRaises(ValueError):
+            ranking.add(ranking_df[ranking_df.Date == DATES[-1]])
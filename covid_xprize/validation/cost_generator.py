@@ -34,8 +34,8 @@ def generate_costs(distribution='ones'):
 
     df = get_raw_data(DATA_FILE, latest=False)
 
-    # Reduce df to one row per geo
-    df = df.groupby(['CountryName', 'RegionName']).mean().reset_index()
+    # Reduce df to one row per geo, sorted: observed=True doesn't sort groups of several categorical keys
+    df = df.groupby(['CountryName', 'RegionName'], observed=True).mean().sort_index().reset_index()
 
     # Reduce to geo id info
     df = df[['CountryName', 'RegionName']]
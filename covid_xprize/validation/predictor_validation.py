@@ -6,6 +6,8 @@ from typing import List
 import numpy as np
 import pandas as pd
 
+from covid_xprize.datasets.oxford import geo_id
+
 PREDICTED_DAILY_NEW_CASES = "PredictedDailyNewCases"
 
 COLUMNS = {"CountryName",
@@ -34,10 +36,11 @@ def validate_submission(start_date: str,
                           encoding="ISO-8859-1",
                           dtype={"RegionName": str},
                           error_bad_lines=True)
+    # Only the geos of the intervention plan are needed
     ip_df = pd.read_csv(ip_file,
-                        parse_dates=['Date'],
+                        usecols=['CountryName', 'RegionName'],
                         encoding="ISO-8859-1",
-                        dtype={"RegionName": str},
+                        dtype={"CountryName": 'category', "RegionName": 'category'},
                         error_bad_lines=True)
 
     all_errors = []
@@ -89,26 +92,50 @@ def _check_geos(ip_df, pred_df):
 
 def _add_geoid_column(df):
     # Add GeoID column that combines CountryName and RegionName for easier manipulation of data
-    # np.where usage: if A then B else C
-    df["GeoID"] = np.where(df["RegionName"].isnull(),
-                           df["CountryName"],
-                           df["CountryName"] + ' / ' + df["RegionName"])
+    # CountryName alone if there is no RegionName
+    df["GeoID"] = geo_id(df, separator=' / ', no_region=None)
 
 
 def _check_days(start_date, end_date, df):
-    errors = []
     _add_geoid_column(df)
-    # Sort by geo and date
-    df.sort_values(by=["GeoID", "Date"], inplace=True)
+    return _check_geo_dates(start_date, end_date, df.GeoID.values, df.Date.values)
+
+
+def _check_geo_dates(start_date, end_date, geo_ids, dates):
+    """
+    Checks each geo has one row per date from start_date to end_date.
+    :param geo_ids: the Categorical GeoID of each row
+    :param dates: the datetime64 Date of each row
+    :return: a list of error messages, grouped by geo in the order of the categories of geo_ids
+    """
+    errors = []
     # Convert the dates
     start_date = pd.to_datetime(start_date, format='%Y-%m-%d')
     end_date = pd.to_datetime(end_date, format='%Y-%m-%d')
     num_days = (end_date - start_date).days + 1
+    # Sort by geo and date, with the rows without geo last, as sort_values does
+    categories = geo_ids.categories
+    geo_codes = geo_ids.codes.astype(np.int64)
+    geo_codes[geo_codes < 0] = len(categories)
+    dates = np.asarray(dates).astype('datetime64[ns]')
+    order = np.lexsort((dates, geo_codes))
+    geo_codes, dates = geo_codes[order], dates[order]
+    geo_starts = np.flatnonzero(np.r_[True, geo_codes[1:] != geo_codes[:-1]]) if len(order) else np.array([], int)
+    geo_lengths = np.diff(np.r_[geo_starts, len(order)])
+    # Compare the dates of all the geos to the expected ones at once: position i of a geo is start_date + i days
+    positions = np.arange(len(order)) - np.repeat(geo_starts, geo_lengths)
+    mismatches = (positions >= num_days) | (dates != np.datetime64(start_date, 'ns') +
+                                            positions.astype('timedelta64[D]'))
+    failed = geo_lengths != num_days
+    if len(order):
+        failed |= np.logical_or.reduceat(mismatches, geo_starts)
+    # Detail the dates of the geos that failed only
     expected_dates = [start_date + pd.offsets.Day(i) for i in range(num_days)]
-    # Get the geo names
-    geo_ids = list(df.GeoID.unique())
-    for geo_id in geo_ids:
-        pred_dates = df[df.GeoID == geo_id].Date
+    for geo_start, geo_length in zip(geo_starts[failed], geo_lengths[failed]):
+        geo_code = geo_codes[geo_start]
+        geo_id = categories[geo_code] if geo_code < len(categories) else np.nan
+        # Rows without geo don't match themselves
+        pred_dates = pd.DatetimeIndex(dates[geo_start:geo_start + geo_length] if geo_code < len(categories) else [])
         for expected_date, pred_date in itertools.zip_longest(expected_dates, pred_dates, fillvalue=None):
             if not expected_date == pred_date:
                 errors.append(f"{geo_id}: Expected prediction for date "
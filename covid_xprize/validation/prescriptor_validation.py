@@ -2,13 +2,17 @@
 
 from typing import List
 
+import numpy as np
 import pandas as pd
 
+from covid_xprize.datasets.oxford import geo_id
 from covid_xprize.validation.scenario_generator import ID_COLS, NPI_COLUMNS
-from covid_xprize.validation.predictor_validation import _check_columns, _check_geos, _check_days
+from covid_xprize.validation.predictor_validation import _check_columns, _check_geo_dates
 
 PRESCRIPTION_INDEX_COL = "PrescriptionIndex"
 COLUMNS = ID_COLS + NPI_COLUMNS + ["PrescriptionIndex"]
+# Number of rows of the submission files read at once
+CHUNK_SIZE = 100000
 
 IP_MAX_VALUES = {
     'C1_School closing': 3,
@@ -29,55 +33,131 @@ IP_MAX_VALUES = {
 def validate_submission(start_date: str,
                         end_date: str,
                         ip_file: str,
-                        submission_file: str) -> List[str]:
+                        submission_file: str,
+                        chunk_size: int = CHUNK_SIZE) -> List[str]:
     """
     Checks a prescription submission file is valid.
+    The file is read in chunks of chunk_size rows, in a single pass: only the GeoID code, Date and PrescriptionIndex
+    of each row, and the NaN, min and max of each NPI of each prescription, are kept to check all the prescriptions.
     Args:
         start_date: the submission start date as a string, format YYYY-MM-DDD
         end_date: the submission end date as a string, format YYYY-MM-DDD
         ip_file: path to a file-like object
         submission_file: path to a file-like object
+        chunk_size: number of rows of submission_file to read at once
 
     Returns: a list of string messages if errors were detected, an empty list otherwise
 
     """
-    presc_df = pd.read_csv(submission_file,
-                           parse_dates=['Date'],
-                           encoding="ISO-8859-1",
-                           dtype={"RegionName": str},
-                           error_bad_lines=True)
-    ip_df = pd.read_csv(ip_file,
-                        parse_dates=['Date'],
-                        encoding="ISO-8859-1",
-                        dtype={"RegionName": str},
-                        error_bad_lines=True)
+    header_df = pd.read_csv(submission_file, nrows=0, encoding="ISO-8859-1")
 
     all_errors = []
     # Check we got the expected columns
-    all_errors += _check_columns(set(COLUMNS), presc_df)
+    all_errors += _check_columns(set(COLUMNS), header_df)
     if not all_errors:
+        requested_geo_ids = _read_geo_ids(ip_file)
+        prescriptions = _read_prescriptions(submission_file, chunk_size)
+        # Check the IP values of all the prescriptions at once
+        ip_max_values = pd.Series(IP_MAX_VALUES)
+        has_nan = prescriptions['has_nan'][ip_max_values.index]
+        negative = prescriptions['min'][ip_max_values.index] < 0
+        too_high = prescriptions['max'][ip_max_values.index] > ip_max_values
         # For each individual prescription in the prescriptions file
-        prescription_indexes = presc_df.PrescriptionIndex.unique()
-        for i in prescription_indexes:
-            i_presc_df = presc_df[presc_df.PrescriptionIndex == i].copy()
+        for i, (geo_ids, dates) in prescriptions['rows'].items():
             # Columns are good, check we got prescriptions for each requested country / region
-            all_errors += _check_geos(ip_df, i_presc_df)
-            # Check the IP values
-            all_errors += _check_prescription_values(i_presc_df)
+            all_errors += _check_prescription_geos(requested_geo_ids, set(geo_ids.unique()))
+            # Report the invalid IP values
+            all_errors += _prescription_values_errors(has_nan.loc[i], negative.loc[i], too_high.loc[i])
             # Check the prediction dates are correct
-            all_errors += _check_days(start_date, end_date, i_presc_df)
+            all_errors += _check_geo_dates(start_date, end_date, geo_ids, dates)
 
     return all_errors
 
 
-def _check_prescription_values(df):
-    # For each IP column, check the values are valid
+def _read_geo_ids(ip_file):
+    """
+    Returns the set of the GeoIDs of the intervention plan file
+    """
+    geos_df = pd.read_csv(ip_file,
+                          usecols=['CountryName', 'RegionName'],
+                          encoding="ISO-8859-1",
+                          dtype={"CountryName": 'category', "RegionName": 'category'},
+                          error_bad_lines=True)
+    return set(pd.Series(geo_id(geos_df, separator=' / ', no_region=None)).unique())
+
+
+def _read_prescriptions(submission_file, chunk_size):
+    """
+    Reads the prescriptions of submission_file, chunk_size rows at a time.
+    Returns a dict with:
+        rows: PrescriptionIndex -> Categorical GeoIDs and Dates of its rows, in order of first appearance
+        has_nan, min, max: DataFrames of the NaN, min and max of each NPI, indexed by PrescriptionIndex
+    """
+    geo_codes = {}
+    indexes, codes, dates, stats = [], [], [], []
+    chunks = pd.read_csv(submission_file,
+                         usecols=COLUMNS,
+                         encoding="ISO-8859-1",
+                         dtype={"CountryName": 'category', "RegionName": 'category'},
+                         error_bad_lines=True,
+                         chunksize=chunk_size)
+    for chunk in chunks:
+        # GeoIDs are built once per country / region of the chunk, and numbered once per file
+        chunk_geo_ids = geo_id(chunk, separator=' / ', no_region=None)
+        for category in chunk_geo_ids.categories:
+            geo_codes.setdefault(category, len(geo_codes))
+        category_codes = np.array([geo_codes[category] for category in chunk_geo_ids.categories] + [-1])
+        codes.append(category_codes[chunk_geo_ids.codes])
+        indexes.append(chunk[PRESCRIPTION_INDEX_COL].values)
+        dates.append(pd.to_datetime(chunk['Date']).values)
+        # NaN, min and max of the NPIs of each prescription of the chunk
+        npis = chunk[NPI_COLUMNS]
+        by_index = dict(by=chunk[PRESCRIPTION_INDEX_COL], sort=False, dropna=False)
+        stats.append(pd.concat({'has_nan': npis.isnull().groupby(**by_index).any(),
+                                'min': npis.groupby(**by_index).min(),
+                                'max': npis.groupby(**by_index).max()}, axis=1))
+    if not indexes:
+        empty_df = pd.DataFrame(columns=NPI_COLUMNS)
+        return {'rows': {}, 'has_nan': empty_df, 'min': empty_df, 'max': empty_df}
+
+    indexes, codes, dates = np.concatenate(indexes), np.concatenate(codes), np.concatenate(dates)
+    # Sorted categories, so that the geos are checked in the order of their names
+    categories = sorted(geo_codes)
+    sorted_codes = np.empty(len(categories) + 1, dtype=int)
+    sorted_codes[[geo_codes[category] for category in categories]] = np.arange(len(categories))
+    # Rows without geo keep code -1, the last entry
+    sorted_codes[-1] = -1
+    codes = sorted_codes[codes]
+    stats = pd.concat(stats).groupby(level=0, sort=False, dropna=False)
+    prescriptions = {'has_nan': stats.any()['has_nan'], 'min': stats.min()['min'], 'max': stats.max()['max']}
+    # Rows of each prescription, in order of first appearance, with a single sort
+    index_values, first_rows, index_codes = np.unique(indexes, return_index=True, return_inverse=True)
+    order = np.argsort(index_codes, kind='stable')
+    boundaries = np.r_[0, np.cumsum(np.bincount(index_codes, minlength=len(index_values)))]
+    prescriptions['rows'] = {}
+    for k in np.argsort(first_rows):
+        rows = order[boundaries[k]:boundaries[k + 1]]
+        prescriptions['rows'][index_values[k]] = (pd.Categorical.from_codes(codes[rows], categories), dates[rows])
+    return prescriptions
+
+
+def _check_prescription_geos(requested_geo_ids, actual_geo_ids):
+    errors = []
+    # Additional geos are OK, but prescriptions should at least include requested ones
+    missing_geos = requested_geo_ids - actual_geo_ids
+    if missing_geos:
+        errors.append(f"Missing countries / regions: {missing_geos}")
+    return errors
+
+
+def _prescription_values_errors(has_nan, negative, too_high):
+    # For each IP column, report the checks that failed
     errors = []
-    for ip_name, ip_max_value in IP_MAX_VALUES.items():
-        if df[ip_name].isnull().values.any():
+    for ip_name in IP_MAX_VALUES:
+        if has_nan[ip_name]:
             errors.append(f"Column {ip_name} contains NaN values")
-        if df[ip_name].min() < 0:
+        if negative[ip_name]:
             errors.append(f"Column {ip_name} contains negative values")
-        if df[ip_name].max() > ip_max_value:
+        if too_high[ip_name]:
             errors.append(f"Column {ip_name} contains values higher than max possible value")
     return errors
@@ -1,12 +1,12 @@
 # Copyright 2020 (c) Cognizant Digital Business, Evolutionary AI. All rights reserved. Issued under the Apache 2.0 License.
 import os
-import urllib.request
 
 import numpy as np
 import pandas as pd
 
-# See https://github.com/OxCGRT/covid-policy-tracker
-DATA_URL = "https://raw.githubusercontent.com/OxCGRT/covid-policy-tracker/master/data/OxCGRT_latest.csv"
+from covid_xprize.datasets.oxford import load_oxford_data, fill_missing_npis
+from covid_xprize.datasets.snapshots import DATA_URL, copy_snapshot, download_snapshot
+
 ID_COLS = ['CountryName',
            'RegionName',
            'Date']
@@ -28,29 +28,30 @@ MAX_NPIS = [3, 3, 2, 4, 2, 3, 2, 4, 2, 3, 2, 4]  # Sum is 34
 INCEPTION_DATE = pd.to_datetime("2020-01-01", format='%Y-%m-%d')
 
 
-def get_raw_data(cache_file, latest=True):
+def get_raw_data(cache_file, latest=False):
     """
     Returns the raw data from which to generate scenarios.
     Args:
         cache_file: the file to use to cache the data
-        latest: True to force a download of the latest data and update cache_file,
-                False to get the data from cache_file
+        latest: True to download a new snapshot of the latest data and update cache_file,
+                False to get the data from cache_file, copied from the most recent local snapshot if it doesn't exist.
+                The network is only used when latest is True.
 
     Returns: a Pandas DataFrame
 
     """
-    # Download and cache the raw data file if it doesn't exist
+    if latest:
+        download_snapshot()
+    # Cache the raw data file from the local snapshots if it doesn't exist
     if not os.path.exists(cache_file) or latest:
-        urllib.request.urlretrieve(DATA_URL, cache_file)
-    latest_df = pd.read_csv(cache_file,
-                            parse_dates=['Date'],
-                            encoding="ISO-8859-1",
-                            dtype={"RegionName": str,
-                                   "RegionCode": str},
-                            error_bad_lines=False)
-    latest_df["RegionName"] = latest_df["RegionName"].fillna("")
+        copy_snapshot(cache_file)
+    latest_df = load_oxford_data(cache_file)
+    # "" sorts first, like the categories it's added to
+    region_names = latest_df["RegionName"].cat.add_categories("").cat.reorder_categories(
+        [""] + list(latest_df["RegionName"].cat.categories))
+    latest_df["RegionName"] = region_names.fillna("")
     # Fill any missing NPIs by assuming they are the same as previous day, or 0 if none is available
-    latest_df.update(latest_df.groupby(['CountryName', 'RegionName'])[NPI_COLUMNS].ffill().fillna(0))
+    latest_df[NPI_COLUMNS] = fill_missing_npis(latest_df, ['CountryName', 'RegionName'], NPI_COLUMNS)
     return latest_df
 
 
@@ -91,63 +92,92 @@ def generate_scenario(start_date_str, end_date_str, raw_df, countries=None, scen
         ips_df = ips_df[ips_df.CountryName.isin(countries)]
 
     # Fill any missing "supposedly known" NPIs by assuming they are the same as previous day, or 0 if none is available
-    for npi_col in NPI_COLUMNS:
-        ips_df.update(ips_df.groupby(['CountryName', 'RegionName'])[npi_col].ffill().fillna(0))
+    ips_df[NPI_COLUMNS] = fill_missing_npis(ips_df, ['CountryName', 'RegionName'], NPI_COLUMNS)
 
     if scenario == "Historical":
         return ips_df
 
-    for country in ips_df.CountryName.unique():
-        all_regions = ips_df[ips_df.CountryName == country].RegionName.unique()
-        for region in all_regions:
-            new_rows = []
-            ips_gdf = ips_df[(ips_df.CountryName == country) &
-                             (ips_df.RegionName == region)]
-            country_name = ips_gdf.iloc[0].CountryName
-            region_name = ips_gdf.iloc[0].RegionName
-            last_known_date = ips_gdf.Date.max()
-            # If the start date is not specified, start from the day after the last known date
-            if not start_date_str:
-                start_date = last_known_date + np.timedelta64(1, 'D')
-            # If the last known date is BEFORE the start date, start applying the scenario at last_known date
-            current_date = min(last_known_date + np.timedelta64(1, 'D'), start_date)
-            scenario_to_apply = 0
-            while current_date <= end_date:
-                new_row = [country_name, region_name, current_date]
-                if current_date < start_date:
-                    # We're before the scenario start date. Carry over last known NPIs
-                    npis = list(ips_gdf[ips_gdf.Date == last_known_date][NPI_COLUMNS].values[0])
-                else:
-                    # We are between start_date and end_date: apply the scenario
-                    if scenario == "MIN":
-                        npis = MIN_NPIS
-                    elif scenario == "MAX":
-                        npis = MAX_NPIS
-                    elif scenario == "Freeze":
-                        if start_date <= last_known_date:
-                            day_before_start = max(INCEPTION_DATE, start_date - np.timedelta64(1, 'D'))
-                            npis = list(ips_gdf[ips_gdf.Date == day_before_start][NPI_COLUMNS].values[0])
-                        else:
-                            npis = list(ips_gdf[ips_gdf.Date == last_known_date][NPI_COLUMNS].values[0])
-                    else:
-                        npis = scenario[scenario_to_apply]
-                        scenario_to_apply = scenario_to_apply + 1
-                new_row = new_row + npis
-                new_rows.append(new_row)
-                # Move to next day
-                current_date = current_date + np.timedelta64(1, 'D')
-            # Add the new rows
-            if new_rows:
-                new_rows_df = pd.DataFrame(new_rows, columns=ips_df.columns)
-                # Delete any old row that might have been replaced by a scenario one for this country / region
-                replaced_dates = list(new_rows_df["Date"].unique())
-                rows_to_drop = ips_df[(ips_df.CountryName == country) &
-                                      (ips_df.RegionName == region) &
-                                      (ips_df.Date.isin(replaced_dates)) == True]
-                ips_df.drop(rows_to_drop.index, axis=0, inplace=True)
-                # Append the new rows
-                ips_df = ips_df.append(new_rows_df)
-                # Sort
-                ips_df.sort_values(by=ID_COLS, inplace=True)
+    # Number each country / region in order of appearance
+    geo_groups = ips_df.groupby(['CountryName', 'RegionName'], sort=False, observed=True)
+    geo_codes = geo_groups.ngroup().values
+    nb_geos = geo_groups.ngroups
+    geo_names_df = ips_df[['CountryName', 'RegionName']].iloc[_first_positions(geo_codes, nb_geos)]
+    dates = ips_df.Date.values
+    npis = ips_df[NPI_COLUMNS].values
+
+    # Last known NPIs of each geo
+    last_known_dates = geo_groups.Date.max().values
+    last_known_npis = _npis_on_dates(npis, geo_codes, dates == last_known_dates[geo_codes], nb_geos)
+    # If the start date is not specified, start from the day after the last known date
+    day_after_last_known_dates = last_known_dates + np.timedelta64(1, 'D')
+    if not start_date_str:
+        geo_start_dates = day_after_last_known_dates
+    else:
+        geo_start_dates = np.full(nb_geos, start_date.to_datetime64())
+    # If the last known date is BEFORE the start date, start applying the scenario at last_known date
+    first_dates = np.minimum(day_after_last_known_dates, geo_start_dates)
+    nb_new_days = np.maximum((end_date.to_datetime64() - first_dates) // np.timedelta64(1, 'D') + 1, 0)
+    if nb_new_days.sum() == 0:
+        return ips_df
+
+    # One new row per geo and day between its first date and end_date, included
+    new_geo_codes = np.repeat(np.arange(nb_geos), nb_new_days)
+    new_day_indexes = np.arange(len(new_geo_codes)) - np.repeat(np.cumsum(nb_new_days) - nb_new_days, nb_new_days)
+    new_dates = first_dates[new_geo_codes] + new_day_indexes * np.timedelta64(1, 'D')
+    # Before the scenario start date, carry over last known NPIs
+    new_npis = last_known_npis[new_geo_codes]
+    # Between start_date and end_date, apply the scenario
+    in_scenario = new_dates >= geo_start_dates[new_geo_codes]
+    if scenario == "MIN":
+        new_npis[in_scenario] = MIN_NPIS
+    elif scenario == "MAX":
+        new_npis[in_scenario] = MAX_NPIS
+    elif scenario == "Freeze":
+        if start_date_str:
+            day_before_start = max(INCEPTION_DATE, start_date - np.timedelta64(1, 'D'))
+            frozen_npis = _npis_on_dates(npis, geo_codes, dates == day_before_start.to_datetime64(), nb_geos)
+            # Geos whose last known date is before the start date keep their last known NPIs
+            use_frozen = geo_start_dates <= last_known_dates
+            frozen_npis[~use_frozen] = last_known_npis[~use_frozen]
+            new_npis[in_scenario] = frozen_npis[new_geo_codes[in_scenario]]
+    else:
+        # Day of the scenario to apply: the scenario starts on each geo's start date
+        nb_carried_over_days = (geo_start_dates - first_dates) // np.timedelta64(1, 'D')
+        scenario_day_indexes = new_day_indexes - nb_carried_over_days[new_geo_codes]
+        new_npis[in_scenario] = np.asarray(scenario)[scenario_day_indexes[in_scenario]]
+
+    new_rows_df = pd.DataFrame({'CountryName': geo_names_df.CountryName.values[new_geo_codes],
+                                'RegionName': geo_names_df.RegionName.values[new_geo_codes],
+                                'Date': new_dates},
+                               index=new_day_indexes)
+    new_rows_df[NPI_COLUMNS] = new_npis
+    # Keep compact NPI dtypes, unless some geos have no NPIs to carry over
+    if not np.isnan(new_npis).any():
+        new_rows_df = new_rows_df.astype(ips_df[NPI_COLUMNS].dtypes.to_dict())
+
+    # Delete any old row that has been replaced by a scenario one, append the new rows and sort
+    replaced = (dates >= first_dates[geo_codes]) & (dates <= end_date.to_datetime64())
+    ips_df = pd.concat([ips_df[~replaced], new_rows_df])
+    ips_df.sort_values(by=ID_COLS, inplace=True)
 
     return ips_df
+
+
+def _first_positions(codes, nb_codes):
+    """
+    Returns the position of the first occurrence of each code in 0..nb_codes - 1 in codes.
+    """
+    positions = np.full(nb_codes, len(codes))
+    np.minimum.at(positions, codes, np.arange(len(codes)))
+    return positions
+
+
+def _npis_on_dates(npis, geo_codes, on_date, nb_geos):
+    """
+    Returns the NPIs of the first row of each geo for which on_date is True, NaN for geos without any such row.
+    """
+    rows = np.flatnonzero(on_date)
+    codes, first_rows = np.unique(geo_codes[rows], return_index=True)
+    geo_npis = np.full((nb_geos, npis.shape[1]), np.nan)
+    geo_npis[codes] = npis[rows[first_rows]]
+    return geo_npis
@@ -73,3 +73,11 @@ class TestPrescriptionValidation(unittest.TestCase):
     def test_multi_prescription_index(self):
         errors = validate_submission("2020-08-01", "2020-08-05", IP_FILE_FEW_COUNTRIES, MULTI_PRESC_INDEX)
         self.assertTrue(not errors, f"Unexpected errors: {errors}")
+
+    def test_chunked_reading(self):
+        # Prescriptions spanning several chunks are checked as a whole
+        for submission in [MULTI_PRESC_INDEX, BAD_DATES_SUBMISSION, INVALID_RANGE_SUBMISSION]:
+            errors = validate_submission("2020-08-01", "2020-08-05", IP_FILE_FEW_COUNTRIES, submission)
+            chunked_errors = validate_submission("2020-08-01", "2020-08-05", IP_FILE_FEW_COUNTRIES, submission,
+                                                 chunk_size=3)
+            self.assertEqual(errors, chunked_errors)
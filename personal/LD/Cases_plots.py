@@ -4,11 +4,12 @@ import pandas as pd
 import numpy as np
 import matplotlib.pylab as plt
 
+from covid_xprize.datasets.snapshots import load_snapshot
+
 
 # %%
 
-db = pd.read_csv("https://raw.githubusercontent.com/OxCGRT/covid-policy-tracker/master/data/OxCGRT_latest.csv",
-                 low_memory=False)
+db = load_snapshot(parse_dates=None, dtype=None, low_memory=False)
 
 db.sort_values(by=['CountryName', 'RegionName', 'Date'])
 
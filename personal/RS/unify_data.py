@@ -5,6 +5,8 @@ import pandas as pd
 import numpy as np
 import os
 
+from covid_xprize.datasets.snapshots import load_snapshot
+
 
 #We want to format italian data to the challenge format, so we make a Dataframe equal to the one of the challenge.
 
@@ -31,14 +33,8 @@ def to_final(challenge_df,region, district,total_cases,date):
 	 return final
 
 # Challenge dataframe
-print("Downloading challenge data...")
-DATA_URL = 'https://raw.githubusercontent.com/OxCGRT/covid-policy-tracker/master/data/OxCGRT_latest.csv'
-challenge_df = pd.read_csv(DATA_URL,
-                 parse_dates=['Date'],
-                 encoding="ISO-8859-1",
-                 dtype={"RegionName": str,
-                        "RegionCode": str},
-                 error_bad_lines=True)
+print("Loading challenge data...")
+challenge_df = load_snapshot(error_bad_lines=True)
 print("loaded")
 print("REGIONS:")
 print("Downloading data from Protezione Civile...")
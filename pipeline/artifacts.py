@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import pickle
+
+import numpy as np
+
+# Version of the manifest written by export_model
+ARTIFACT_VERSION = 1
+
+# Loaded models, keyed by path, with the modification time of the manifest they were loaded from
+_loaded_models = {}
+
+
+class LinearModelArtifact:
+    """
+    Linear model restored from its coefficients and intercept: predicts X @ coef.T + intercept,
+    as the sklearn linear model it was exported from.
+    """
+
+    def __init__(self, coef, intercept):
+        self.coef_ = coef
+        self.intercept_ = intercept
+
+    def predict(self, X):
+        return np.asarray(X) @ self.coef_.T + self.intercept_
+
+
+def is_linear_model(estimator):
+    """
+    Returns True if the predictions of estimator are X @ coef_.T + intercept_, as for LinearRegression and Lasso
+    """
+    from sklearn.linear_model._base import LinearModel
+    return (isinstance(estimator, LinearModel) and
+            isinstance(getattr(estimator, 'coef_', None), np.ndarray) and
+            hasattr(estimator, 'intercept_'))
+
+
+def export_model(estimator, models_output_dir, name, layout):
+    """
+    Saves a fitted model in models_output_dir as a JSON manifest, name.json, and a compact data file.
+    Linear models are saved as their coefficients and intercept in name.npz, other models are pickled to name.pkl.
+    layout describes the features the model was trained on (lookback_days, adj_cols_fixed, adj_cols_time...).
+    Returns the path of the manifest.
+    """
+    os.makedirs(models_output_dir, exist_ok=True)
+    manifest = {'version': ARTIFACT_VERSION,
+                'model': type(estimator).__name__,
+                'params': {param: repr(value) for param, value in estimator.get_params(deep=False).items()},
+                'layout': layout}
+    if is_linear_model(estimator):
+        manifest['format'] = 'linear'
+        manifest['file'] = name + '.npz'
+        np.savez(os.path.join(models_output_dir, manifest['file']),
+                 coef=estimator.coef_, intercept=np.asarray(estimator.intercept_))
+    else:
+        manifest['format'] = 'pickle'
+        manifest['file'] = name + '.pkl'
+        with open(os.path.join(models_output_dir, manifest['file']), 'wb') as model_file:
+            pickle.dump(estimator, model_file)
+
+    manifest_path = os.path.join(models_output_dir, name + '.json')
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest_path
+
+
+def read_manifest(path):
+    """
+    Returns the manifest saved by export_model, or None if path is a pickled model
+    """
+    if not path.endswith('.json'):
+        return None
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def check_layout(manifest, layout, path=''):
+    """
+    Raises a ValueError if the features a model was trained on, described by the layout of its manifest,
+    differ from the ones of layout. Only the entries in both layouts are compared.
+    """
+    differences = ['{} is {!r}, not {!r}'.format(key, manifest['layout'][key], layout[key])
+                   for key in layout if key in manifest['layout'] and manifest['layout'][key] != layout[key]]
+    if differences:
+        raise ValueError('{} was trained on other features: {}'.format(path or 'The model', ', '.join(differences)))
+
+
+def load_model(path):
+    """
+    Loads a model saved by export_model, from its manifest, or a pickled model such as a GridSearchCV.
+    Models are loaded once per process, and reloaded if their file changes.
+    """
+    mtime = os.path.getmtime(path)
+    if path in _loaded_models and _loaded_models[path][0] == mtime:
+        return _loaded_models[path][1]
+
+    manifest = read_manifest(path)
+    if manifest is None:
+        with open(path, 'rb') as model_file:
+            model = pickle.load(model_file)
+    else:
+        data_path = os.path.join(os.path.dirname(path), manifest['file'])
+        if manifest['format'] == 'linear':
+            with np.load(data_path) as data:
+                model = LinearModelArtifact(data['coef'], data['intercept'])
+        elif manifest['format'] == 'pickle':
+            with open(data_path, 'rb') as model_file:
+                model = pickle.load(model_file)
+        else:
+            raise ValueError('Unknown model format {} in {}'.format(manifest['format'], path))
+
+    _loaded_models[path] = (mtime, model)
+    return model
@@ -1,21 +1,40 @@
-from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.base import BaseEstimator, RegressorMixin, clone
 from sklearn.utils.validation import check_X_y, check_array, check_is_fitted
-from scipy.integrate import solve_ivp
 import numpy as np
 from tqdm import tqdm
-from scipy.optimize import curve_fit
 from functools import partial
 import multiprocessing as mp
+import os
+import pickle
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.linear_model import MultiTaskLassoCV , Lasso
 from sklearn.multioutput import MultiOutputRegressor
-import xgboost as xgb
+
+from covid_xprize.datasets.geo_series_store import GeoSeriesStore
+from covid_xprize.models.sir import fit_sir_windows, sir_new_cases
+from covid_xprize.models.registry import build_model
+from covid_xprize.models.sir_cache import SIR_CACHE_DIR, data_digest, cache_key, load_parameters, save_parameters
     
 def mae(pred, true):
     return np.mean(np.abs(pred - true))
 
 
+# Cases and population of the geos fitted by SIR_fitter.fit_shared, inherited by the forked workers without copies
+_shared_fit_data = {}
+
+
+def fit_sir_chunk(task):
+    '''
+    Fits the SIR parameters of a chunk of consecutive geos, whose cases and population are read from _shared_fit_data.
+    task: the offsets of the geos of the chunk in the shared data followed by its end, then semi_fit, infection_days,
+    beta_i and gamma_i
+    Returns a (4, nb_rows) array with the beta, gamma, predicted_cases and fit_cases of the rows of the chunk.
+    '''
+    offsets,semi_fit,infection_days,beta_i,gamma_i=task
+    rows=slice(offsets[0],offsets[-1])
+    cases,population=_shared_fit_data['data'][:,rows]
+    return np.stack(fit_sir_windows(cases,population,offsets-offsets[0],semi_fit,infection_days,beta_i,gamma_i))
+
+
 class SIR_fitter():
     ''' Class that use the features to extract SIR parameters. Fitted parameters will be keyed by country and date. 
     infected_days: days previous to day0 to sum the number of currently infected.
@@ -39,44 +58,22 @@ class SIR_fitter():
         self.tempone=np.linspace(0,10000,10001)
         
     def fit_country(self,df_country):
-        COL = ['NewCases'] if not self.moving_average else ['MA']
+        '''
+        Fits the SIR parameters of each day of one or more geos, whose rows must be grouped by geo and sorted by date.
+        The windows of all these geos are fitted together with the vectorized SIR integrator of covid_xprize.models.sir.
+        '''
+        COL = 'NewCases' if not self.moving_average else 'MA'
         gdf = df_country
-        gdf['beta']=np.nan
-        gdf['gamma']=np.nan
-        gdf['predicted_cases']=gdf[COL].copy()
-        all_case_data = np.array(gdf[COL])
-        target_cases = all_case_data.copy()
-        nb_total_days = len(gdf)
-        for d,(idx,row) in enumerate(gdf.iterrows()):
-            if d>self.semi_fit and d<(nb_total_days-self.semi_fit):
-                N=row.Population
-                # X_cases = all_case_data[d - self.semi_fit:d+self.semi_fit+1].reshape(-1)
-                X_true_cases = target_cases[d - self.semi_fit:d+self.semi_fit+1].reshape(-1)
-                I0=all_case_data[d-self.semi_fit- self.infection_days: 
-                                  d-self.semi_fit+1].sum()
-                Ic0=all_case_data[0:(d-self.semi_fit)+1].sum()
-                R0=Ic0-I0
-                S0=N-I0-R0
-                x0=(S0,I0,Ic0,R0)
-                time_integ=self.tempone[d-self.semi_fit:d+self.semi_fit+1].reshape(-1)
-                if I0<0:
-                    raise ValueError('Infected was {} for population {}'.format(x0[1],N))
-                elif I0<1:
-                    popt=np.array([np.nan,np.nan])
-                else:
-                    fintegranda=partial(self.__SIR_integrate,time_integ,x0,N)
-                    popt, pcov = curve_fit(fintegranda, time_integ, 
-                            X_true_cases[1:],
-                            p0=[self.beta_i,self.gamma_i],maxfev=5000,bounds=([0.,0.],
-                                                            [np.inf,1.]))
-                    gdf.loc[idx,'beta']=popt[0]
-                    gdf.loc[idx,'gamma']=popt[1]
-                
-                    if d < nb_total_days-self.semi_fit-1:
-                        fut_integ=self.tempone[d-self.semi_fit:d+self.semi_fit+2]
-                        all_case_data[d+self.semi_fit+1]=fintegranda(fut_integ,
-                                                                     popt[0],popt[1])[-1]
-                        gdf.loc[idx,'predicted_cases']=all_case_data[d+self.semi_fit]
+        geo_ids = np.asarray(gdf.GeoID)
+        geo_starts = np.flatnonzero(np.r_[True, geo_ids[1:] != geo_ids[:-1]])
+        offsets = np.r_[geo_starts, len(gdf)]
+        beta, gamma, predicted_cases, fit_cases = fit_sir_windows(gdf[COL].values, gdf.Population.values, offsets,
+                                                                  self.semi_fit, self.infection_days,
+                                                                  self.beta_i, self.gamma_i)
+        gdf['beta']=beta
+        gdf['gamma']=gamma
+        gdf['predicted_cases']=predicted_cases
+        gdf['fit_cases']=fit_cases
         return gdf
         
         
@@ -91,6 +88,7 @@ class SIR_fitter():
     
     def __SIR_integrate(self,ttotp,x0,N,ti,beta,gamma):
         ''' Argument ti not used but needed by curve_fit '''
+        from scipy.integrate import solve_ivp
         sol=solve_ivp(self.__SIR_ode,[ttotp[0],ttotp[-1]],x0,args=(N,beta,gamma),t_eval=ttotp)
         #lung=len(sol.y[0])
         # The only variable to predict is "NewCases", i.d. the difference of the cumulative Ic
@@ -118,25 +116,47 @@ class SIR_fitter():
         Ipred=self.__SIR_integrate(self.time_integ,x0,N,self.time_integ,beta,gamma)
         return Ipred
     
-    def fit(self,df,save_to=None):
+    def settings(self):
         '''
-        Fit SIR parameters on all the data. 
-        save_to: path to save the results in pickle format. Results are saved a Pandas DataFrame having columns: GeoID,Date,beta,gamma 
+        Returns the settings the fitted parameters depend on. They are saved along with df_pars.
+        '''
+        return {'moving_average':self.moving_average,'infection_days':self.infection_days,
+                'semi_fit':self.semi_fit,'beta_i':self.beta_i,'gamma_i':self.gamma_i}
+
+    def load_df_pars(self,path):
+        '''
+        Returns the df_pars saved to path by fit, or None if there is none or it was fitted with other settings.
+        '''
+        if not os.path.exists(path):
+            return None
+        with open(path,'rb') as f:
+            df_pars=pickle.load(f)
+        if df_pars.attrs.get('SIR_fitter')!=self.settings() or 'fit_cases' not in df_pars.columns:
+            return None
+        return df_pars
+
+    def fit(self,df,save_to=None,incremental=False):
+        '''
+        Fit SIR parameters on all the data.
+        save_to: path to save the results in pickle format. Results are saved a Pandas DataFrame having columns: GeoID,Date,beta,gamma
+        incremental: if True, start from the results previously saved to save_to, if fitted with the same settings.
+        Their case and population columns are the watermark of the data they were fitted on: only the windows
+        affected by new or revised rows are refitted.
         '''
         if self.semi_fit<3:
             raise ValueError('ValueError: semi_fit_days should be higher than 2')
-        geo_ids = df.GeoID.unique()
         COL = ['NewCases'] if not self.moving_average else ['MA']
         df=df[['GeoID','Date','Population']+COL]
-        self.df_chunks=[df[df.GeoID==g].sort_values('Date') 
-                        for g in geo_ids]
-        nchunks=len(self.df_chunks)
-        pool=mp.Pool(self.nprocs)
-        outputs=list(tqdm(pool.imap(self.fit_country,self.df_chunks),total=nchunks))
-        pool.close()
-        pool.join()
-        self.df_pars=pd.concat(outputs)
+        store=GeoSeriesStore(df)
+        previous_df_pars=self.load_df_pars(save_to) if incremental and save_to is not None else None
+        if previous_df_pars is not None:
+            self.df_pars=self.refit(store,previous_df_pars)
+        else:
+            self.df_pars=store.df.copy()
+            self.df_pars['beta'],self.df_pars['gamma'],self.df_pars['predicted_cases'],self.df_pars['fit_cases']=\
+                self.fit_shared(store)
         self.df_pars.sort_values(['GeoID','Date'],inplace=True)
+        self.df_pars.attrs['SIR_fitter']=self.settings()
         if save_to is not None:
             with open(save_to,'wb') as f:
                 pickle.dump(self.df_pars,f)
@@ -144,12 +164,103 @@ class SIR_fitter():
         # Return the classifier
         return self
 
+    def fit_shared(self,store):
+        '''
+        Fits the SIR parameters of all the geos of store in a pool of forked processes.
+        The cases and population are kept in _shared_fit_data before forking, and the processes inherit and only read
+        them: each process is only sent the offsets of a chunk of consecutive geos, fits them together and returns their
+        parameters as a compact float array.
+        Returns the beta, gamma, predicted_cases and fit_cases arrays of the rows of store.
+        '''
+        COL = 'NewCases' if not self.moving_average else 'MA'
+        _shared_fit_data['data']=np.stack([store.block(COL),store.block('Population')]).astype(np.float64)
+        # One chunk of consecutive geos per process: the geos of a chunk are fitted together
+        geo_chunks=[c for c in np.array_split(np.arange(len(store)),self.nprocs) if len(c)]
+        tasks=[(store.offsets[c[0]:c[-1]+2],self.semi_fit,self.infection_days,self.beta_i,self.gamma_i)
+               for c in geo_chunks]
+        try:
+            with mp.get_context('fork').Pool(self.nprocs) as pool:
+                outputs=list(tqdm(pool.imap(fit_sir_chunk,tasks),total=len(tasks)))
+        finally:
+            del _shared_fit_data['data']
+        return np.concatenate(outputs,axis=1) if outputs else np.empty((4,0))
+
+    def refit(self,store,previous_df_pars):
+        '''
+        Refits the windows of the geos of store affected by rows that are new or differ from previous_df_pars.
+        A row changed on day r changes the windows from day r-semi_fit on, through their observed cases and
+        initial conditions. New days also let the last window fitted before predict the day after it.
+        The refitted windows start from the parameters of the latest day fitted before them.
+        '''
+        COL = 'NewCases' if not self.moving_average else 'MA'
+        gdf=store.df.copy()
+        starts,lengths=store.offsets[:-1],np.diff(store.offsets)
+        previous=previous_df_pars.sort_values(['GeoID','Date'])
+        previous=previous[['GeoID','Date','Population',COL,'beta','gamma','predicted_cases','fit_cases']].copy()
+        previous['day']=previous.groupby('GeoID').cumcount()
+        # Left merge: keeps the rows of gdf, in order
+        merged=gdf.merge(previous,how='left',on=['GeoID','Date'],suffixes=('','_previous'))
+        days=np.arange(len(gdf))-np.repeat(starts,lengths)
+        changed=((merged.day.values!=days)|(merged[COL].values!=merged[COL+'_previous'].values)|
+                 (merged.Population.values!=merged.Population_previous.values))
+        first_changed=np.array([days[s:s+n][changed[s:s+n]].min(initial=n) for s,n in zip(starts,lengths)],dtype=int)
+        previous_lengths=previous.groupby('GeoID').size().reindex(store.geo_ids,fill_value=0).values
+        start_days=np.where((first_changed==lengths)&(lengths==previous_lengths),lengths,
+                            np.maximum(np.minimum(first_changed,previous_lengths)-self.semi_fit-1,0))
+        previous_fit=tuple(merged[column].values.astype(np.float64)
+                           for column in ['beta','gamma','predicted_cases','fit_cases'])
+        beta, gamma, predicted_cases, fit_cases = fit_sir_windows(gdf[COL].values, gdf.Population.values,
+                                                                  store.offsets, self.semi_fit, self.infection_days,
+                                                                  self.beta_i, self.gamma_i,
+                                                                  start_days=start_days, previous_fit=previous_fit)
+        gdf['beta']=beta
+        gdf['gamma']=gamma
+        gdf['predicted_cases']=predicted_cases
+        gdf['fit_cases']=fit_cases
+        return gdf
+
+class SIR_parameter_model(BaseEstimator, RegressorMixin):
+    ''' Model of the SIR parameters, beta and gamma, from the features.
+    Estimators supporting several outputs natively (RandomForestRegressor, MultiTaskLasso, XGBRegressor...) are
+    trained once on both parameters, sharing one tree ensemble or one coefficient matrix, even when wrapped in a
+    MultiOutputRegressor. The other ones are trained once per parameter, as MultiOutputRegressor does.
+    estimator: the scikit-learn compatible estimator to use.
+    '''
+    def __init__(self, estimator=None):
+        self.estimator=estimator
+
+    @staticmethod
+    def is_multioutput(estimator):
+        '''
+        Returns True if estimator is trained on all the outputs at once.
+        '''
+        return bool(estimator._get_tags().get('multioutput',False)) if hasattr(estimator,'_get_tags') else False
+
+    def fit(self,X,y):
+        estimator=self.estimator
+        if isinstance(estimator,MultiOutputRegressor) and self.is_multioutput(estimator.estimator):
+            estimator=estimator.estimator
+        estimator=clone(estimator)
+        if not self.is_multioutput(estimator):
+            # Trained once per parameter, unless already wrapped
+            if not isinstance(estimator,MultiOutputRegressor):
+                estimator=MultiOutputRegressor(estimator)
+        elif estimator.get_params().get('multi_strategy',False) is None:
+            # XGBoost trees with one leaf value per output, instead of one tree per output
+            estimator.set_params(multi_strategy='multi_output_tree')
+        self.estimator_=estimator.fit(X,y)
+        return self
+
+    def predict(self,X):
+        return self.estimator_.predict(X).reshape(len(X),-1)
+
+
 class SIR_predictor(BaseEstimator, RegressorMixin, SIR_fitter):
     def __init__(self, df=None,moving_average=True, 
                  infection_days=7, semi_fit=3,
                  beta_i=0.6, gamma_i=1/7,lookback_days=30,
                  MLmodel= 'MultiOutputRegressor(xgb.XGBRegressor())', 
-                 paral_predict=False,pre_computed=None,nprocs=4):
+                 paral_predict=False,pre_computed=None,nprocs=4,cache_dir=SIR_CACHE_DIR):
         self.df=df
         self.moving_average=moving_average
         self.infection_days=infection_days
@@ -161,6 +272,7 @@ class SIR_predictor(BaseEstimator, RegressorMixin, SIR_fitter):
         self.paral_predict=paral_predict
         self.MLmodel=MLmodel
         self.pre_computed=pre_computed
+        self.cache_dir=cache_dir
         
     
     def SIR_ode(self,t,x0, N, beta, gamma):
@@ -179,8 +291,7 @@ class SIR_predictor(BaseEstimator, RegressorMixin, SIR_fitter):
             self.SFmodel=SIR_fitter(self.moving_average, 
                      self.infection_days, self.semi_fit,
                      self.beta_i, self.gamma_i,self.nprocs)
-            print('Fitting SIR parameters...')
-            self.SFmodel.fit(self.df)
+            self.fit_sir_parameters()
         else:
             print('Already computed SIR parameters')
             self.SFmodel=SIR_fitter(self.moving_average, 
@@ -190,8 +301,10 @@ class SIR_predictor(BaseEstimator, RegressorMixin, SIR_fitter):
         #self.SFmodel.df_pars=self.df.copy()
         #self.SFmodel.df_pars['beta']=0.6
         #self.SFmodel.df_pars['gamma']=1/7
-        self.df=self.df.merge(self.SFmodel.df_pars[['GeoID','Date','beta','gamma']],
-                 how='left',on=['GeoID','Date'],left_index=True).dropna(subset=['beta','gamma'])
+        # Keeps the index of df, which the last column of X refers to
+        pars=self.SFmodel.df_pars[['GeoID','Date','beta','gamma']]
+        self.df=self.df.merge(pars,how='left',on=['GeoID','Date']).set_index(self.df.index)\
+                 .dropna(subset=['beta','gamma'])
         #print(self.df.loc[X[:,-1]])
         
         #Predict SIR parameters instead of cases
@@ -210,13 +323,37 @@ class SIR_predictor(BaseEstimator, RegressorMixin, SIR_fitter):
         #exit()
         #self.X_pars=self.X_pars[:,:-1]
         
-        self.MLmodel=eval(str(self.MLmodel))
+        # Model strings are built with the model registry, estimators are cloned
+        self.MLmodel=build_model(self.MLmodel) if isinstance(self.MLmodel,str) else clone(self.MLmodel)
+        if not isinstance(self.MLmodel,SIR_parameter_model):
+            self.MLmodel=SIR_parameter_model(self.MLmodel)
         #print('\n ML model: ',type(self.MLmodel))
         self.MLmodel.fit(self.X_pars,self.y_pars)
         self.TMAE=mae(self.MLmodel.predict(self.X_pars),self.y_pars)
         print('Training MAE on SIR params:', self.TMAE)
         return self
     
+    def fit_sir_parameters(self):
+        '''
+        Fits the SIR parameters of df with SFmodel, unless parameters fitted on the same cases and population with the
+        same settings are in the cache_dir cache, e.g. by another candidate of a grid search. cache_dir=None disables it.
+        '''
+        COL = 'NewCases' if not self.moving_average else 'MA'
+        if self.cache_dir is None:
+            print('Fitting SIR parameters...')
+            self.SFmodel.fit(self.df)
+            return
+        key=cache_key(data_digest(self.df,['GeoID','Date','Population',COL]),self.SFmodel.settings())
+        df_pars=load_parameters(key,self.cache_dir)
+        if df_pars is not None:
+            print('Loaded SIR parameters from the cache')
+            df_pars.attrs['SIR_fitter']=self.SFmodel.settings()
+            self.SFmodel.df_pars=df_pars
+            return
+        print('Fitting SIR parameters...')
+        self.SFmodel.fit(self.df)
+        save_parameters(self.SFmodel.df_pars,key,self.cache_dir)
+
     def predict_pars(self,X):
         return self.MLmodel.predict(X[:,self.lookback_days+1:-1])
         #except Exception as e:
@@ -227,46 +364,24 @@ class SIR_predictor(BaseEstimator, RegressorMixin, SIR_fitter):
         #return self.MLmodel.predict(X[:,:-1])
     
     def predict_chunk(self,X_chunk):
-        y_chunk=[]
-        for i in range(X_chunk.shape[0]):
-            pars=self.predict_pars(X_chunk[i,:].reshape(1,-1))
-            beta=pars[0][0]
-            gamma=pars[0][1]
-            time_integ=[0,1]
-            
-            N=X_chunk[i,self.lookback_days+1]
-            #I0=X_chunk[i,self.lookback_days-1].sum()
-            #Ic0=X_chunk[i,self.lookback_days]
-            #R0=Ic0-I0
-            
-            I0=X_chunk[i,self.lookback_days-self.infection_days:self.lookback_days].sum()
-            Ic0=X_chunk[i,self.lookback_days]
-            R0=Ic0-I0
-            
-            S0=N-I0-R0
-            x0=(S0,I0,Ic0,R0)
-            #print(x0)
-            
-            #I=solve_ivp(self.SIR_ode,[time_integ[0],time_integ[-1]],
-            #            x0,args=(N,beta,gamma),t_eval=time_integ).y[1][1]
-            I=np.diff(solve_ivp(self.SIR_ode,[time_integ[0],time_integ[-1]],
-                        x0,args=(N,beta,gamma),t_eval=time_integ).y[2])[-1]
-            y_chunk.append(I)
-        return y_chunk
+        '''
+        Predicts the new cases of the day after each row of X_chunk: the SIR parameters of all the rows are predicted
+        with a single call to the ML model, and the SIR model of all the rows is integrated at once for one day.
+        '''
+        pars=self.predict_pars(X_chunk)
+        N=X_chunk[:,self.lookback_days+1]
+        I0=X_chunk[:,self.lookback_days-self.infection_days:self.lookback_days].sum(axis=1)
+        Ic0=X_chunk[:,self.lookback_days]
+        # S0=N-I0-R0 with R0=Ic0-I0
+        S0=N-Ic0
+        return sir_new_cases(S0,I0,N,pars[:,0],pars[:,1],1)[:,0]
     
     def predict(self,X):
-        if self.paral_predict:
-            nchunks=self.nprocs*10
-            X_chunks=np.array_split(X,nchunks)
-            pool=mp.Pool(self.nprocs)
-            y_chunks=list(pool.imap(self.predict_chunk,X_chunks))
-            pool.close()
-            pool.join()
-            y=[item for sublist in y_chunks for item in sublist]
-            return y
-        else:
-            y=self.predict_chunk(X)
-            return y
+        '''
+        Predicts the new cases of the day after each row of X. The rows are predicted together in this process:
+        paral_predict is kept for compatibility, but no process pool is needed, nor the pickling of the estimator.
+        '''
+        return self.predict_chunk(X)
     
     def score(self,X_test,y_test):
         #check_X_y(X_test,y_test)
@@ -299,6 +414,7 @@ class SIRRegressor(BaseEstimator, RegressorMixin):
         return dS, dI, dIc,dR
     
     def __SIR_integrate(self,ttotp,x0,N,beta,gamma):
+        from scipy.integrate import solve_ivp
         sol=solve_ivp(self.__SIR_ode,[ttotp[0],ttotp[-1]],x0,args=(N,beta,gamma),t_eval=ttotp)
         #lung=len(sol.y[0])
         # The only variable to predict is "NewCases", i.d. the difference of the cumulative Ic
@@ -425,6 +541,7 @@ class SIR_parfinder():
     
     def __SIR_integrate(self,ttotp,x0,N,ti,beta,gamma):
         ''' Argument ti not used but needed by curve_fit '''
+        from scipy.integrate import solve_ivp
         sol=solve_ivp(self.__SIR_ode,[ttotp[0],ttotp[-1]],x0,args=(N,beta,gamma),t_eval=ttotp)
         #lung=len(sol.y[0])
         # The only variable to predict is "NewCases", i.d. the difference of the cumulative Ic
@@ -470,6 +587,7 @@ class SIR_parfinder():
         elif x0[1]<1:
             popt=np.array([np.nan,np.nan])
         else:
+            from scipy.optimize import curve_fit
             fintegranda=partial(self.__SIR_integrate,self.time_integ,x0,N)
             popt, pcov = curve_fit(fintegranda, self.time_integ, 
                        self.row_observed_cases(row),
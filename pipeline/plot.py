@@ -4,7 +4,7 @@ from bokeh.models import ColumnDataSource, CustomJS, CDSView, Select, IndexFilte
 from bokeh.io import save
 from bokeh.layouts import column
 from datetime import timedelta
-from utils import create_dataset
+from utils import load_dataset
 
 
 def covid_plot(cases_file, preds_file):
@@ -18,12 +18,6 @@ def covid_plot(cases_file, preds_file):
 	cases_file : pandas DataFrame with historical cases
 	preds_file : pandas DataFrame with the column "PredictedDailyNewCases"
 	"""
-	df = pd.read_csv(cases_file,
-					parse_dates=['Date'],
-					encoding="ISO-8859-1",
-					dtype={"RegionName": str,"RegionCode": str},
-			 		error_bad_lines=False)
-
 	# reading the file with predictions of daily new cases
 	pred_df =  pd.read_csv(preds_file,
 							parse_dates=['Date'],
@@ -31,6 +25,9 @@ def covid_plot(cases_file, preds_file):
 							dtype={"RegionName": str,"RegionCode": str},
 							error_bad_lines=False)
 
+	# historical cases of the predicted countries only
+	df = load_dataset(cases_file, countries=sorted(pred_df.CountryName.unique()))
+
 
 	# filling missing values of Region column to make easier the selection
 	default = "--"
@@ -38,7 +35,6 @@ def covid_plot(cases_file, preds_file):
 	#df["DailyChangedConfirmedCases"] = df.groupby(["CountryName","RegionName"]).ConfirmedCases.diff().fillna(0)
 	pred_df["RegionName"] = pred_df["RegionName"].fillna(default)
 
-	df = create_dataset(df)
 	# Bokeh needs as input the type of ColumnDataSource
 	source = ColumnDataSource(df)
 	source2 = ColumnDataSource(pred_df)
@@ -2,12 +2,13 @@
 
 import argparse
 import os
-import pickle
 
 import numpy as np
 import pandas as pd
 
-from utils import mov_avg, create_dataset
+from covid_xprize.datasets.geo_series_store import GeoSeriesStore
+from utils import load_dataset
+from artifacts import load_model, read_manifest, check_layout
 
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -212,6 +213,80 @@ def predict(start_date: str,
 #
 
 
+def rollout_predictions(model, X_cases, X_adj_fixed, X_adj_time, X_npis,
+                        NB_LOOKBACK_DAYS: int, nb_days: int):
+    """
+    Rolls out the predictions of all geos at once, advancing every geo by one day
+    per step with a single batched call to model.predict.
+
+    :param model: fitted sklearn-like model
+    :param X_cases: array (n_geos, NB_LOOKBACK_DAYS) with the cases before the first predicted day
+    :param X_adj_fixed: array (n_geos, nb_days, n_adj_fixed) with the fixed columns of each predicted day
+    :param X_adj_time: array (n_geos, NB_LOOKBACK_DAYS + nb_days - 1, n_adj_time)
+    :param X_npis: array (n_geos, NB_LOOKBACK_DAYS + nb_days - 1, n_npis)
+    :param NB_LOOKBACK_DAYS: number of past days used by the model
+    :param nb_days: number of days to predict
+    :return: array (n_geos, nb_days) with the predicted cases
+    """
+    n_geos = X_cases.shape[0]
+
+    # Observed cases followed by the predicted ones, filled day by day
+    cases = np.zeros((n_geos, NB_LOOKBACK_DAYS + nb_days))
+    cases[:, :NB_LOOKBACK_DAYS] = X_cases
+    preds = cases[:, NB_LOOKBACK_DAYS:]
+
+    for d in range(nb_days):
+        X = np.concatenate([cases[:, d:d + NB_LOOKBACK_DAYS],
+                            X_adj_fixed[:, d].reshape(n_geos, -1),
+                            X_adj_time[:, d:d + NB_LOOKBACK_DAYS].reshape(n_geos, -1),
+                            X_npis[:, d:d + NB_LOOKBACK_DAYS].reshape(n_geos, -1)],
+                           axis=1)
+
+        pred = np.asarray(model.predict(X), dtype=np.float64).reshape(n_geos)
+        preds[:, d] = np.maximum(pred, 0)
+
+    return preds
+
+
+def _rollout_tensors(df, geos, start_date, nb_days, NB_LOOKBACK_DAYS,
+                     cases_col, adj_cols_fixed, adj_cols_time):
+    """
+    Stacks the data of every geo in the (n_geos, days, features) tensors
+    expected by rollout_predictions.
+    """
+    n_geos = len(geos)
+    first_date = start_date - np.timedelta64(NB_LOOKBACK_DAYS, 'D')
+    nb_window_days = NB_LOOKBACK_DAYS + nb_days - 1
+
+    X_cases = np.zeros((n_geos, NB_LOOKBACK_DAYS))
+    X_adj_fixed = np.zeros((n_geos, nb_days, len(adj_cols_fixed)))
+    X_adj_time = np.zeros((n_geos, nb_window_days, len(adj_cols_time)))
+    X_npis = np.zeros((n_geos, nb_window_days, len(NPI_COLS)))
+
+    store = GeoSeriesStore(df)
+    for i, geo in enumerate(geos):
+        dates = store.dates(geo)
+        first = np.searchsorted(dates, first_date.to_datetime64())
+        start = first + NB_LOOKBACK_DAYS
+
+        # Every day between first_date and the last predicted day must be there
+        nb_needed_days = nb_window_days + (1 if adj_cols_fixed else 0)
+        window_dates = dates[first:first + nb_needed_days]
+        expected_dates = pd.date_range(first_date, periods=nb_needed_days).values
+        if len(window_dates) != nb_needed_days or (window_dates != expected_dates).any():
+            raise ValueError('Missing days of data for {} between {} and {}'.format(
+                geo, first_date.date(), pd.Timestamp(expected_dates[-1]).date()))
+
+        X_cases[i] = store.values(geo, cases_col)[first:start, 0]
+        X_npis[i] = store.values(geo, NPI_COLS)[first:first + nb_window_days]
+        if adj_cols_time:
+            X_adj_time[i] = store.values(geo, adj_cols_time)[first:first + nb_window_days]
+        if adj_cols_fixed:
+            X_adj_fixed[i] = store.values(geo, adj_cols_fixed)[start:start + nb_days]
+
+    return X_cases, X_adj_fixed, X_adj_time, X_npis
+
+
 def my_predict_df(countries: list,
                   start_date_str: str, end_date_str: str,
                   NB_LOOKBACK_DAYS: int,
@@ -227,94 +302,60 @@ def my_predict_df(countries: list,
     else:
         CASES_COL = ['NewCases']
 
-    with open(model_input_file, 'rb') as model_file:
-        model = pickle.load(model_file)
+    model = load_model(model_input_file)
+    manifest = read_manifest(model_input_file)
+    if manifest is not None:
+        # The model must have been trained on the features it is given
+        check_layout(manifest, {'lookback_days': NB_LOOKBACK_DAYS,
+                                'moving_average': bool(moving_average),
+                                'adj_cols_fixed': list(adj_cols_fixed),
+                                'adj_cols_time': list(adj_cols_time),
+                                'nb_features': (NB_LOOKBACK_DAYS * (len(CASES_COL) + len(adj_cols_time) +
+                                                                   len(NPI_COLS)) + len(adj_cols_fixed))},
+                     model_input_file)
 
     start_date = pd.to_datetime(start_date_str, format='%Y-%m-%d')
     end_date = pd.to_datetime(end_date_str, format='%Y-%m-%d')
 
-    # Load historical intervention plans, since inception
-    df = pd.read_csv(path_to_ips_file,
-                     parse_dates=['Date'],
-                     encoding='ISO-8859-1',
-                     dtype={'RegionName': str},
-                     error_bad_lines=True)
-
-    df = create_dataset(df, drop=drop_columns_with_Nan)
-
-    country_selection = pd.DataFrame()
-
-    for country in countries:
-        country_mask = df.CountryName == country
-        country_selection = country_selection.append(df[country_mask])
-
-    ips = country_selection[ID_COLS + NPI_COLS]
-    cases = country_selection[ID_COLS + CASES_COL]
-    adj_time_df = country_selection[ID_COLS + adj_cols_time]
-    adj_fixed_df = country_selection[ID_COLS + adj_cols_fixed]
+    # Load historical intervention plans, since inception, of the requested countries only
+    df = load_dataset(path_to_ips_file, drop=drop_columns_with_Nan, countries=countries)
 
-    tot = pd.DataFrame()
+    country_selection = pd.concat([df[df.CountryName == country] for country in countries])
 
-    for geo in ips.GeoID.unique():
+    return predict_geos(model, country_selection, start_date, end_date,
+                        NB_LOOKBACK_DAYS, CASES_COL,
+                        adj_cols_time=adj_cols_time,
+                        adj_cols_fixed=adj_cols_fixed)
 
-        geo_pred_df = pd.DataFrame()
-        country = geo.split('__')[0]
-        region = geo.split('__')[1]
-        geo_ips = ips[ips['GeoID'] == geo]
-        geo_cases = cases[cases['GeoID'] == geo]
-        geo_adj_time = adj_time_df[adj_fixed_df['GeoID'] == geo]
-        geo_adj_fixed = adj_fixed_df[adj_fixed_df['GeoID'] == geo]
 
-        current_date = start_date
-        preds = []
-        dates = []
-
-        # Date are between start_date - lookback_days and start_date (prediction)
-        date_mask = ((geo_ips.Date < start_date) &
-                     (geo_ips.Date >= (start_date - np.timedelta64(NB_LOOKBACK_DAYS, 'D'))))
-
-        X_cases = list(geo_cases[date_mask][CASES_COL].values)
-
-        while current_date <= end_date:
-
-            date_mask_npi = ((geo_ips.Date < current_date) &
-                             (geo_ips.Date >= (current_date - np.timedelta64(NB_LOOKBACK_DAYS, 'D'))))
-
-            date_mask_time = ((geo_adj_time.Date < current_date) &
-                              (geo_adj_time.Date >= (current_date - np.timedelta64(NB_LOOKBACK_DAYS, 'D'))))
-
-            date_mask_fixed = geo_adj_fixed.Date == current_date
-
-            X_npis = np.array(geo_ips[date_mask_npi][NPI_COLS].values)
-            X_adj_time = np.array(geo_adj_time[date_mask_time][adj_cols_time].values)
-            X_adj_fixed = np.array(geo_adj_fixed[date_mask_fixed][adj_cols_fixed].values)
-
-            dates.append(current_date)
-
-            X = np.concatenate([np.array(X_cases[-NB_LOOKBACK_DAYS:]).flatten(),
-                                X_adj_fixed.flatten(),
-                                X_adj_time.flatten(),
-                                X_npis.flatten()])
-
-            # Make the prediction (reshape so that sklearn is happy)
-            pred = model.predict(X.reshape(1, -1))[0]
-            pred = np.maximum(pred, 0)
-            preds.append(pred)
-            X_cases.append(pred)
-            current_date = current_date + np.timedelta64(1, 'D')
-
-        geo_pred_df["PredictedDailyNewCases"] = preds
-        geo_pred_df["CountryName"] = country
-        geo_pred_df["RegionName"] = region
-        geo_pred_df["Date"] = dates
-        geo_pred_df["GeoID"] = geo
-
-        tot = tot.append(geo_pred_df)
+def predict_geos(model, df, start_date, end_date, NB_LOOKBACK_DAYS, CASES_COL,
+                 adj_cols_time=[], adj_cols_fixed=[]):
+    """
+    Predicts the cases between start_date and end_date, included, for all the geos in df.
+    Returns a DataFrame with columns PredictedDailyNewCases, CountryName, RegionName, Date, GeoID
+    """
+    geos = df.GeoID.unique()
+    nb_days = (end_date - start_date).days + 1
+
+    X_cases, X_adj_fixed, X_adj_time, X_npis = _rollout_tensors(df, geos, start_date, nb_days,
+                                                                NB_LOOKBACK_DAYS, CASES_COL,
+                                                                adj_cols_fixed, adj_cols_time)
+    preds = rollout_predictions(model, X_cases, X_adj_fixed, X_adj_time, X_npis,
+                                NB_LOOKBACK_DAYS, nb_days)
+
+    dates = pd.date_range(start_date, end_date)
+    geo_split = [geo.split('__') for geo in geos]
+    tot = pd.DataFrame({'PredictedDailyNewCases': preds.reshape(-1),
+                        'CountryName': np.repeat([g[0] for g in geo_split], nb_days),
+                        'RegionName': np.repeat([g[1] for g in geo_split], nb_days),
+                        'Date': np.tile(dates, len(geos)),
+                        'GeoID': np.repeat(geos, nb_days)},
+                       index=np.tile(np.arange(nb_days), len(geos)))
 
     # Drop GeoID column to match expected output format
     # pred_df = pred_df.drop(columns=['GeoID'])
     return tot
-    # Add if it's a requested date
+
 
 # !!! PLEASE DO NOT EDIT. THIS IS THE OFFICIAL COMPETITION API !!!
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Lasso, LinearRegression
+
+from artifacts import export_model, load_model, read_manifest, check_layout, LinearModelArtifact
+
+LAYOUT = {'lookback_days': 5, 'adj_cols_fixed': [], 'adj_cols_time': ['TemperatureC']}
+
+
+class TestArtifacts(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(301)
+        self.X = rng.rand(100, 8)
+        self.y = self.X @ rng.rand(8) + 1
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_linear_models(self):
+        for model in [Lasso(alpha=0.01), LinearRegression()]:
+            model.fit(self.X, self.y)
+            path = export_model(model, self.tmp_dir, type(model).__name__, LAYOUT)
+            self.assertEqual(LAYOUT, read_manifest(path)['layout'])
+            loaded = load_model(path)
+            self.assertIsInstance(loaded, LinearModelArtifact)
+            np.testing.assert_allclose(model.predict(self.X), loaded.predict(self.X))
+        self.assertEqual(['Lasso.json', 'Lasso.npz', 'LinearRegression.json', 'LinearRegression.npz'],
+                         sorted(os.listdir(self.tmp_dir)))
+
+    def test_other_models(self):
+        model = RandomForestRegressor(n_estimators=5, random_state=0).fit(self.X, self.y)
+        path = export_model(model, self.tmp_dir, 'RandomForestRegressor', LAYOUT)
+        self.assertEqual('pickle', read_manifest(path)['format'])
+        np.testing.assert_array_equal(model.predict(self.X), load_model(path).predict(self.X))
+
+    def test_models_are_reloaded_when_changed(self):
+        path = export_model(Lasso().fit(self.X, self.y), self.tmp_dir, 'model', LAYOUT)
+        self.assertIs(load_model(path), load_model(path))
+        first_model = load_model(path)
+        export_model(LinearRegression().fit(self.X, self.y), self.tmp_dir, 'model', LAYOUT)
+        os.utime(path, (0, os.path.getmtime(path) + 1))
+        self.assertIsNot(first_model, load_model(path))
+
+    def test_check_layout(self):
+        path = export_model(Lasso().fit(self.X, self.y), self.tmp_dir, 'model', LAYOUT)
+        manifest = read_manifest(path)
+        check_layout(manifest, LAYOUT)
+        # Entries missing from the manifest are not checked
+        check_layout(manifest, {**LAYOUT, 'nb_features': 8})
+        with self.assertRaisesRegex(ValueError, "adj_cols_time is \\['TemperatureC'\\], not \\[\\]"):
+            check_layout(manifest, {**LAYOUT, 'adj_cols_time': []})
+        with self.assertRaisesRegex(ValueError, 'lookback_days is 5, not 7'):
+            check_layout(manifest, {**LAYOUT, 'lookback_days': 7}, path)
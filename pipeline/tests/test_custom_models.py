@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.svm import SVR
+
+from covid_xprize.datasets.geo_series_store import GeoSeriesStore
+from custom_models import SIR_fitter, SIR_parameter_model, _shared_fit_data
+
+PARS_COLUMNS = ['beta', 'gamma', 'predicted_cases', 'fit_cases']
+
+
+def make_cases_df(nb_days=60, geos=('A', 'B', 'C'), seed=42):
+    """
+    Growing moving averages of new cases of a few geos, sorted by geo and date
+    """
+    rng = np.random.RandomState(seed)
+    dfs = []
+    for geo in geos:
+        ma = np.round(50 * np.exp(0.03 * np.arange(nb_days)) * rng.uniform(0.8, 1.2, nb_days))
+        dfs.append(pd.DataFrame({'GeoID': geo,
+                                 'Date': pd.date_range('2020-03-01', periods=nb_days),
+                                 'Population': 1e6,
+                                 'MA': ma}))
+    df = pd.concat(dfs, ignore_index=True)
+    df['GeoID'] = df['GeoID'].astype('category')
+    return df
+
+
+class TestSIRFitter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.save_to = os.path.join(self.tmp_dir, 'df_pars.pkl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def fitter(semi_fit_days=3):
+        return SIR_fitter(moving_average=True, semi_fit_days=semi_fit_days, nprocs=1)
+
+    def test_incremental_fit(self):
+        df = make_cases_df()
+        # The previous data missed the last 5 days, and a new geo
+        previous_df = df[df.Date < df.Date.max() - pd.Timedelta(days=4)]
+        previous_df_pars = self.fitter().fit(previous_df, save_to=self.save_to).df_pars
+        df = pd.concat([df, make_cases_df(geos=['D'], seed=7)], ignore_index=True)
+        df['GeoID'] = df['GeoID'].astype('category')
+        # And a past value of B was revised since
+        revised_row = df.index[(df.GeoID == 'B') & (df.Date == pd.Timestamp('2020-03-31'))][0]
+        df.loc[revised_row, 'MA'] += 500
+
+        df_pars = self.fitter().fit(df, save_to=self.save_to, incremental=True).df_pars.reset_index(drop=True)
+        full_df_pars = self.fitter().fit(df).df_pars.reset_index(drop=True)
+        pd.testing.assert_frame_equal(full_df_pars.drop(columns=PARS_COLUMNS), df_pars.drop(columns=PARS_COLUMNS))
+        for column in PARS_COLUMNS:
+            np.testing.assert_allclose(full_df_pars[column].values, df_pars[column].values, rtol=1e-3)
+
+        # The windows of B before the revised day, and of A and C before the new days, are not refitted
+        previous_df_pars = previous_df_pars.set_index(['GeoID', 'Date'])
+        df_pars = df_pars.set_index(['GeoID', 'Date'])
+        kept = {'A': 55 - 3 - 1, 'B': 30 - 3 - 1, 'C': 55 - 3 - 1}
+        for geo, nb_kept_days in kept.items():
+            np.testing.assert_array_equal(previous_df_pars.loc[geo, 'beta'].values[:nb_kept_days],
+                                          df_pars.loc[geo, 'beta'].values[:nb_kept_days])
+        self.assertFalse(np.allclose(previous_df_pars.loc['B', 'beta'].values[29:40],
+                                     df_pars.loc['B', 'beta'].values[29:40], equal_nan=True))
+
+    def test_incremental_fit_without_changes(self):
+        df = make_cases_df()
+        df_pars = self.fitter().fit(df, save_to=self.save_to).df_pars
+        pd.testing.assert_frame_equal(df_pars, self.fitter().fit(df, save_to=self.save_to, incremental=True).df_pars)
+
+    def test_incremental_fit_with_other_settings(self):
+        df = make_cases_df()
+        self.fitter().fit(df[df.Date < df.Date.max()], save_to=self.save_to)
+        self.assertIsNone(self.fitter(semi_fit_days=4).load_df_pars(self.save_to))
+        # Fitted from scratch
+        df_pars = self.fitter(semi_fit_days=4).fit(df, save_to=self.save_to, incremental=True).df_pars
+        pd.testing.assert_frame_equal(self.fitter(semi_fit_days=4).fit(df).df_pars, df_pars)
+
+    def test_fit_shared(self):
+        store = GeoSeriesStore(make_cases_df(geos=['A', 'B', 'C', 'D', 'E']))
+        fitter = SIR_fitter(moving_average=True, semi_fit_days=3, nprocs=2)
+        expected = fitter.fit_country(store.df.copy())
+        # The geos are fitted in 2 chunks, by 2 processes: same results as fitting them all at once
+        for column, values in zip(PARS_COLUMNS, fitter.fit_shared(store)):
+            np.testing.assert_array_equal(expected[column].values, values)
+
+    def test_fit_shared_error(self):
+        df = make_cases_df()
+        df.loc[df.GeoID == 'B', 'MA'] = -1.
+        store = GeoSeriesStore(df)
+        with self.assertRaisesRegex(ValueError, 'Infected was'):
+            SIR_fitter(moving_average=True, semi_fit_days=3, nprocs=2).fit_shared(store)
+        # The data of the fit is released
+        self.assertNotIn('data', _shared_fit_data)
+
+
+class TestSIRParameterModel(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        self.X = rng.rand(100, 5)
+        self.y = np.stack([self.X[:, 0], self.X[:, 1] / 7], axis=1)
+
+    def fit(self, estimator):
+        model = SIR_parameter_model(estimator).fit(self.X, self.y)
+        self.assertEqual((len(self.X), 2), model.predict(self.X).shape)
+        return model.estimator_
+
+    def test_multioutput_estimator(self):
+        # Trained once on both parameters, even when wrapped
+        for estimator in [RandomForestRegressor(n_estimators=5, random_state=0),
+                          MultiOutputRegressor(RandomForestRegressor(n_estimators=5, random_state=0))]:
+            self.assertIsInstance(self.fit(estimator), RandomForestRegressor)
+
+    def test_single_output_estimator(self):
+        estimator_ = self.fit(SVR())
+        self.assertIsInstance(estimator_, MultiOutputRegressor)
+        self.assertEqual(2, len(estimator_.estimators_))
+
+    def test_wrapped_single_output_estimator(self):
+        estimator = MultiOutputRegressor(SVR(C=2.))
+        estimator_ = self.fit(estimator)
+        self.assertIsInstance(estimator_.estimator, SVR)
+        self.assertEqual(2., estimator_.estimator.C)
+        self.assertEqual(2, len(estimator_.estimators_))
+        # The estimator passed is left unfitted
+        self.assertFalse(hasattr(estimator, 'estimators_'))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Lasso
+
+from artifacts import export_model
+from predict import NPI_COLS, predict_geos, my_predict_df
+
+NB_LOOKBACK_DAYS = 7
+START_DATE = pd.Timestamp('2020-03-01')
+END_DATE = pd.Timestamp('2020-03-10')
+ADJ_COLS_FIXED = ['Population']
+ADJ_COLS_TIME = ['TemperatureC']
+
+
+def make_geos_df(seed=42):
+    """
+    Small dataset of three geos, with the columns used to predict their moving average of cases
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range('2020-02-01', END_DATE)
+    dfs = []
+    for country, region in [('Italy', 'nan'), ('Italy', 'Lazio'), ('Spain', 'nan')]:
+        gdf = pd.DataFrame({'CountryName': country,
+                            'RegionName': region,
+                            'GeoID': country + '__' + region,
+                            'Date': dates,
+                            'MA': rng.rand(len(dates)) * 100,
+                            'Population': rng.rand() * 1e6,
+                            'TemperatureC': rng.rand(len(dates)) * 30})
+        for npi_col in NPI_COLS:
+            gdf[npi_col] = rng.randint(0, 4, len(dates)).astype(float)
+        dfs.append(gdf)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def fit_model(seed=42):
+    rng = np.random.RandomState(seed)
+    nb_features = NB_LOOKBACK_DAYS * (1 + len(ADJ_COLS_TIME) + len(NPI_COLS)) + len(ADJ_COLS_FIXED)
+    X = rng.rand(200, nb_features)
+    y = X @ rng.rand(nb_features) * 10
+    return Lasso(alpha=0.01).fit(X, y)
+
+
+def reference_predictions(model, df):
+    """
+    Per geo and per day rollout of the predictions, as my_predict_df did before predicting all geos at once
+    """
+    preds = []
+    for geo in df.GeoID.unique():
+        gdf = df[df.GeoID == geo]
+        window = (gdf.Date < START_DATE) & (gdf.Date >= START_DATE - np.timedelta64(NB_LOOKBACK_DAYS, 'D'))
+        X_cases = list(gdf[window]['MA'].values)
+        current_date = START_DATE
+        while current_date <= END_DATE:
+            window = ((gdf.Date < current_date) &
+                      (gdf.Date >= current_date - np.timedelta64(NB_LOOKBACK_DAYS, 'D')))
+            X = np.concatenate([np.array(X_cases[-NB_LOOKBACK_DAYS:]),
+                                gdf[gdf.Date == current_date][ADJ_COLS_FIXED].values.flatten(),
+                                gdf[window][ADJ_COLS_TIME].values.flatten(),
+                                gdf[window][NPI_COLS].values.flatten()])
+            pred = np.maximum(model.predict(X.reshape(1, -1))[0], 0)
+            preds.append(pred)
+            X_cases.append(pred)
+            current_date = current_date + np.timedelta64(1, 'D')
+    return np.array(preds)
+
+
+class TestPredictGeos(unittest.TestCase):
+
+    def test_same_as_per_geo_rollout(self):
+        df = make_geos_df()
+        model = fit_model()
+        pred_df = predict_geos(model, df, START_DATE, END_DATE, NB_LOOKBACK_DAYS, ['MA'],
+                               adj_cols_time=ADJ_COLS_TIME, adj_cols_fixed=ADJ_COLS_FIXED)
+        nb_days = (END_DATE - START_DATE).days + 1
+        self.assertEqual(3 * nb_days, len(pred_df))
+        self.assertEqual(list(np.repeat(df.GeoID.unique(), nb_days)), list(pred_df.GeoID))
+        self.assertEqual(list(pd.date_range(START_DATE, END_DATE)) * 3, list(pred_df.Date))
+        np.testing.assert_allclose(reference_predictions(model, df), pred_df.PredictedDailyNewCases.values)
+
+    def test_missing_day(self):
+        df = make_geos_df()
+        df = df[~((df.GeoID == 'Italy__Lazio') & (df.Date == START_DATE - np.timedelta64(3, 'D')))]
+        with self.assertRaisesRegex(ValueError, 'Italy__Lazio'):
+            predict_geos(fit_model(), df, START_DATE, END_DATE, NB_LOOKBACK_DAYS, ['MA'],
+                         adj_cols_time=ADJ_COLS_TIME, adj_cols_fixed=ADJ_COLS_FIXED)
+
+    def test_model_layout(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            layout = {'lookback_days': NB_LOOKBACK_DAYS, 'moving_average': True, 'adj_cols_fixed': ADJ_COLS_FIXED,
+                      'adj_cols_time': ADJ_COLS_TIME, 'npi_cols': NPI_COLS,
+                      'nb_features': (NB_LOOKBACK_DAYS * (1 + len(ADJ_COLS_TIME) + len(NPI_COLS)) +
+                                      len(ADJ_COLS_FIXED))}
+            model_file = export_model(fit_model(), tmp_dir, 'Lasso', layout)
+            # Models are not given other features than the ones they were trained on
+            for kwargs in [{'NB_LOOKBACK_DAYS': NB_LOOKBACK_DAYS + 1},
+                           {'moving_average': False},
+                           {'adj_cols_time': []},
+                           {'adj_cols_fixed': ADJ_COLS_FIXED + ['HDI']}]:
+                kwargs = {'NB_LOOKBACK_DAYS': NB_LOOKBACK_DAYS, 'moving_average': True,
+                          'adj_cols_time': ADJ_COLS_TIME, 'adj_cols_fixed': ADJ_COLS_FIXED, **kwargs}
+                with self.assertRaisesRegex(ValueError, 'trained on other features'):
+                    my_predict_df(['Italy'], '2020-03-01', '2020-03-10', drop_columns_with_Nan=True,
+                                  path_to_ips_file='missing.csv', model_input_file=model_file, **kwargs)
+        finally:
+            shutil.rmtree(tmp_dir)
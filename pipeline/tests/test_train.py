@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from joblib import effective_n_jobs
+
+from train import memmap_samples, search_n_jobs, grid_search, candidate_times
+
+
+class TestGridSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(301)
+        self.X = rng.rand(200, 10)
+        self.y = self.X @ rng.rand(10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_memmap_samples(self):
+        X_shared, y_shared = memmap_samples(self.X, self.y, self.tmp_dir)
+        self.assertIsInstance(X_shared, np.memmap)
+        np.testing.assert_array_equal(self.X, X_shared)
+        np.testing.assert_array_equal(self.y, y_shared)
+
+    def test_parallel_grid_search(self):
+        X_shared, y_shared = memmap_samples(self.X, self.y, self.tmp_dir)
+        param_grid = {'alpha': {'linspace': [0.3, 1, 3]}, 'max_iter': [10000]}
+        gcv, _ = grid_search('Lasso()', param_grid, self.X, self.y)
+        parallel_gcv, _ = grid_search('Lasso()', param_grid, X_shared, y_shared, n_jobs=2)
+        self.assertEqual(gcv.best_params_, parallel_gcv.best_params_)
+        np.testing.assert_allclose(gcv.predict(self.X), parallel_gcv.predict(self.X))
+        times_df = candidate_times(parallel_gcv)
+        self.assertEqual(3, len(times_df))
+        self.assertTrue((times_df.mean_fit_time > 0).all())
+
+    def test_search_n_jobs(self):
+        self.assertEqual(4, search_n_jobs(8, 2, 3))
+        self.assertEqual(8, search_n_jobs(8, 2, 1))
+        self.assertEqual(1, search_n_jobs(2, 4, 4))
+        self.assertEqual(max(effective_n_jobs(-1) // 2, 1), search_n_jobs(-1, 2, 2))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils import npi_cols, mov_avg, groupby_interpolate, create_dataset, skl_format, load_dataset
+from utils import CACHE_DIR, POPULATION_FILE, TEMPERATURE_FILE, HDI_FILE, dataset_cache_name
+
+NB_DAYS = 60
+
+
+def make_oxford_df(seed=301):
+    """
+    Small Oxford-like dataset with missing cases and NPIs, a region and a geo without any case
+    """
+    rng = np.random.RandomState(seed)
+    geos = [('Italy', np.nan), ('Italy', 'Lazio'), ('Spain', np.nan), ('France', np.nan)]
+    dfs = []
+    for country, region in geos:
+        gdf = pd.DataFrame({'CountryName': country,
+                            'CountryCode': country[:3].upper(),
+                            'RegionName': region,
+                            'Date': pd.date_range('2020-01-01', periods=NB_DAYS)})
+        confirmed = np.cumsum(rng.randint(0, 100, NB_DAYS)).astype(float)
+        confirmed[rng.rand(NB_DAYS) < 0.2] = np.nan
+        confirmed[:3] = np.nan
+        confirmed[-2:] = np.nan
+        if country == 'France':
+            confirmed[:] = np.nan
+        gdf['ConfirmedCases'] = confirmed
+        for npi_col in npi_cols:
+            npis = rng.randint(0, 4, NB_DAYS).astype(float)
+            npis[rng.rand(NB_DAYS) < 0.2] = np.nan
+            gdf[npi_col] = npis
+        dfs.append(gdf)
+    return pd.concat(dfs, ignore_index=True)
+
+
+def create_oxford_samples_df():
+    df = make_oxford_df()
+    df = df[df.CountryName.isin(['Italy', 'Spain']) & df.RegionName.isnull()].reset_index(drop=True)
+    df.index = df.index + 1000
+    df['GeoID'] = df['CountryName'] + '__' + df['RegionName'].astype(str)
+    df['MA'] = np.arange(len(df), dtype=float)
+    df['Population'] = np.arange(len(df), dtype=float) * 10
+    df['TemperatureC'] = np.arange(len(df), dtype=float) / 10
+    return df
+
+
+def reference_preprocessing(df, window=7):
+    """
+    Per geo implementation of the cases, NPIs and moving average preprocessing of create_dataset
+    """
+    df['GeoID'] = (df['CountryName'] + '__' + df['RegionName'].astype(str)).astype('category')
+    df['NewCases'] = df.groupby('GeoID').ConfirmedCases.diff().fillna(0)
+    for col in ['NewCases', 'ConfirmedCases']:
+        interpolated = [df[df.GeoID == geo][col].interpolate() for geo in df.GeoID.unique()]
+        df.update(pd.concat(interpolated).fillna(0))
+    for npi_col in npi_cols:
+        df.update(df.groupby('GeoID')[npi_col].ffill().fillna(0))
+    moving_averages = [df[df.GeoID == geo]['NewCases'].rolling(window=window).mean()
+                       for geo in df.GeoID.unique()]
+    df['MA'] = pd.concat(moving_averages).fillna(0)
+    return df
+
+
+class TestPreprocessing(unittest.TestCase):
+
+    def test_groupby_interpolate(self):
+        df = pd.DataFrame({'GeoID': ['A'] * 5 + ['B'] * 4,
+                           'ConfirmedCases': [np.nan, 1., np.nan, np.nan, 4., 10., np.nan, 30., np.nan]})
+        expected = df.groupby('GeoID').ConfirmedCases.transform(lambda group: group.interpolate())
+        pd.testing.assert_series_equal(expected, groupby_interpolate(df, 'ConfirmedCases'))
+
+    def test_groupby_interpolate_interleaved_groups(self):
+        df = pd.DataFrame({'GeoID': ['A', 'A', 'B', 'A', 'B', 'C', 'B', 'A', 'B'],
+                           'ConfirmedCases': [1., np.nan, 5., 3., np.nan, np.nan, 11., np.nan, np.nan]})
+        expected = df.groupby('GeoID').ConfirmedCases.transform(lambda group: group.interpolate())
+        pd.testing.assert_series_equal(expected, groupby_interpolate(df, 'ConfirmedCases'))
+        self.assertEqual(2., groupby_interpolate(df, 'ConfirmedCases')[1])
+
+    def test_mov_avg(self):
+        df = make_oxford_df()
+        df['GeoID'] = df['CountryName'] + '__' + df['RegionName'].astype(str)
+        df['NewCases'] = df.groupby('GeoID').ConfirmedCases.diff()
+        expected = reference_preprocessing(make_oxford_df())
+        df['NewCases'] = expected['NewCases']
+        pd.testing.assert_series_equal(expected['MA'], mov_avg(df)['MA'])
+
+    def test_create_dataset_preprocessing(self):
+        expected = reference_preprocessing(make_oxford_df())
+        # Only check the preprocessing, not the merge of the additional data files
+        import utils
+        merges = utils.add_temp, utils.add_population_data, utils.add_HDI
+        utils.add_temp = lambda df: df
+        utils.add_population_data = utils.add_HDI = lambda df, drop: df
+        try:
+            actual = create_dataset(make_oxford_df())
+        finally:
+            utils.add_temp, utils.add_population_data, utils.add_HDI = merges
+        pd.testing.assert_frame_equal(expected, actual[expected.columns])
+
+
+class TestSklFormat(unittest.TestCase):
+
+    def test_columns_layout(self):
+        df = create_oxford_samples_df()
+        lookback_days = 5
+        X, y = skl_format(df, moving_average=True, lookback_days=lookback_days,
+                          adj_cols_fixed=['Population'], adj_cols_time=['TemperatureC'],
+                          keep_df_index=True)
+        # One sample per day from lookback_days to the day before the last one, for each geo
+        nb_geo_samples = [NB_DAYS - lookback_days - 1] * 2
+        self.assertEqual((sum(nb_geo_samples), lookback_days * (2 + len(npi_cols)) + 2), X.shape)
+        self.assertEqual((sum(nb_geo_samples),), y.shape)
+
+        # First sample of the second geo: predicts its day lookback_days
+        sample = X[nb_geo_samples[0]]
+        gdf = df[df.GeoID == 'Spain__nan']
+        day = gdf.index[lookback_days]
+        np.testing.assert_array_equal(gdf.MA.values[:lookback_days], sample[:lookback_days])
+        self.assertEqual(gdf.Population.values[lookback_days - 1], sample[lookback_days])
+        np.testing.assert_array_equal(gdf.TemperatureC.values[:lookback_days],
+                                      sample[lookback_days + 1:2 * lookback_days + 1])
+        np.testing.assert_array_equal(gdf[npi_cols].values[:lookback_days].flatten(),
+                                      sample[2 * lookback_days + 1:-1])
+        self.assertEqual(day, sample[-1])
+        self.assertEqual(df.MA[day], y[nb_geo_samples[0]])
+
+
+
+class TestDatasetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        os.makedirs('data')
+        self.input_file = os.path.join('data', 'data.csv')
+        make_oxford_df().to_csv(self.input_file, index=False)
+        countries = ['Italy', 'Spain', 'France']
+        pd.DataFrame({'CountryName': countries,
+                      'CountryCode': [c[:3].upper() for c in countries],
+                      'Population': [60e6, 47e6, 67e6]}).to_csv(POPULATION_FILE, index=False)
+        for path, col in [(TEMPERATURE_FILE, 'TemperatureC'), (HDI_FILE, 'HDI')]:
+            pd.DataFrame({'CountryName': 'Italy',
+                          'Date': pd.date_range('2020-01-01', periods=NB_DAYS),
+                          col: 1.}).to_csv(path, index=False)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache_is_reused(self):
+        df = load_dataset(self.input_file, drop=True)
+        self.assertEqual(1, len(os.listdir(CACHE_DIR)))
+        cached_df = load_dataset(self.input_file, drop=True)
+        pd.testing.assert_frame_equal(df, cached_df, check_dtype=False)
+        # Different options are cached separately
+        load_dataset(self.input_file, drop=False)
+        self.assertEqual(2, len(os.listdir(CACHE_DIR)))
+
+    def test_cache_is_invalidated(self):
+        load_dataset(self.input_file)
+        cache_files = os.listdir(CACHE_DIR)
+        # Update the temperatures: the cached dataset is stale
+        pd.DataFrame({'CountryName': 'Italy',
+                      'Date': pd.date_range('2020-01-01', periods=NB_DAYS),
+                      'TemperatureC': 2.}).to_csv(TEMPERATURE_FILE, index=False)
+        df = load_dataset(self.input_file)
+        self.assertEqual(2., df[df.CountryName == 'Italy'].TemperatureC.max())
+        self.assertEqual(1, len(os.listdir(CACHE_DIR)))
+        self.assertNotEqual(cache_files, os.listdir(CACHE_DIR))
+
+    def test_cache_is_written_atomically(self):
+        prefix, name = dataset_cache_name(self.input_file)
+        os.makedirs(CACHE_DIR)
+        # File being written by another run
+        other_tmp_file = os.path.join(CACHE_DIR, prefix + 'other.feather.1.tmp')
+        open(other_tmp_file, 'w').close()
+        load_dataset(self.input_file)
+        self.assertTrue(os.path.exists(other_tmp_file))
+        self.assertEqual([name + '.feather'], [f for f in os.listdir(CACHE_DIR) if not f.endswith('.tmp')])
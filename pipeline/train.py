@@ -3,18 +3,21 @@
 
 import os
 import json
-import pickle
 import logging
 import argparse
+import shutil
+import tempfile
 from time import time
 
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression, Lasso
+from joblib import Parallel, delayed, effective_n_jobs
 from sklearn.model_selection import train_test_split
 from sklearn.model_selection import GridSearchCV
 
-from utils import mae, create_dataset, skl_format
+from covid_xprize.models.registry import register_model, build_model, parse_param_grid
+from utils import mae, load_dataset, skl_format
+from artifacts import export_model
 from utils import add_temp, add_population_data, add_HDI
 
 id_cols = ['CountryName',
@@ -35,6 +38,80 @@ npi_cols = ['C1_School closing',
             'H3_Contact tracing',
             'H6_Facial Coverings']
 
+# Models of this pipeline that can be named in the configuration, imported only when used
+register_model('SIR_predictor', 'custom_models')
+
+# Default parallelism of the training, overridden by the "parallel" section of the "train" configuration
+#   n_jobs: processes running the candidates and folds of the grid searches, -1 for all the processors.
+#           They are split between the grid searches running concurrently
+#   models_n_jobs: grid searches of different models running concurrently
+#   cv: number of cross validation folds
+#   memmap_dir: where the samples shared by the processes are dumped, a temporary directory if null
+DEFAULT_PARALLEL = {'n_jobs': 1,
+                    'models_n_jobs': 1,
+                    'cv': 2,
+                    'memmap_dir': None}
+
+
+def memmap_samples(X_samples, y_samples, directory):
+    """
+    Dumps the samples to .npy files in directory and returns them memory mapped read only.
+    joblib passes memory mapped arrays to its worker processes by file name: all the candidates and folds of
+    the grid searches share the same pages instead of receiving a pickled copy of the samples each.
+    """
+    os.makedirs(directory, exist_ok=True)
+    arrays = []
+    for name, samples in [('X_samples', X_samples), ('y_samples', y_samples)]:
+        path = os.path.join(directory, name + '.npy')
+        np.save(path, np.ascontiguousarray(samples))
+        arrays.append(np.load(path, mmap_mode='r'))
+    return arrays
+
+
+def search_n_jobs(n_jobs, models_n_jobs, nb_models):
+    """
+    Returns the number of processes of each grid search, so that the grid searches running concurrently
+    share n_jobs processes instead of running n_jobs processes each.
+    """
+    nb_searches = max(min(effective_n_jobs(models_n_jobs), nb_models), 1)
+    return max(effective_n_jobs(n_jobs) // nb_searches, 1)
+
+
+def grid_search(model_name, param_grid, X_samples, y_samples, n_jobs=1, cv=2, df=None):
+    """
+    Runs the grid search of a model, whose name and param grid are given as in the configuration file.
+    Models with a df parameter, such as SIR_predictor, are given df if it is not set.
+    Returns the fitted GridSearchCV and its elapsed time.
+    """
+    start = time()
+    model = build_model(model_name)
+    if df is not None and model.get_params().get('df', False) is None:
+        model.set_params(df=df)
+    param_grid = parse_param_grid(param_grid)
+
+    gcv = GridSearchCV(estimator=model,
+                       param_grid=param_grid,
+                       scoring=None,  # TODO
+                       n_jobs=n_jobs,  # -1 is ALL PROCESSOR AVAILABLE
+                       cv=cv,          # None is K=5 fold CV
+                       refit=True,
+                       )
+
+    # Fit the GridSearch
+    gcv.fit(X_samples, y_samples)
+    return gcv, time() - start
+
+
+def candidate_times(gcv):
+    """
+    Returns a DataFrame with the params, mean fit and score times (s) and mean test score of each candidate of gcv.
+    """
+    results = gcv.cv_results_
+    return pd.DataFrame({'params': [str(params) for params in results['params']],
+                         'mean_fit_time': results['mean_fit_time'],
+                         'mean_score_time': results['mean_score_time'],
+                         'mean_test_score': results['mean_test_score']})
+
 
 if __name__ == '__main__':
 
@@ -77,16 +154,11 @@ if __name__ == '__main__':
 
     # Reading file with historical interventions
     start = time()
-    df = pd.read_csv(input_dataset,
-                     parse_dates=['Date'],
-                     encoding='ISO-8859-1',
-                     dtype={'RegionName': str,
-                            'RegionCode': str},
-                     error_bad_lines=True)
-
     # Selecting choosen time period from config file
-    df = df[(df.Date > start_date) & (df.Date < end_date)]
-    df = create_dataset(df, drop=drop_columns_with_Nan)
+    df = load_dataset(input_dataset,
+                      drop=drop_columns_with_Nan,
+                      start_date=start_date,
+                      end_date=end_date)
 
     # Selecting countries of interest from config file
     # TO TEST ALL COUNTRY, WRITE "countries" : "" in jsonfile
@@ -113,25 +185,29 @@ if __name__ == '__main__':
                                                         test_size=0.2,
                                                         random_state=301)
 
-    # Start looping on models keys, every model cointains: name and param_grid
-    for model_name in models.keys():
-
-        model = eval(model_name)
-        param_grid = models[model_name]
-
-        for param in models[model_name]:
-          param_grid[param] = eval(param_grid[param])
-
-        gcv = GridSearchCV(estimator=model,
-                           param_grid=param_grid,
-                           scoring=None,  # TODO
-                           n_jobs=1,      # -1 is ALL PROCESSOR AVAILABLE
-                           cv=2,          # None is K=5 fold CV
-                           refit=True,
-                           )
-
-        # Fit the GridSearch
-        gcv.fit(X_samples, y_samples)
+    parallel = {**DEFAULT_PARALLEL, **train_config.get('parallel', {})}
+    memmap_dir = parallel['memmap_dir'] or tempfile.mkdtemp(prefix='covid_xprize_train_')
+    X_shared, y_shared = memmap_samples(X_samples, y_samples, memmap_dir)
+
+    # Every model cointains: name and param_grid. The grid searches run in threads: their candidates and folds
+    # run in the joblib processes, which all map the same samples
+    n_jobs = search_n_jobs(parallel['n_jobs'], parallel['models_n_jobs'], len(models))
+    try:
+        searches = Parallel(n_jobs=parallel['models_n_jobs'], backend='threading')(
+            delayed(grid_search)(model_name, models[model_name], X_shared, y_shared,
+                                 n_jobs=n_jobs, cv=parallel['cv'], df=new_df)
+            for model_name in models.keys())
+    finally:
+        if not parallel['memmap_dir']:
+            shutil.rmtree(memmap_dir, ignore_errors=True)
+
+    for model_name, (gcv, search_time) in zip(models.keys(), searches):
+
+        print('\n{} grid search: {:.5} s'.format(model_name, search_time))
+        logging.info('{} grid search: {:.5} s'.format(model_name, search_time))
+        times_df = candidate_times(gcv)
+        print(times_df.to_string(index=False))
+        logging.info('Candidates of ' + model_name + ':\n' + times_df.to_string(index=False))
 
         # Evaluate model
         train_preds = gcv.predict(X_train)
@@ -142,17 +218,17 @@ if __name__ == '__main__':
         # test_preds = np.maximum(test_preds, 0) # Don't predict negative cases
         # print('Test MAE:', mae(test_preds, y_test))
 
-        model_path = os.path.join(models_output_dir, model_name[:-2] + '.pkl')
-
-        print('Saving model in ', model_path)
-        logging.info('Saving model in ' + str(model_path))
-
-        # Save model to file
-        if not os.path.exists(models_output_dir):
-            os.mkdir(models_output_dir)
-
-        with open(model_path, 'wb') as model_file:
-            pickle.dump(gcv, model_file)
+        # Save the best model only, with the layout of the features it was trained on
+        layout = {'lookback_days': lookback_days,
+                  'moving_average': moving_average,
+                  'adj_cols_fixed': adj_cols_fixed,
+                  'adj_cols_time': adj_cols_time,
+                  'npi_cols': npi_cols,
+                  'nb_features': X_samples.shape[1]}
+        model_path = export_model(gcv.best_estimator_, models_output_dir, model_name[:-2], layout)
+
+        print('Saved model in ', model_path)
+        logging.info('Saved model in ' + str(model_path))
 
         print('Elapsed time: {:.5} s'.format(time() - start))
         logging.info('Elapsed time: ' + str(time() - start))
@@ -5,6 +5,10 @@ import os
 import pandas as pd
 import numpy as np
 
+from covid_xprize.cache import file_checksum, digest, load_frame, save_frame
+from covid_xprize.datasets.geo_series_store import GeoSeriesStore
+from covid_xprize.datasets.oxford import load_oxford_data, geo_id, fill_missing_npis
+
 # Keep only columns of interest
 id_cols = ['CountryName',
            'RegionName',
@@ -24,28 +28,64 @@ npi_cols = ['C1_School closing',
             'H3_Contact tracing',
             'H6_Facial Coverings']
 
+# Additional data merged by create_dataset
+POPULATION_FILE = os.path.join('data', 'Additional_Context_Data_Global.csv')
+TEMPERATURE_FILE = os.path.join('data', 'country_temperatures.csv')
+HDI_FILE = os.path.join('data', 'country_HDI.csv')
+MA_WINDOW = 7
+
+# Where prepared datasets are cached, and the version of create_dataset that prepared them
+CACHE_DIR = os.path.join('data', 'cache')
+CACHE_VERSION = 2
+
 
-def mov_avg(df, window=7, col="NewCases"):
+def mov_avg(df, window=MA_WINDOW, col="NewCases"):
     """Returns the dataset with the moving average col for new cases
     """
 
-    MA = pd.Series(dtype=np.float64)
-    for geo in df.GeoID.unique():
-        MA = MA.append(df[df["GeoID"] == geo][col].rolling(window=window).mean()).fillna(0)
-    df["MA"] = MA
+    df["MA"] = df.groupby("GeoID")[col].rolling(window=window).mean().reset_index(0, drop=True).fillna(0)
 
     return df
 
 
+def groupby_interpolate(df, col, by="GeoID"):
+    """
+    Linear interpolation of the missing values of col inside each group, with the same result
+    as df.groupby(by)[col].apply(lambda group: group.interpolate()) but without a Python call per group.
+    Missing values before the first known value of a group stay NaN,
+    the ones after the last known value take the last known value.
+    """
+    values = df[col].values.astype(np.float64)
+    groups = df[by]
+    # Position of each row in its group: the rows of a group need not be contiguous
+    position = groups.groupby(groups, sort=False).cumcount().astype(np.float64)
+    known_position = position.where(df[col].notnull())
+    known_values = df[col].astype(np.float64)
+
+    prev_position = known_position.groupby(groups).ffill().values
+    next_position = known_position.groupby(groups).bfill().values
+    prev_values = known_values.groupby(groups).ffill().values
+    next_values = known_values.groupby(groups).bfill().values
+
+    missing = np.isnan(values)
+    # Between two known values: interpolate
+    inside = missing & ~np.isnan(next_position) & ~np.isnan(prev_position)
+    slope = (next_values[inside] - prev_values[inside]) / (next_position[inside] - prev_position[inside])
+    values[inside] = slope * (position.values[inside] - prev_position[inside]) + prev_values[inside]
+    # After the last known value: carry it over
+    after = missing & np.isnan(next_position)
+    values[after] = prev_values[after]
+
+    return pd.Series(values, index=df.index, name=col)
+
+
 def add_population_data(df, drop=False):
     """
     Add additional data like population, Cancer rate, etc..  in Oxford data.
     But now it removes rows with at least 1 Nan
     """
 
-    data_path = os.path.join('data', 'Additional_Context_Data_Global.csv')
-
-    more_df = pd.read_csv(data_path)
+    more_df = pd.read_csv(POPULATION_FILE)
     if drop:
         more_df.dropna(inplace=True)
     new_df = more_df.merge(df,
@@ -60,9 +100,7 @@ def add_temp(df):
     '''Use this only on the Oxford dataframe.
     Return the same dataframe with a column temperature taken from data/country_temperatures.csv'''
 
-    data_path = os.path.join('data', 'country_temperatures.csv')
-
-    df_T = pd.read_csv(data_path, parse_dates=['Date'])
+    df_T = pd.read_csv(TEMPERATURE_FILE, parse_dates=['Date'])
     df_T = df.merge(df_T, how='left', left_on=['CountryName', 'Date'], right_on=['CountryName', 'Date'])
     return df_T
 
@@ -73,8 +111,7 @@ def add_HDI(df, drop=False):
     Dataset from https://ourworldindata.org/coronavirus-testing
     '''
 
-    path_to_HDI = os.path.join('data', 'country_HDI.csv')
-    df_HDI = pd.read_csv(path_to_HDI, parse_dates=['Date'])
+    df_HDI = pd.read_csv(HDI_FILE, parse_dates=['Date'])
     if drop:
         df_HDI.dropna(inplace=True)
     df_HDI = df.merge(df_HDI, how='left', left_on=['CountryName', 'Date'], right_on=['CountryName', 'Date'])
@@ -94,20 +131,16 @@ def create_dataset(df, drop=False, npis=True):
     and fills any missing pis
     """
     # Adding RegionID column that combines CountryName and RegionName for easier manipulation of data
-    df['GeoID'] = df['CountryName'] + '__' + df['RegionName'].astype(str)
-    # Adding new cases column
+    df['GeoID'] = geo_id(df)
+    # Adding new cases column, the diff of missing values is set to 0 so there is nothing left to interpolate
     df['NewCases'] = df.groupby('GeoID').ConfirmedCases.diff().fillna(0)
 
     # Fill any missing case values by interpolation and setting NaNs to 0
-    df.update(df.groupby('GeoID').NewCases.apply(
-        lambda group: group.interpolate()).fillna(0))
-    df.update(df.groupby('GeoID').ConfirmedCases.apply(
-        lambda group: group.interpolate()).fillna(0))
+    df['ConfirmedCases'] = groupby_interpolate(df, 'ConfirmedCases').fillna(0)
 
     # Fill any missing NPIs by assuming they are the same as previous day
     if npis:
-        for npi_col in npi_cols:
-            df.update(df.groupby('GeoID')[npi_col].ffill().fillna(0))
+        df[npi_cols] = fill_missing_npis(df, 'GeoID', npi_cols)
 
     # adding moving average column
     df = mov_avg(df)
@@ -120,71 +153,138 @@ def create_dataset(df, drop=False, npis=True):
     return df
 
 
+def dataset_cache_name(input_file, drop=False, start_date=None, end_date=None, countries=None):
+    """
+    Name of the cached prepared dataset, made of the input file name, a digest of the preprocessing options
+    and a digest of the content of the input and additional data files.
+    Returns the prefix shared by all the versions of the dataset with these options, and the full name.
+    """
+    options = {'version': CACHE_VERSION,
+               'drop': bool(drop),
+               'moving_average_window': MA_WINDOW,
+               'start_date': str(start_date),
+               'end_date': str(end_date)}
+    if countries is not None:
+        options['countries'] = sorted(countries)
+    contents = {input_file: file_checksum(input_file)}
+    for path in [TEMPERATURE_FILE, POPULATION_FILE, HDI_FILE]:
+        contents[path] = file_checksum(path) if os.path.exists(path) else None
+    prefix = '{}-{}-'.format(os.path.basename(input_file), digest(options, length=16))
+    return prefix, prefix + digest(contents, length=16)
+
+
+def load_dataset(input_file, drop=False, start_date=None, end_date=None, cache_dir=CACHE_DIR, countries=None):
+    """
+    Reads the Oxford dataset in input_file and prepares it with create_dataset.
+    If start_date and end_date are given, only dates strictly between them are kept before the preparation.
+    If countries is given, only these countries are kept. The rows filtered out are dropped while the file is read.
+    The prepared dataset is saved in cache_dir (Feather if pyarrow is installed, pickle otherwise)
+    and reused as long as the input files and the options do not change. Pass cache_dir=None to disable the cache.
+    """
+    if cache_dir is not None:
+        prefix, name = dataset_cache_name(input_file, drop, start_date, end_date, countries)
+        cache_file = os.path.join(cache_dir, name)
+        df = load_frame(cache_file)
+        if df is not None:
+            return df
+
+    if start_date is not None and end_date is not None:
+        # Dates strictly between start_date and end_date
+        df = load_oxford_data(input_file, error_bad_lines=True, countries=countries,
+                              start_date=pd.to_datetime(start_date) + pd.Timedelta(days=1),
+                              end_date=pd.to_datetime(end_date) - pd.Timedelta(days=1))
+    else:
+        df = load_oxford_data(input_file, error_bad_lines=True, countries=countries)
+    df = create_dataset(df, drop=drop)
+    if countries is not None:
+        # add_population_data adds a row for each country of the population file
+        df = df[df.CountryName.isin(countries)]
+    df = df.reset_index(drop=True)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Remove the versions of this dataset made from older input files. The temporary files of the runs
+        # writing their version are left alone
+        for old_file in os.listdir(cache_dir):
+            if old_file.startswith(prefix) and not old_file.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(cache_dir, old_file))
+                except FileNotFoundError:
+                    pass
+        save_frame(df, cache_file)
+
+    return df
+
+
+def sliding_windows(data, steps):
+    """
+    Returns a VIEW on a 2d numpy array of shape (N_samples, Features) with shape
+    (N_samples - steps + 1, steps, Features), where window i holds the rows from i to i + steps - 1.
+    Same idea as data_to_timesteps, nothing is copied.
+    """
+    data = data.reshape(data.shape[0], -1)
+    nb_windows = max(data.shape[0] - steps + 1, 0)
+    if hasattr(np.lib.stride_tricks, 'sliding_window_view') and nb_windows:
+        return np.lib.stride_tricks.sliding_window_view(data, steps, axis=0).transpose(0, 2, 1)
+    # numpy < 1.20
+    stride0, stride1 = data.strides
+    return np.lib.stride_tricks.as_strided(data,
+                                           shape=(nb_windows, steps, data.shape[1]),
+                                           strides=(stride0, stride0, stride1),
+                                           writeable=False)
+
+
 def skl_format(df, moving_average=False, lookback_days=30, adj_cols_fixed=[], adj_cols_time=[],keep_df_index=False):
     """
-    Takes data and makes a formatting for sklearn
+    Takes data and makes a formatting for sklearn.
+    Columns are: cases for lookback_days, adj_cols_fixed on the day before the prediction,
+    adj_cols_time and npis for lookback_days, and the df index of the predicted day if keep_df_index.
     """
     # Create training data across all countries for predicting one day ahead
     COL = cases_col if not moving_average else ['MA']
-    X_cols = COL + npi_cols + adj_cols_fixed + adj_cols_time + npi_cols
-    y_col = COL
-
-    X_samples = []
-    y_samples = []
-    geo_ids = df.GeoID.unique()
-    for g in geo_ids:
-        gdf = df[df.GeoID == g]
-
-        all_case_data = np.array(gdf[COL])
-        all_npi_data = np.array(gdf[npi_cols])
-
-        # WARNING: If you want to use additional columns remember to add them in the dataset
-        # using the appropriate functions!!!
-        if adj_cols_fixed:
-            all_adj_fixed_data = np.array(gdf[adj_cols_fixed])
-
-        if adj_cols_time:
-            all_adj_time_data = np.array(gdf[adj_cols_time])
-
-        # Create one sample for each day where we have enough data
-        # Each sample consists of cases and npis for previous lookback_days
-        nb_total_days = len(gdf)
-        for d in range(lookback_days, nb_total_days - 1):
-            X_cases = all_case_data[d - lookback_days:d]
-
-            # Take negative of npis to support positive weight constraint in Lasso.
-            # NOTE: THIS WAS NEGATIVE AND IN TEST WAS POSITIVE #################
-            X_npis = all_npi_data[d - lookback_days:d]
-            ####################################################################
-
-            # I create them empty anyway so that I don't have to add conditions later
-            X_adj_fixed = np.array([])
-            X_adj_time = np.array([])
-
-            # Take only 1 value per country for fixed feature
-            if adj_cols_fixed:
-                X_adj_fixed = all_adj_fixed_data[d - 1]
-
-            if adj_cols_time:
-                X_adj_time = all_adj_time_data[d - lookback_days:d]
-
-            # Flatten all input data so it fits scikit input format.
-            if keep_df_index:
-                X_sample = np.concatenate([X_cases.flatten(),
-                                           X_adj_fixed.flatten(),
-                                           X_adj_time.flatten(),
-                                           X_npis.flatten(),np.array([gdf.index[d]])])
-            else:
-                X_sample = np.concatenate([X_cases.flatten(),
-                                           X_adj_fixed.flatten(),
-                                           X_adj_time.flatten(),
-                                           X_npis.flatten()])
-
-            y_sample = all_case_data[d]
-            X_samples.append(X_sample)
-            y_samples.append(y_sample)
-
-    X_samples = np.array(X_samples)
-    y_samples = np.array(y_samples).flatten()
+
+    # WARNING: If you want to use additional columns remember to add them in the dataset
+    # using the appropriate functions!!!
+    store = GeoSeriesStore(df)
+
+    # Create one sample for each day where we have enough data, i.e. for days
+    # lookback_days to nb_total_days - 2 of each geo
+    nb_geo_samples = np.maximum(np.diff(store.offsets) - lookback_days - 1, 0)
+    nb_samples = nb_geo_samples.sum()
+    # First row of the lookback window of each sample, in the sorted rows of the store
+    first_samples = np.cumsum(nb_geo_samples) - nb_geo_samples
+    window_starts = (np.repeat(store.offsets[:-1] - first_samples, nb_geo_samples) +
+                     np.arange(nb_samples))
+    days = window_starts + lookback_days
+
+    nb_columns = (lookback_days * (len(COL) + len(adj_cols_time) + len(npi_cols)) +
+                  len(adj_cols_fixed) + (1 if keep_df_index else 0))
+    X_samples = np.empty((nb_samples, nb_columns))
+
+    def write_windows(first_column, columns):
+        # Each sample consists of columns for the previous lookback_days, copied straight from the windows view
+        data = store.block(columns).astype(np.float64, copy=False)
+        width = lookback_days * len(columns)
+        out = X_samples[:, first_column:first_column + width].reshape(nb_samples, lookback_days, len(columns))
+        np.take(sliding_windows(data, lookback_days), window_starts, axis=0, out=out, mode='clip')
+        return first_column + width
+
+    column = write_windows(0, COL)
+
+    # Take only 1 value per country for fixed feature
+    if adj_cols_fixed:
+        data = store.block(adj_cols_fixed).astype(np.float64, copy=False)
+        X_samples[:, column:column + len(adj_cols_fixed)] = data[days - 1]
+        column += len(adj_cols_fixed)
+
+    if adj_cols_time:
+        column = write_windows(column, adj_cols_time)
+
+    column = write_windows(column, npi_cols)
+
+    if keep_df_index:
+        X_samples[:, column] = store.df.index.values[days]
+
+    y_samples = store.block(COL)[days].astype(np.float64).flatten()
 
     return X_samples, y_samples